@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_tracking',
     'corsheaders',
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -153,12 +155,26 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.BatchAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'read': config('THROTTLE_RATE_READ', default='600/min'),
+        'write': config('THROTTLE_RATE_WRITE', default='120/min'),
+        'search': config('THROTTLE_RATE_SEARCH', default='60/min'),
+        'export': config('THROTTLE_RATE_EXPORT', default='10/hour'),
+    },
 }
 
+# Agregação dos limites entre workers (alias de CACHES; vazio = apenas em memória)
+THROTTLE_CACHE_ALIAS = config('THROTTLE_CACHE_ALIAS', default='')
+THROTTLE_CACHE_SYNC_INTERVAL = config('THROTTLE_CACHE_SYNC_INTERVAL', default=1.0, cast=float)
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
@@ -183,6 +199,60 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Retenção dos logs de requisições (manage.py rollup_api_logs)
+API_LOG_RETENTION_DAYS = config('API_LOG_RETENTION_DAYS', default=7, cast=int)
+API_LOG_ROLLUP_RETENTION_DAYS = config('API_LOG_ROLLUP_RETENTION_DAYS', default=365, cast=int)
+API_LOG_DELETE_BATCH_SIZE = config('API_LOG_DELETE_BATCH_SIZE', default=5000, cast=int)
+
+# Fila de tarefas em segundo plano (manage.py run_jobs)
+JOBS_WORKERS = config('JOBS_WORKERS', default=2, cast=int)
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', default=1.0, cast=float)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=3, cast=int)
+# Reserva renovada pelo worker durante a execução; expirada, a tarefa volta à fila.
+JOBS_LEASE_SECONDS = config('JOBS_LEASE_SECONDS', default=60, cast=int)
+JOBS_EXPORT_DIR = os.path.join(MEDIA_ROOT, 'exports')
+
+# Feed de alterações (/api/veiculo/changes/): alterações mais recentes que
+# esta margem ainda podem estar em transações abertas e ficam de fora.
+CHANGES_SAFETY_LAG_SECONDS = config('CHANGES_SAFETY_LAG_SECONDS', default=5.0, cast=float)
+
+# Server-sent events (/api/events/, servido apenas via ASGI)
+EVENTS_HEARTBEAT_SECONDS = config('EVENTS_HEARTBEAT_SECONDS', default=15, cast=int)
+EVENTS_QUEUE_SIZE = config('EVENTS_QUEUE_SIZE', default=100, cast=int)
+
+# Requisições em lote (/api/batch/)
+BATCH_MAX_REQUESTS = config('BATCH_MAX_REQUESTS', default=20, cast=int)
+BATCH_MAX_WORKERS = config('BATCH_MAX_WORKERS', default=4, cast=int)
+
+# Profiling amostral das requisições (core.profiling)
+# Limite em ms para perfilar automaticamente; 0 desativa.
+PROFILER_THRESHOLD_MS = config('PROFILER_THRESHOLD_MS', default=0, cast=int)
+# Valor do cabeçalho X-Profile-Token que força o profiling; vazio desativa.
+PROFILER_TOKEN = config('PROFILER_TOKEN', default='')
+PROFILER_PATHS = config('PROFILER_PATHS', default='/api/', cast=Csv())
+# Fração das requisições amostradas para o limite de latência (0 a 1).
+PROFILER_SAMPLE_RATE = config('PROFILER_SAMPLE_RATE', default=0.1, cast=float)
+PROFILER_INTERVAL_MS = config('PROFILER_INTERVAL_MS', default=5.0, cast=float)
+PROFILER_MAX_QUERIES = config('PROFILER_MAX_QUERIES', default=500, cast=int)
+# Perfis gravados por minuto em cada processo; os excedentes são descartados.
+PROFILER_MAX_PER_MINUTE = config('PROFILER_MAX_PER_MINUTE', default=30, cast=int)
+# Dias de retenção usados por prune_request_profiles.
+PROFILER_RETENTION_DAYS = config('PROFILER_RETENTION_DAYS', default=7, cast=int)
+
+# Autocompletar nomes de veículos (/api/veiculo/autocomplete/)
+AUTOCOMPLETE_CACHE_SECONDS = config('AUTOCOMPLETE_CACHE_SECONDS', default=60, cast=int)
+AUTOCOMPLETE_CACHE_MAX_NAMES = config('AUTOCOMPLETE_CACHE_MAX_NAMES', default=50000, cast=int)
+
+# Admin: abaixo desta estimativa de linhas a paginação usa COUNT(*) exato
+ADMIN_EXACT_COUNT_LIMIT = config('ADMIN_EXACT_COUNT_LIMIT', default=10000, cast=int)
+
+# Snapshot colunar do inventário na listagem de veículos (core.snapshot, requer NumPy)
+INVENTORY_SNAPSHOT_ENABLED = config('INVENTORY_SNAPSHOT_ENABLED', default=False, cast=bool)
+INVENTORY_SNAPSHOT_REFRESH_SECONDS = config('INVENTORY_SNAPSHOT_REFRESH_SECONDS', default=1.0, cast=float)
+# Janela relida a cada atualização, para transações confirmadas fora de ordem.
+INVENTORY_SNAPSHOT_OVERLAP_SECONDS = config('INVENTORY_SNAPSHOT_OVERLAP_SECONDS', default=5.0, cast=float)
+INVENTORY_SNAPSHOT_RELOAD_SECONDS = config('INVENTORY_SNAPSHOT_RELOAD_SECONDS', default=600, cast=int)
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWED_ORIGINS = [ 'http://localhost:8080', ]
@@ -217,12 +287,17 @@ LOGGING = {
         "require_debug_true": {
             "()": "django.utils.log.RequireDebugTrue",
         },
+        # O token JWT de /api/events/ pode vir na URL.
+        "redact_token": {
+            "()": "core.log_filters.RedactQueryTokenFilter",
+        },
     },
     "handlers": {
         "console": {
             "level": "DEBUG",
             "class": "logging.StreamHandler",
             "formatter": "verbose",
+            "filters": ["redact_token"],
         },
     },
     "loggers": {
@@ -236,5 +311,10 @@ LOGGING = {
             "level": "DEBUG",
             "propagate": False,
         },
+        "uvicorn.access": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
\ No newline at end of file
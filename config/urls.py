@@ -19,6 +19,8 @@ from core import views
 router =  routers.DefaultRouter()
 router.register(r'veiculo', views.VeiculoViewSet, basename='veiculo')
 router.register(r'marca', views.MarcaViewSet, basename='marca')
+router.register(r'job', views.JobViewSet, basename='job')
+router.register(r'profile', views.RequestProfileViewSet, basename='profile')
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -39,6 +41,7 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/user-info/', UserInfoView.as_view(), name='user-info'),
+    path('api/batch/', views.BatchView.as_view(), name='batch'),
     path('api/', include(router.urls)),
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
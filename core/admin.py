@@ -1 +1,111 @@
-from django.contrib import admin
\ No newline at end of file
+"""
+Administração de marcas e veículos, preparada para tabelas grandes.
+"""
+import json
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Marca, Veiculo
+
+
+def estimate_count(queryset):
+    """Retorna a quantidade de linhas estimada pelo planejador para o queryset."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plano = cursor.fetchone()[0]
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return plano[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginador que usa a estimativa do PostgreSQL em vez de ``COUNT(*)``.
+
+    Quando a estimativa fica abaixo de ``ADMIN_EXACT_COUNT_LIMIT`` a contagem
+    exata é barata e é usada no lugar dela.
+    """
+
+    @cached_property
+    def count(self):
+        estimativa = estimate_count(self.object_list)
+        if estimativa < settings.ADMIN_EXACT_COUNT_LIMIT:
+            return super().count
+        return estimativa
+
+
+class DecadaFilter(admin.SimpleListFilter):
+    """Filtra veículos pela década de fabricação, usando o índice de ``ano``."""
+    title = 'década'
+    parameter_name = 'decada'
+
+    def lookups(self, request, model_admin):
+        atual = timezone.now().year // 10 * 10
+        return [(str(decada), f'{decada}s') for decada in range(atual, 1890, -10)]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        try:
+            decada = int(self.value())
+        except ValueError:
+            return queryset.none()
+        return queryset.filter(ano__gte=decada, ano__lt=decada + 10)
+
+
+@admin.register(Marca)
+class MarcaAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'ativo', 'created']
+    list_filter = ['ativo']
+    search_fields = ['nome']
+    ordering = ['nome']
+    readonly_fields = ['created', 'updated']
+
+
+@admin.register(Veiculo)
+class VeiculoAdmin(admin.ModelAdmin):
+    # marca_nome é desnormalizado: a listagem não faz join nem consulta por linha.
+    list_display = ['veiculo', 'marca_nome', 'ano', 'cor', 'vendido', 'excluido', 'updated']
+    list_filter = ['vendido', 'excluido', DecadaFilter, 'marca']
+    # Prefixo de veiculo (índice UPPER text_pattern_ops) e nome exato da marca (índice).
+    search_fields = ['^veiculo', '=marca_nome']
+    search_help_text = "Início do nome do veículo ou nome exato da marca."
+    ordering = ['-id']
+    autocomplete_fields = ['marca']
+    readonly_fields = ['marca_nome', 'created', 'updated']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['marcar_vendidos', 'marcar_nao_vendidos', 'excluir_selecionados', 'restaurar_selecionados']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # A exclusão padrão carrega e apaga cada objeto; usamos a exclusão lógica.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def _atualizar(self, request, queryset, mensagem, **campos):
+        # update() não chama save(): updated é atualizado aqui para o feed de alterações.
+        total = queryset.update(updated=timezone.now(), **campos)
+        self.message_user(request, mensagem.format(total=total), messages.SUCCESS)
+
+    @admin.action(description="Marcar selecionados como vendidos", permissions=['change'])
+    def marcar_vendidos(self, request, queryset):
+        self._atualizar(request, queryset, "{total} veículos marcados como vendidos.", vendido=True)
+
+    @admin.action(description="Marcar selecionados como não vendidos", permissions=['change'])
+    def marcar_nao_vendidos(self, request, queryset):
+        self._atualizar(request, queryset, "{total} veículos marcados como não vendidos.", vendido=False)
+
+    @admin.action(description="Excluir selecionados (exclusão lógica)", permissions=['delete'])
+    def excluir_selecionados(self, request, queryset):
+        self._atualizar(request, queryset, "{total} veículos excluídos.", excluido=True)
+
+    @admin.action(description="Restaurar selecionados", permissions=['change'])
+    def restaurar_selecionados(self, request, queryset):
+        self._atualizar(request, queryset, "{total} veículos restaurados.", excluido=False)
@@ -0,0 +1,18 @@
+"""
+Autenticação das sub-requisições de ``/api/batch/``.
+"""
+from rest_framework.authentication import BaseAuthentication
+
+
+class BatchAuthentication(BaseAuthentication):
+    """
+    Autentica a sub-requisição de um lote com o usuário do próprio lote.
+
+    ``core.batch`` anota a requisição Django de cada item com ``batch_auth``,
+    a tupla ``(user, auth)`` já autenticada no lote. Requisições vindas do
+    cliente nunca têm esse atributo, então para elas o autenticador não se
+    aplica.
+    """
+
+    def authenticate(self, request):
+        return getattr(request._request, 'batch_auth', None)
@@ -0,0 +1,125 @@
+"""
+Autocompletar nomes de modelos de veículos por prefixo.
+
+Os nomes distintos, com a quantidade de veículos por marca, ficam em memória
+por ``AUTOCOMPLETE_CACHE_SECONDS`` em uma lista ordenada, consultada por
+busca binária. Vencido o prazo, uma única requisição recarrega a lista
+enquanto as demais continuam usando a anterior. Se houver mais de ``AUTOCOMPLETE_CACHE_MAX_NAMES`` nomes, a
+consulta vai ao banco, usando o índice ``core_veiculo_nome_prefix_idx``.
+"""
+import bisect
+import heapq
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+from .models import Veiculo
+
+MAX_RESULTADOS = 10000
+
+
+def query_completions(prefixo, marca=None, limit=10):
+    """Consulta os nomes que começam com ``prefixo`` diretamente no banco."""
+    veiculos = Veiculo.objects.filter(excluido=False).annotate(
+        nome_upper=Upper('veiculo')
+    ).filter(nome_upper__startswith=prefixo.upper())
+    if marca is not None:
+        veiculos = veiculos.filter(marca_id=marca)
+
+    completions = (
+        veiculos.values('veiculo')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'veiculo')[:limit]
+    )
+    return list(completions)
+
+
+class ModelNameIndex:
+    """Cache em memória dos nomes distintos de veículos."""
+
+    def __init__(self):
+        self._cache = None
+        self._expira = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._cache = None
+            self._expira = 0
+
+    def _carregar(self):
+        agrupados = (
+            Veiculo.objects.filter(excluido=False)
+            .values_list('veiculo', 'marca_id')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        limite = settings.AUTOCOMPLETE_CACHE_MAX_NAMES
+        linhas = list(agrupados[:limite + 1])
+        if len(linhas) > limite:
+            return None
+        return sorted((nome.upper(), nome, marca, total) for nome, marca, total in linhas)
+
+    def entradas(self):
+        """
+        Retorna a lista ordenada ``(NOME, nome, marca, total)``, suas chaves e
+        o dicionário de resultados já calculados, ou ``None`` se os nomes não
+        couberem no cache.
+        """
+        if time.monotonic() < self._expira:
+            return self._cache
+
+        # Só espera pelo lock na primeira carga; depois, enquanto uma thread
+        # recarrega, as demais usam o cache vencido.
+        if not self._lock.acquire(blocking=self._expira == 0):
+            return self._cache
+        try:
+            if time.monotonic() >= self._expira:
+                entradas = self._carregar()
+                if entradas is None:
+                    self._cache = None
+                else:
+                    self._cache = (entradas, [entrada[0] for entrada in entradas], {})
+                self._expira = time.monotonic() + settings.AUTOCOMPLETE_CACHE_SECONDS
+            return self._cache
+        finally:
+            self._lock.release()
+
+    def complete(self, prefixo, marca=None, limit=10):
+        """
+        Retorna até ``limit`` nomes que começam com ``prefixo`` (sem distinção
+        de maiúsculas), com a quantidade de veículos, do mais comum ao menos.
+        """
+        cache = self.entradas()
+        if cache is None:
+            return query_completions(prefixo, marca, limit)
+
+        entradas, chaves, resultados = cache
+        prefixo = prefixo.upper()
+        chave_resultado = (prefixo, marca, limit)
+        if chave_resultado in resultados:
+            return resultados[chave_resultado]
+
+        contagens = Counter()
+        for posicao in range(bisect.bisect_left(chaves, prefixo), len(entradas)):
+            chave, nome, marca_id, total = entradas[posicao]
+            if not chave.startswith(prefixo):
+                break
+            if marca is None or marca_id == marca:
+                contagens[nome] += total
+
+        melhores = heapq.nsmallest(limit, contagens.items(), key=lambda item: (-item[1], item[0]))
+        completions = [{'veiculo': nome, 'count': total} for nome, total in melhores]
+
+        # Prefixos curtos percorrem muitos nomes; o resultado vale até o cache expirar.
+        if len(resultados) >= MAX_RESULTADOS:
+            resultados.clear()
+        resultados[chave_resultado] = completions
+        return completions
+
+
+indice = ModelNameIndex()
@@ -0,0 +1,188 @@
+"""
+Execução de várias requisições da API em uma única chamada a ``/api/batch/``.
+
+Cada sub-requisição é resolvida pelas URLs do projeto e despachada
+diretamente para a view correspondente, sem passar novamente pelos
+middlewares: a sub-requisição usa a mesma classe da requisição do lote
+(WSGI ou ASGI) e o usuário já autenticado no lote é repassado às views por
+``core.authentication.BatchAuthentication``. Leituras consecutivas são executadas em
+paralelo; escritas são executadas uma a uma, na ordem enviada, e servem de
+barreira entre os grupos de leituras.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework_tracking.mixins import LoggingMixin
+from rest_framework_tracking.models import APIRequestLog
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class BatchLoggingMixin(LoggingMixin):
+    """
+    LoggingMixin que, dentro de um lote, acumula os registros para gravá-los
+    com um único ``bulk_create`` ao final.
+    """
+
+    def handle_log(self):
+        batch_logs = getattr(self.request._request, 'batch_logs', None)
+        if batch_logs is None:
+            super().handle_log()
+        else:
+            batch_logs.append(APIRequestLog(**self.log))
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BATCH_MAX_WORKERS, thread_name_prefix='batch'
+            )
+    return _executor
+
+
+def build_request(request, item, batch_logs):
+    """
+    Cria a requisição Django de um item do lote a partir da requisição original.
+
+    Sob ASGI o escopo original é copiado, preservando esquema, host e
+    ``root_path`` nos links absolutos gerados pelas views. O cabeçalho
+    ``Authorization`` não é repassado: o usuário vem de ``batch_auth``.
+    """
+    url = urlsplit(item['url'])
+    body = b''
+    if item.get('body') is not None:
+        body = JSONRenderer().render(item['body'])
+
+    outer = request._request
+    if isinstance(outer, ASGIRequest):
+        headers = [
+            (name, value) for name, value in outer.scope.get('headers', [])
+            if name not in (b'content-type', b'content-length', b'authorization')
+        ]
+        headers += [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]
+        scope = {
+            **outer.scope,
+            'method': item['method'],
+            'path': outer.scope.get('root_path', '') + url.path,
+            'query_string': url.query.encode(),
+            'headers': headers,
+        }
+        sub_request = ASGIRequest(scope, io.BytesIO(body))
+    else:
+        environ = {
+            key: value for key, value in outer.META.items()
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_AUTHORIZATION', 'wsgi.input')
+        }
+        environ.update({
+            'REQUEST_METHOD': item['method'],
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        })
+        sub_request = WSGIRequest(environ)
+
+    sub_request.batch_auth = (request.user, request.auth)
+    sub_request.batch_logs = batch_logs
+    return sub_request
+
+
+def execute(request, item, batch_logs):
+    """Executa um item do lote e retorna ``{'status', 'headers', 'body'}``."""
+    try:
+        match = resolve(urlsplit(item['url']).path)
+    except Resolver404:
+        return {'status': 404, 'headers': {}, 'body': {'detail': "URL não encontrada."}}
+
+    if match.url_name == 'batch':
+        return {'status': 400, 'headers': {}, 'body': {'detail': "Lotes não podem ser aninhados."}}
+
+    sub_request = build_request(request, item, batch_logs)
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception("Erro ao executar %s %s no lote", item['method'], item['url'])
+        return {'status': 500, 'headers': {}, 'body': {'detail': "Erro interno do servidor."}}
+
+    if response.streaming:
+        return {
+            'status': 406,
+            'headers': {},
+            'body': {'detail': "Respostas em streaming não podem ser incluídas em um lote."},
+        }
+
+    headers = {
+        name: value for name, value in response.items()
+        if name not in ('Content-Type', 'Content-Length', 'Vary', 'Allow')
+    }
+    if hasattr(response, 'data'):
+        body = response.data
+    else:
+        body = response.content.decode(response.charset, errors='replace')
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def _execute_in_thread(request, item, batch_logs):
+    close_old_connections()
+    try:
+        return execute(request, item, batch_logs)
+    finally:
+        close_old_connections()
+
+
+def run_batch(request, items):
+    """
+    Executa os itens do lote e retorna as respostas na mesma ordem.
+
+    Grupos de GETs consecutivos rodam em paralelo (até ``BATCH_MAX_WORKERS``
+    threads, cada uma com sua conexão ao banco). Os registros do
+    LoggingMixin são gravados juntos ao final.
+    """
+    batch_logs = []
+    responses = []
+    grupo = []
+
+    def executar_grupo():
+        if len(grupo) > 1 and settings.BATCH_MAX_WORKERS > 1:
+            futures = [
+                get_executor().submit(_execute_in_thread, request, item, batch_logs)
+                for item in grupo
+            ]
+            responses.extend(future.result() for future in futures)
+        else:
+            responses.extend(execute(request, item, batch_logs) for item in grupo)
+        grupo.clear()
+
+    for item in items:
+        if item['method'] == 'GET':
+            grupo.append(item)
+            continue
+        executar_grupo()
+        responses.append(execute(request, item, batch_logs))
+    executar_grupo()
+
+    if batch_logs:
+        try:
+            APIRequestLog.objects.bulk_create(batch_logs)
+        except Exception:
+            logger.exception("Falha ao gravar os logs do lote")
+
+    return responses
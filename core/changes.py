@@ -0,0 +1,84 @@
+"""
+Feed incremental de alterações de veículos.
+
+Os clientes de sincronização consomem as alterações em ordem de
+``(updated, id)`` e retomam a leitura a partir de um cursor opaco,
+recebendo também os veículos excluídos logicamente.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Veiculo
+
+
+def encode_cursor(updated, pk):
+    """Codifica a posição ``(updated, id)`` em um cursor opaco."""
+    raw = f"{updated.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica um cursor gerado por ``encode_cursor``.
+
+    Lança ``ValueError`` se o cursor estiver malformado.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        updated, pk = raw.split('|')
+        updated = datetime.fromisoformat(updated)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+
+    if updated.tzinfo is None:
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+
+    return updated, pk
+
+
+def changes_since(cursor=None, limit=100, queryset=None, lag=None):
+    """
+    Retorna os veículos alterados após o cursor, incluindo os excluídos.
+
+    Devolve a tupla ``(veiculos, next_cursor, has_more)``. Quando não há
+    alterações, ``next_cursor`` é o próprio cursor recebido, de modo que o
+    cliente pode repeti-lo na próxima sincronização.
+
+    ``updated`` é preenchido antes do commit: uma transação ainda aberta
+    teria a alteração pulada por um cursor que já avançou além dela. Por
+    isso ficam de fora as alterações mais recentes que ``lag`` segundos
+    (padrão ``CHANGES_SAFETY_LAG_SECONDS``), que deve superar a duração
+    das transações de escrita. Com ``lag=0`` cabe ao chamador reler uma
+    janela e descartar as repetições.
+    """
+    if queryset is None:
+        queryset = Veiculo.objects.all()
+
+    if lag is None:
+        lag = settings.CHANGES_SAFETY_LAG_SECONDS
+    if lag:
+        queryset = queryset.filter(updated__lte=timezone.now() - timedelta(seconds=lag))
+
+    if cursor:
+        updated, pk = decode_cursor(cursor)
+        # A condição ``updated >= x`` delimita a varredura no índice
+        # ``(updated, id)``; o desempate por ``id`` é aplicado sobre ela.
+        queryset = queryset.filter(
+            Q(updated__gte=updated),
+            Q(updated__gt=updated) | Q(id__gt=pk),
+        )
+
+    veiculos = list(queryset.order_by('updated', 'id')[:limit + 1])
+    has_more = len(veiculos) > limit
+    veiculos = veiculos[:limit]
+
+    if veiculos:
+        ultimo = veiculos[-1]
+        cursor = encode_cursor(ultimo.updated, ultimo.id)
+
+    return veiculos, cursor, has_more
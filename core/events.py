@@ -0,0 +1,414 @@
+"""
+Canal de eventos (Server-Sent Events) com as alterações de Veiculo e Marca.
+
+Os triggers criados na migração ``0004_change_notify_triggers`` publicam as
+alterações de cada comando no canal ``core_changes`` do PostgreSQL, em lotes
+de linhas; comandos com muitas linhas são publicados apenas com a contagem e
+levam os clientes do modelo a ressincronizar. Cada processo mantém uma única
+conexão em ``LISTEN`` e distribui os eventos, um por linha, para as
+assinaturas abertas, respeitando os filtros de cada cliente.
+"""
+import asyncio
+import json
+import logging
+import re
+import select
+import threading
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from corsheaders.conf import conf as cors_conf
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .changes import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'core_changes'
+MODELS = ('veiculo', 'marca')
+# Mesma permissão de leitura exigida pelas tarefas sobre cada modelo.
+PERMISSOES = {'veiculo': 'core.view_veiculo', 'marca': 'core.view_marca'}
+
+RESET = {'model': None, 'op': 'reset'}
+
+
+class Subscription:
+    """
+    Assinatura de um cliente com seus filtros e sua fila de eventos.
+
+    A fila é limitada: um cliente lento que a deixa encher é marcado como
+    ``overflowed`` e deve ser desconectado para ressincronizar.
+    """
+
+    def __init__(self, loop, model=None, marcas=None, vendido=None, maxsize=100):
+        self.loop = loop
+        self.model = model
+        self.marcas = marcas
+        self.vendido = vendido
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def matches(self, event):
+        """Indica se o evento atende aos filtros da assinatura."""
+        if event.get('op') == 'reset':
+            return event['model'] is None or self.model in (None, event['model'])
+
+        if self.model and event['model'] != self.model:
+            return False
+
+        if self.marcas is not None:
+            marca = event['marca'] if event['model'] == 'veiculo' else event['id']
+            if marca not in self.marcas:
+                return False
+
+        if self.vendido is not None:
+            if event['model'] != 'veiculo' or event['vendido'] != self.vendido:
+                return False
+
+        return True
+
+    def offer(self, events):
+        """Enfileira os eventos; executado no loop da assinatura."""
+        for event in events:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.overflowed = True
+                return
+
+
+class ChangeBroadcaster:
+    """
+    Distribui as notificações do PostgreSQL para as assinaturas do processo.
+
+    A conexão em ``LISTEN`` roda em uma thread própria, iniciada na primeira
+    assinatura. Se a conexão cair, todas as assinaturas recebem um evento
+    ``reset`` para ressincronizar pelo feed de alterações.
+    """
+
+    def __init__(self, channel=CHANNEL, using='default'):
+        self.channel = channel
+        self.using = using
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._listening = threading.Event()
+
+    def subscribe(self, **filtros):
+        """Cria uma assinatura no loop de eventos atual."""
+        filtros.setdefault('maxsize', settings.EVENTS_QUEUE_SIZE)
+        subscription = Subscription(asyncio.get_running_loop(), **filtros)
+
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._listening.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='core-events', daemon=True
+                )
+                self._thread.start()
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def wait_listening(self, timeout=None):
+        """Aguarda a conexão em ``LISTEN`` estar ativa."""
+        return self._listening.wait(timeout)
+
+    def stop(self, timeout=None):
+        """Encerra a thread de escuta e fecha a conexão."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def dispatch(self, *events):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+
+        for subscription in subscriptions:
+            # Um único agendamento por assinatura para todo o lote.
+            selecionados = [event for event in events if subscription.matches(event)]
+            if not selecionados:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, selecionados)
+            except RuntimeError:
+                # O loop da assinatura já foi encerrado.
+                self.unsubscribe(subscription)
+
+    def publish(self, notification):
+        """Distribui uma notificação dos triggers como eventos por linha."""
+        model, op = notification['model'], notification['op']
+        if 'rows' not in notification:
+            # Comando grande demais para ser listado: os clientes do modelo
+            # ressincronizam pelo feed de alterações.
+            self.dispatch({'model': model, 'op': 'reset'})
+            return
+        self.dispatch(*({'model': model, 'op': op, **row} for row in notification['rows']))
+
+    def _connect(self):
+        params = connections[self.using].get_connection_params()
+        conn = psycopg2.connect(**params)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _run(self):
+        conn = None
+        while not self._stopping.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    self._listening.set()
+
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        notification = json.loads(notify.payload)
+                    except ValueError:
+                        logger.warning("Notificação inválida em %s: %r", self.channel, notify.payload)
+                        continue
+                    self.publish(notification)
+            except (psycopg2.Error, OSError):
+                logger.exception("Conexão LISTEN perdida; reconectando")
+                self._listening.clear()
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                self.dispatch(RESET)
+                self._stopping.wait(1.0)
+
+        self._listening.clear()
+        if conn is not None:
+            conn.close()
+
+
+broadcaster = ChangeBroadcaster()
+
+
+def format_event(event):
+    """Formata o evento no protocolo text/event-stream."""
+    if event.get('op') == 'reset':
+        return b'event: reset\ndata: {}\n\n'
+
+    lines = []
+    if event['model'] == 'veiculo':
+        updated = datetime.fromisoformat(event['updated'])
+        lines.append(f"id: {encode_cursor(updated, event['id'])}")
+    lines.append(f"event: {event['model']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def parse_filters(query_string):
+    """
+    Converte os parâmetros ``model``, ``marca`` e ``vendido`` da URL.
+
+    Lança ``ValueError`` se algum valor for inválido.
+    """
+    params = parse_qs(query_string)
+    filtros = {}
+
+    if 'model' in params:
+        model = params['model'][0]
+        if model not in MODELS:
+            raise ValueError(f"model deve ser um de: {', '.join(MODELS)}")
+        filtros['model'] = model
+
+    if 'marca' in params:
+        try:
+            filtros['marcas'] = {
+                int(marca) for valor in params['marca'] for marca in valor.split(',') if marca
+            }
+        except ValueError:
+            raise ValueError("marca deve ser uma lista de ids separados por vírgula")
+
+    if 'vendido' in params:
+        vendido = params['vendido'][0].lower()
+        if vendido not in ('true', 'false'):
+            raise ValueError("vendido deve ser true ou false")
+        filtros['vendido'] = vendido == 'true'
+
+    return filtros
+
+
+def _get_raw_token(scope, params):
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.split()
+            if len(parts) == 2 and parts[0] == b'Bearer':
+                return parts[1]
+            return None
+    # EventSource não permite cabeçalhos, então o token pode vir na URL.
+    token = params.get('token')
+    return token[0].encode() if token else None
+
+
+@sync_to_async
+def _authenticate(raw_token):
+    authentication = JWTAuthentication()
+    validated = authentication.get_validated_token(raw_token)
+    return authentication.get_user(validated)
+
+
+@sync_to_async
+def _permitted_models(user):
+    return [model for model in MODELS if user.has_perm(PERMISSOES[model])]
+
+
+def cors_headers(scope):
+    """
+    Cabeçalhos CORS para a origem da requisição, com as mesmas configurações
+    do ``corsheaders``, cujo middleware não é executado neste endpoint.
+    """
+    origin = dict(scope.get('headers', [])).get(b'origin')
+    if origin is None:
+        return []
+    origin = origin.decode('latin-1')
+
+    permitida = (
+        cors_conf.CORS_ALLOW_ALL_ORIGINS
+        or origin in cors_conf.CORS_ALLOWED_ORIGINS
+        or any(re.match(regex, origin) for regex in cors_conf.CORS_ALLOWED_ORIGIN_REGEXES)
+    )
+    if not permitida:
+        return []
+
+    headers = [(b'vary', b'origin')]
+    if cors_conf.CORS_ALLOW_ALL_ORIGINS and not cors_conf.CORS_ALLOW_CREDENTIALS:
+        headers.append((b'access-control-allow-origin', b'*'))
+    else:
+        headers.append((b'access-control-allow-origin', origin.encode('latin-1')))
+    if cors_conf.CORS_ALLOW_CREDENTIALS:
+        headers.append((b'access-control-allow-credentials', b'true'))
+    if scope['method'] == 'OPTIONS':
+        headers.extend([
+            (b'access-control-allow-headers', ', '.join(cors_conf.CORS_ALLOW_HEADERS).encode()),
+            (b'access-control-allow-methods', b'GET, OPTIONS'),
+            (b'access-control-max-age', str(cors_conf.CORS_PREFLIGHT_MAX_AGE).encode()),
+        ])
+    return headers
+
+
+async def _respond(send, status, message, headers=()):
+    body = json.dumps({'detail': message}).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _stream(subscription, send):
+    heartbeat = settings.EVENTS_HEARTBEAT_SECONDS
+    while True:
+        try:
+            event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+        except asyncio.TimeoutError:
+            await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+            continue
+
+        if subscription.overflowed:
+            # Cliente lento: encerra o stream para que ele ressincronize.
+            await send({'type': 'http.response.body', 'body': format_event(RESET), 'more_body': True})
+            return
+
+        await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+
+
+async def events_app(scope, receive, send):
+    """
+    Aplicação ASGI que transmite as alterações em ``/api/events/``.
+
+    Aceita o token JWT no cabeçalho ``Authorization`` ou em ``?token=`` e os
+    filtros ``?model=veiculo|marca``, ``?marca=1,2`` e ``?vendido=true|false``.
+    Cada modelo exige a permissão de leitura correspondente.
+    """
+    cors = cors_headers(scope)
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 200, 'headers': cors})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    if scope['method'] != 'GET':
+        await _respond(send, 405, "Método não permitido.", cors)
+        return
+
+    params = parse_qs(scope.get('query_string', b'').decode())
+    raw_token = _get_raw_token(scope, params)
+    if raw_token is None:
+        await _respond(send, 401, "As credenciais de autenticação não foram fornecidas.", cors)
+        return
+
+    try:
+        user = await _authenticate(raw_token)
+    except AuthenticationFailed as exc:
+        await _respond(send, 401, str(exc.detail), cors)
+        return
+
+    try:
+        filtros = parse_filters(scope.get('query_string', b'').decode())
+    except ValueError as exc:
+        await _respond(send, 400, str(exc), cors)
+        return
+
+    permitidos = await _permitted_models(user)
+    model = filtros.get('model')
+    if not permitidos or (model and model not in permitidos):
+        await _respond(send, 403, "Você não tem permissão para executar essa ação.", cors)
+        return
+    if model is None and len(permitidos) == 1:
+        # Sem filtro de modelo, recebe apenas os eventos que pode ler.
+        filtros['model'] = permitidos[0]
+
+    subscription = broadcaster.subscribe(**filtros)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                *cors,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+        stream = asyncio.ensure_future(_stream(subscription, send))
+        disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+        done, pending = await asyncio.wait(
+            {stream, disconnect}, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+
+        if stream in done:
+            stream.result()
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broadcaster.unsubscribe(subscription)
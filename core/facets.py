@@ -0,0 +1,91 @@
+"""
+Contagens por faceta para as listagens de veículos.
+
+Todas as facetas solicitadas são calculadas em uma única consulta com
+``GROUPING SETS`` sobre o queryset já filtrado.
+"""
+from django.db import connections
+from django.db.models import F
+
+FACETS = {
+    'marca': {'faceta_marca': F('marca_id'), 'faceta_marca_nome': F('marca_nome')},
+    'decada': {'faceta_decada': F('ano') / 10 * 10},
+    'vendido': {'faceta_vendido': F('vendido')},
+    'cor': {'faceta_cor': F('cor')},
+}
+
+
+def parse_facets(value):
+    """
+    Converte ``?facets=marca,decada`` na lista de facetas.
+
+    Lança ``ValueError`` se alguma faceta não for suportada.
+    """
+    nomes = []
+    for nome in value.split(','):
+        nome = nome.strip()
+        if not nome or nome in nomes:
+            continue
+        if nome not in FACETS:
+            raise ValueError(
+                f"Faceta inválida: {nome}. Disponíveis: {', '.join(FACETS)}"
+            )
+        nomes.append(nome)
+    return nomes
+
+
+def compute_facets(queryset, nomes):
+    """Retorna as contagens de cada faceta para o queryset informado."""
+    expressions = {}
+    for nome in nomes:
+        expressions.update(FACETS[nome])
+
+    inner = queryset.order_by().values(**expressions)
+    inner_sql, params = inner.query.sql_with_params()
+
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    grouping = [
+        f"GROUPING({quote(next(iter(FACETS[nome])))})" for nome in nomes
+    ]
+    columns = [quote(alias) for alias in expressions]
+    sets = [
+        '(' + ', '.join(quote(alias) for alias in FACETS[nome]) + ')'
+        for nome in nomes
+    ]
+    sql = (
+        f"SELECT {', '.join(grouping + columns)}, COUNT(*) "
+        f"FROM ({inner_sql}) AS facetas "
+        f"GROUP BY GROUPING SETS ({', '.join(sets)})"
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    aliases = list(expressions)
+    facets = {nome: [] for nome in nomes}
+    for row in rows:
+        flags, values, count = row[:len(nomes)], row[len(nomes):-1], row[-1]
+        nome = nomes[flags.index(0)]
+        valores = dict(zip(aliases, values))
+
+        if nome == 'marca':
+            item = {'value': valores['faceta_marca'], 'nome': valores['faceta_marca_nome']}
+        else:
+            item = {'value': valores[f'faceta_{nome}']}
+        item['count'] = count
+        facets[nome].append(item)
+
+    return sort_facets(facets)
+
+
+def sort_facets(facets):
+    """Ordena as décadas pelo valor e as demais facetas pela contagem."""
+    for nome, itens in facets.items():
+        if nome == 'decada':
+            itens.sort(key=lambda item: item['value'])
+        else:
+            itens.sort(key=lambda item: (-item['count'], str(item.get('nome', item['value']))))
+
+    return facets
@@ -0,0 +1,81 @@
+"""
+Filtros para a API de veículos.
+"""
+import django_filters
+from django.db.models.functions import Upper
+from rest_framework import filters
+
+from .models import Marca, Veiculo
+
+
+class AliasOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter que traduz campos de ordenação pelo ``ordering_aliases`` da view.
+
+    Permite manter nomes já usados pelos clientes (ex.: ``marca__nome``)
+    ordenando por outra coluna (ex.: ``marca_nome``).
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        aliases = getattr(view, 'ordering_aliases', {})
+        if not ordering or not aliases:
+            return ordering
+
+        traduzidos = []
+        for campo in ordering:
+            prefixo = '-' if campo.startswith('-') else ''
+            traduzidos.append(prefixo + aliases.get(campo.lstrip('-'), campo.lstrip('-')))
+        return traduzidos
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    pass
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class VeiculoFilter(django_filters.FilterSet):
+    """
+    Filtros da listagem de veículos e os índices que os atendem.
+
+    - ``?ano=``, ``?ano__gte=``, ``?ano__lte=`` e ``?decada=2010``: índice de ``ano``
+    - ``?marca__in=1,2``: índice ``(marca, ano)``, que também atende a marca combinada com ano
+    - ``?marca_nome__in=TOYOTA,HONDA``: índice de ``UPPER(marca_nome)``
+    - ``?cor__in=Preto,Prata``: sem índice; cada cor cobre boa parte da tabela
+    - ``?marca_ativa=true``: apenas marcas ativas, via subconsulta por ``marca_id``,
+      que usa o índice ``(marca, ano)`` quando o filtro é seletivo
+    - ``?created__gte=`` e ``?created__lt=``: índice de ``created``
+    """
+    decada = django_filters.NumberFilter(method='filter_decada')
+    marca__in = NumberInFilter(field_name='marca', lookup_expr='in')
+    marca_nome__in = CharInFilter(method='filter_marca_nome')
+    cor__in = CharInFilter(field_name='cor', lookup_expr='in')
+    marca_ativa = django_filters.BooleanFilter(method='filter_marca_ativa')
+
+    class Meta:
+        model = Veiculo
+        fields = {
+            'veiculo': ['exact'],
+            'vendido': ['exact'],
+            'excluido': ['exact'],
+            'created': ['gte', 'lt'],
+            'ano': ['exact', 'gte', 'lte'],
+        }
+
+    def filter_decada(self, queryset, name, value):
+        # Intervalo em vez de ano / 10 * 10, que não usaria o índice.
+        decada = int(value) // 10 * 10
+        return queryset.filter(ano__gte=decada, ano__lt=decada + 10)
+
+    def filter_marca_nome(self, queryset, name, value):
+        # UPPER dos dois lados: não depende de os nomes estarem gravados em maiúsculas.
+        return queryset.alias(marca_nome_upper=Upper('marca_nome')).filter(
+            marca_nome_upper__in=[nome.strip().upper() for nome in value]
+        )
+
+    def filter_marca_ativa(self, queryset, name, value):
+        marcas = Marca.objects.filter(ativo=value).values('id')
+        return queryset.filter(marca_id__in=marcas)
@@ -0,0 +1,230 @@
+"""
+Fila de tarefas em segundo plano armazenada no PostgreSQL.
+
+As tarefas são registradas com ``register`` e executadas pelo comando
+``manage.py run_jobs``. Cada worker reserva a próxima tarefa pendente com
+``SELECT ... FOR UPDATE SKIP LOCKED``, de modo que vários workers podem
+consumir a fila sem disputar as mesmas linhas. Durante a execução o worker
+renova a reserva da tarefa; se ele parar, a reserva expira e a tarefa volta
+à fila.
+"""
+import csv
+import logging
+import os
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Job, Veiculo
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def register(tipo, permissao=None):
+    """
+    Registra a função que executa as tarefas do ``tipo`` informado.
+
+    ``permissao`` é a permissão exigida do usuário que submete a tarefa.
+    """
+    def decorator(func):
+        func.permissao = permissao
+        HANDLERS[tipo] = func
+        return func
+    return decorator
+
+
+def claim():
+    """Reserva a próxima tarefa pendente ou retorna ``None`` se não houver."""
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.PENDENTE, executar_em__lte=timezone.now())
+            .order_by('executar_em', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = Job.EXECUTANDO
+        job.iniciado = timezone.now()
+        job.reservado_ate = job.iniciado + timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+        job.tentativas += 1
+        job.save(update_fields=['status', 'iniciado', 'reservado_ate', 'tentativas', 'updated'])
+    return job
+
+
+class Heartbeat:
+    """
+    Renova a reserva da tarefa em uma thread enquanto ela é executada.
+
+    A cada terço de ``JOBS_LEASE_SECONDS`` a reserva é estendida; se o worker
+    parar, ela expira e ``requeue_stale`` devolve a tarefa à fila. A
+    renovação só vale enquanto a reserva gravada for a do próprio worker; se
+    a tarefa já foi reservada por outro, a renovação é interrompida.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f'job-heartbeat-{job.id}', daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        lease = settings.JOBS_LEASE_SECONDS
+        try:
+            while not self._stop.wait(lease / 3):
+                reservado_ate = timezone.now() + timedelta(seconds=lease)
+                try:
+                    renovados = reserved(self.job).update(reservado_ate=reservado_ate)
+                except DatabaseError:
+                    logger.exception("Falha ao renovar a reserva do job %s", self.job.id)
+                    continue
+                if not renovados:
+                    logger.warning("Job %s perdeu a reserva durante a execução", self.job.id)
+                    return
+                self.job.reservado_ate = reservado_ate
+        finally:
+            connection.close()
+
+
+def reserved(job):
+    """Filtra a tarefa apenas enquanto ela continua reservada por este worker."""
+    return Job.objects.filter(pk=job.pk, status=Job.EXECUTANDO, reservado_ate=job.reservado_ate)
+
+
+def run(job):
+    """
+    Executa a tarefa reservada e registra o resultado ou a falha.
+
+    Se a reserva expirou e a tarefa voltou à fila ou foi reservada por outro
+    worker, o resultado é descartado para não sobrescrever a outra execução.
+    """
+    try:
+        with Heartbeat(job):
+            job.resultado = HANDLERS[job.tipo](job)
+        job.status = Job.CONCLUIDO
+        job.erro = ''
+    except Exception:
+        logger.exception("Falha ao executar o job %s (%s)", job.id, job.tipo)
+        job.erro = traceback.format_exc()
+        if job.tentativas < settings.JOBS_MAX_ATTEMPTS:
+            job.status = Job.PENDENTE
+            job.executar_em = timezone.now() + timedelta(seconds=30 * 2 ** job.tentativas)
+        else:
+            job.status = Job.FALHOU
+
+    job.finalizado = timezone.now()
+    gravados = reserved(job).update(
+        status=job.status, resultado=job.resultado, erro=job.erro,
+        executar_em=job.executar_em, finalizado=job.finalizado, updated=job.finalizado,
+    )
+    if not gravados:
+        logger.warning("Job %s perdeu a reserva; resultado descartado", job.id)
+    return job
+
+
+def requeue_stale():
+    """
+    Devolve à fila as tarefas cuja reserva expirou, ou seja, cujo worker parou.
+
+    A execução interrompida conta como tentativa: as tarefas que já atingiram
+    ``JOBS_MAX_ATTEMPTS`` são marcadas como falhas. Retorna a quantidade de
+    tarefas devolvidas à fila.
+    """
+    agora = timezone.now()
+    expiradas = Job.objects.filter(
+        Q(reservado_ate__lt=agora) | Q(reservado_ate__isnull=True), status=Job.EXECUTANDO
+    )
+    falhas = expiradas.filter(tentativas__gte=settings.JOBS_MAX_ATTEMPTS).update(
+        status=Job.FALHOU, erro="Worker interrompido durante a execução.",
+        finalizado=agora, updated=agora,
+    )
+    if falhas:
+        logger.warning("%s jobs interrompidos excederam o limite de tentativas", falhas)
+    return expiradas.update(status=Job.PENDENTE, executar_em=agora, updated=agora)
+
+
+def export_path(job):
+    return os.path.join(settings.JOBS_EXPORT_DIR, f'veiculos-{job.id}.csv')
+
+
+@register('exportar_veiculos', permissao='core.view_veiculo')
+def exportar_veiculos(job):
+    """Exporta todos os veículos ativos para um arquivo CSV."""
+    os.makedirs(settings.JOBS_EXPORT_DIR, exist_ok=True)
+    colunas = ['id', 'veiculo', 'marca_nome', 'ano', 'cor', 'descricao', 'vendido', 'created', 'updated']
+
+    linhas = 0
+    with open(export_path(job), 'w', newline='') as arquivo:
+        writer = csv.writer(arquivo)
+        writer.writerow(colunas)
+        veiculos = Veiculo.objects.filter(excluido=False).order_by('id').values_list(*colunas)
+        for veiculo in veiculos.iterator(chunk_size=2000):
+            writer.writerow(veiculo)
+            linhas += 1
+
+    return {'arquivo': os.path.basename(export_path(job)), 'linhas': linhas}
+
+
+@register('estatisticas', permissao='core.view_veiculo')
+def estatisticas(job):
+    """Recalcula os relatórios de estoque de veículos."""
+    veiculos = Veiculo.objects.filter(excluido=False)
+
+    por_decada = (
+        veiculos.values(decada=F('ano') / 10 * 10)
+        .annotate(quantidade=Count('id'))
+        .order_by('decada')
+    )
+    por_fabricante = (
+        veiculos.values('marca_nome')
+        .annotate(quantidade=Count('id'))
+        .order_by('-quantidade')
+    )
+
+    return {
+        'nao_vendidos': veiculos.filter(vendido=False).count(),
+        'ultima_semana': veiculos.filter(created__gte=timezone.now() - timedelta(days=7)).count(),
+        'por_decada': list(por_decada),
+        'por_fabricante': list(por_fabricante),
+    }
+
+
+@register('importar_veiculos', permissao='core.add_veiculo')
+def importar_veiculos(job):
+    """
+    Importa a lista ``payload['veiculos']``, validando cada item.
+
+    Os itens inválidos são ignorados e seus erros retornados pelo índice.
+    """
+    from .serializers import VeiculoSerializer
+
+    validos, erros = [], {}
+    for indice, dados in enumerate(job.payload.get('veiculos', [])):
+        serializer = VeiculoSerializer(data=dados)
+        if serializer.is_valid():
+            veiculo = Veiculo(**serializer.validated_data)
+            # bulk_create não chama save(), que preenche o nome desnormalizado.
+            veiculo.marca_nome = veiculo.marca.nome
+            validos.append(veiculo)
+        else:
+            erros[indice] = serializer.errors
+
+    Veiculo.objects.bulk_create(validos, batch_size=1000)
+    return {'importados': len(validos), 'erros': erros}
@@ -0,0 +1,29 @@
+"""
+Filtros de logging do projeto.
+"""
+import logging
+import re
+
+TOKEN_RE = re.compile(r'([?&]token=)[^&\s"\']+')
+
+
+def redact_token(value):
+    return TOKEN_RE.sub(r'\1***', value) if isinstance(value, str) else value
+
+
+class RedactQueryTokenFilter(logging.Filter):
+    """
+    Mascara o valor de ``?token=`` nas mensagens de log.
+
+    O ``EventSource`` envia o JWT na URL de ``/api/events/``, que chega aos
+    logs de acesso do servidor ASGI. Os argumentos são mascarados um a um,
+    pois alguns formatadores (como o de acesso do uvicorn) dependem deles.
+    """
+
+    def filter(self, record):
+        record.msg = redact_token(record.msg)
+        if isinstance(record.args, tuple):
+            record.args = tuple(redact_token(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {chave: redact_token(valor) for chave, valor in record.args.items()}
+        return True
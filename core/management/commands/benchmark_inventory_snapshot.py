@@ -0,0 +1,121 @@
+"""
+Compara a listagem de veículos respondida pelo snapshot colunar em memória
+com a mesma consulta em SQL.
+
+Os veículos são criados dentro de uma transação desfeita ao final. São
+medidos o tempo de carga e a memória do snapshot, a latência de cada
+consulta (total, primeira página de ids e facetas) e a atualização
+incremental após alterações.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.facets import FACETS, compute_facets
+from core.filters import VeiculoFilter
+from core.models import Veiculo
+from core.seed import seed_veiculos
+from core.snapshot import InventorySnapshot, parse_filters
+
+PAGINA = 20
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mede carga, memória e latência do snapshot do inventário contra o SQL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000000,
+            help="Quantidade de veículos criados para o teste.",
+        )
+        parser.add_argument(
+            '--updates', type=int, default=1000,
+            help="Veículos alterados antes de medir a atualização incremental.",
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help="Execuções de cada consulta; é exibida a mediana.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.stdout.write(f"Criando {options['rows']} veículos...")
+                marcas = seed_veiculos(options['rows'])
+                self.executar(marcas, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def executar(self, marcas, options):
+        snapshot = InventorySnapshot()
+        inicio = time.perf_counter()
+        snapshot.reload()
+        carga = time.perf_counter() - inicio
+
+        colunas = snapshot.columns()
+        por_milhao = 1000000 / max(len(colunas), 1)
+        self.stdout.write(
+            f"Carga: {len(colunas)} veículos em {carga:.2f} s "
+            f"({carga * por_milhao:.2f} s por milhão); "
+            f"memória {colunas.nbytes / 1024 ** 2:.1f} MiB "
+            f"({colunas.nbytes * por_milhao / 1024 ** 2:.1f} MiB por milhão)"
+        )
+
+        facetas = list(FACETS)
+        duas_marcas = ','.join(str(marca.id) for marca in marcas[:2])
+        for nome, params in [
+            ('sem filtros', {}),
+            ('marca__in + ano', {'marca__in': duas_marcas, 'ano__gte': '2015', 'ano__lte': '2020'}),
+            ('cor__in + vendido', {'cor__in': 'Preto,Prata', 'vendido': 'true'}),
+            ('decada', {'decada': '1990'}),
+        ]:
+            medidas = []
+            for parte in (None, facetas):
+                sql = self.medir(lambda: self.consultar_sql(params, parte), options['repeat'])
+                memoria = self.medir(lambda: self.consultar_snapshot(snapshot, params, parte), options['repeat'])
+                if sql[1] != memoria[1]:
+                    self.stdout.write(self.style.ERROR(f"{nome}: resultados diferentes do SQL"))
+                medidas.append(f"SQL {sql[0]:.2f} ms, snapshot {memoria[0]:.2f} ms")
+            self.stdout.write(
+                f"{nome:>18} ({memoria[1][0]} veículos): "
+                f"total e página {medidas[0]}; com facetas {medidas[1]}"
+            )
+
+        # Sem a janela de releitura, que logo após a carga incluiria os
+        # veículos recém-criados: mede apenas as alterações.
+        with override_settings(INVENTORY_SNAPSHOT_OVERLAP_SECONDS=0):
+            snapshot.refresh()
+            ids = list(Veiculo.objects.order_by('?').values_list('id', flat=True)[:options['updates']])
+            Veiculo.objects.filter(pk__in=ids).update(vendido=True, updated=timezone.now())
+            inicio = time.perf_counter()
+            alterados = snapshot.refresh()
+        self.stdout.write(
+            f"Atualização incremental: {alterados} veículos em "
+            f"{(time.perf_counter() - inicio) * 1000:.1f} ms"
+        )
+
+    def medir(self, consulta, repeat):
+        tempos = []
+        for _ in range(repeat):
+            inicio = time.perf_counter()
+            resultado = consulta()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tempos), resultado
+
+    def consultar_sql(self, params, facetas):
+        queryset = VeiculoFilter(params, queryset=Veiculo.objects.filter(excluido=False)).qs
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:PAGINA])
+        return queryset.count(), ids, compute_facets(queryset, facetas) if facetas else None
+
+    def consultar_snapshot(self, snapshot, params, facetas):
+        consulta = snapshot.filter(parse_filters(params))
+        return consulta.total, consulta.slice(0, PAGINA), consulta.facetas(facetas) if facetas else None
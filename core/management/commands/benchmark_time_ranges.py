@@ -0,0 +1,146 @@
+"""
+Mede as consultas por período de cadastro de Veiculo com B-tree, BRIN e Seq Scan.
+
+Os veículos são criados dentro de uma transação desfeita ao final. Cada
+consulta é executada com o B-tree ``core_veiculo_created_idx``, com um BRIN
+temporário em ``created`` e sem índice (Seq Scan). Depois, uma parte dos
+veículos é atualizada fora do HOT, o que move as linhas para o fim da tabela
+e reduz a correlação entre ``created`` e a ordem física; as medições são
+repetidas para mostrar o efeito sobre o BRIN.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from core.models import Veiculo
+from core.seed import seed_veiculos
+
+BTREE = 'core_veiculo_created_idx'
+BRIN = 'core_veiculo_created_benchmark'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compara consultas por período em created com B-tree, BRIN e Seq Scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000000,
+            help="Quantidade de veículos criados para o teste.",
+        )
+        parser.add_argument(
+            '--days', type=int, default=730,
+            help="Período, em dias, pelo qual os cadastros são distribuídos.",
+        )
+        parser.add_argument(
+            '--updated', type=float, default=10.0,
+            help="Percentual de veículos atualizados antes da segunda medição; 0 desativa.",
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help="Execuções de cada consulta; é exibida a mediana.",
+        )
+
+    def handle(self, *args, **options):
+        tabela = Veiculo._meta.db_table
+        try:
+            with transaction.atomic():
+                # Criado antes dos dados: um índice criado após atualizações na
+                # mesma transação não pode ser usado por ela.
+                with connection.cursor() as cursor:
+                    cursor.execute(f"CREATE INDEX {BRIN} ON {tabela} USING brin (created)")
+
+                self.stdout.write(f"Criando {options['rows']} veículos...")
+                seed_veiculos(options['rows'], dias=options['days'])
+                self.preparar()
+                self.stdout.write(
+                    f"Tamanho: B-tree {self.tamanho(BTREE)}, BRIN {self.tamanho(BRIN)}"
+                )
+                for nome, queryset in self.consultas():
+                    self.medir(nome, queryset, options['repeat'])
+
+                if options['updated'] > 0:
+                    self.stdout.write(f"Atualizando {options['updated']:g}% dos veículos...")
+                    with connection.cursor() as cursor:
+                        # ano é indexado: a atualização não pode ser HOT e a
+                        # nova versão da linha vai para outra página.
+                        cursor.execute(
+                            f"UPDATE {tabela} SET ano = ano + 1 WHERE random() < %s",
+                            [options['updated'] / 100],
+                        )
+                    self.preparar()
+                    for nome, queryset in self.consultas():
+                        self.medir(nome, queryset, options['repeat'])
+
+                raise Rollback
+        except Rollback:
+            pass
+
+    def preparar(self):
+        """Resume o BRIN, atualiza as estatísticas e mostra a correlação de created."""
+        tabela = Veiculo._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT brin_summarize_new_values('{BRIN}')")
+            cursor.execute(f"ANALYZE {tabela}")
+            cursor.execute(
+                "SELECT correlation FROM pg_stats WHERE tablename = %s AND attname = 'created'",
+                [tabela],
+            )
+            correlacao = cursor.fetchone()[0]
+        self.stdout.write(f"Correlação entre created e a ordem física: {correlacao:.3f}")
+
+    def consultas(self):
+        agora = timezone.now()
+        veiculos = Veiculo.objects.filter(excluido=False)
+        return [
+            ('última semana (count)', veiculos.filter(created__gte=agora - timedelta(days=7))),
+            ('último dia (lista)', veiculos.filter(created__gte=agora - timedelta(days=1)).values_list('id', 'veiculo')),
+            ('30 dias por dia', veiculos.filter(created__gte=agora - timedelta(days=30))
+                .annotate(dia=TruncDay('created')).values('dia').annotate(total=Count('id')).order_by()),
+        ]
+
+    def medir(self, nome, queryset, repeat):
+        sql, params = queryset.query.sql_with_params()
+        if nome.endswith('(count)'):
+            sql = f'SELECT COUNT(*) FROM ({sql}) AS q'
+
+        resultados = []
+        for estrategia, remover, desligar in [
+            ('B-tree', BRIN, ['enable_seqscan']),
+            ('BRIN', BTREE, ['enable_seqscan']),
+            ('Seq Scan', None, ['enable_bitmapscan', 'enable_indexscan']),
+        ]:
+            # Cada estratégia roda em um savepoint desfeito, sem o índice concorrente.
+            with transaction.atomic(), connection.cursor() as cursor:
+                for parametro in desligar:
+                    cursor.execute(f'SET LOCAL {parametro} = off')
+                if remover:
+                    cursor.execute(f'DROP INDEX {remover}')
+
+                cursor.execute(f'EXPLAIN {sql}', params)
+                plano = ' '.join(linha[0] for linha in cursor.fetchall())
+                tempos = []
+                for _ in range(repeat):
+                    inicio = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                transaction.set_rollback(True)
+
+            usado = BTREE if BTREE in plano else BRIN if BRIN in plano else 'sem índice em created'
+            resultados.append(f"{estrategia} {sorted(tempos)[len(tempos) // 2]:.1f} ms ({usado})")
+
+        self.stdout.write(f"{nome:>22}: " + ', '.join(resultados))
+
+    def tamanho(self, indice):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_size_pretty(pg_relation_size(%s::regclass))", [indice])
+            return cursor.fetchone()[0]
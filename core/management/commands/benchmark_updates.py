@@ -0,0 +1,104 @@
+"""
+Compara o custo das atualizações de Veiculo gravando todas as colunas ou
+apenas as alteradas.
+
+Os veículos são criados dentro de uma transação desfeita ao final, de modo
+que o comando pode ser executado em qualquer banco sem deixar dados.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Veiculo
+from core.seed import seed_veiculos
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mede updates/s, WAL por update e proporção de HOT updates em Veiculo."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=2000,
+            help="Quantidade de veículos criados para o teste.",
+        )
+        parser.add_argument(
+            '--updates', type=int, default=2000,
+            help="Quantidade de updates em cada cenário.",
+        )
+        parser.add_argument(
+            '--descricao-size', type=int, default=4000,
+            help="Tamanho da descrição de cada veículo, em caracteres.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed_veiculos(options['rows'], descricao_tamanho=options['descricao_size'])
+                ids = list(Veiculo.objects.order_by('-id').values_list('id', flat=True)[:options['rows']])
+                campos = [field.name for field in Veiculo._meta.concrete_fields if not field.primary_key]
+
+                def completo(veiculo):
+                    veiculo.vendido = not veiculo.vendido
+                    veiculo.save(update_fields=campos)
+
+                def alterados(veiculo):
+                    veiculo.vendido = not veiculo.vendido
+                    veiculo.save()
+
+                def sem_alteracao(veiculo):
+                    veiculo.save()
+
+                for nome, func in [
+                    ('todas as colunas', completo),
+                    ('apenas alteradas', alterados),
+                    ('sem alteração', sem_alteracao),
+                ]:
+                    self.medir(nome, func, ids, options['updates'])
+
+                raise Rollback
+        except Rollback:
+            pass
+
+    def medir(self, nome, func, ids, updates):
+        veiculos = list(Veiculo.objects.filter(pk__in=ids))
+        veiculos = (veiculos * (updates // len(veiculos) + 1))[:updates]
+
+        wal_inicio = self.wal_lsn()
+        stats_inicio = self.tuple_stats()
+        inicio = time.perf_counter()
+        for veiculo in veiculos:
+            func(veiculo)
+        duracao = time.perf_counter() - inicio
+        wal = self.wal_diff(wal_inicio)
+        atualizadas, hot = (fim - ini for fim, ini in zip(self.tuple_stats(), stats_inicio))
+
+        self.stdout.write(
+            f"{nome:>18}: {updates / duracao:9.0f} updates/s, "
+            f"{wal / updates:8.0f} bytes de WAL/update, "
+            f"{atualizadas} linhas atualizadas ({hot} HOT)"
+        )
+
+    def wal_lsn(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_insert_lsn()")
+            return cursor.fetchone()[0]
+
+    def wal_diff(self, inicio):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), %s)", [inicio])
+            return int(cursor.fetchone()[0])
+
+    def tuple_stats(self):
+        # As funções pg_stat_xact_* enxergam as alterações da transação atual.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_stat_get_xact_tuples_updated(%s::regclass), "
+                "pg_stat_get_xact_tuples_hot_updated(%s::regclass)",
+                [Veiculo._meta.db_table] * 2,
+            )
+            return cursor.fetchone()
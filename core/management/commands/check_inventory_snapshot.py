@@ -0,0 +1,40 @@
+"""
+Verifica se o snapshot do inventário, mantido pelo feed de alterações,
+continua igual aos dados do banco.
+
+O snapshot é carregado, o comando aguarda ``--wait`` segundos enquanto a
+aplicação recebe escritas, aplica as alterações de forma incremental e
+compara o resultado com uma leitura completa.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.snapshot import InventorySnapshot, check_consistency
+
+
+class Command(BaseCommand):
+    help = "Compara o snapshot do inventário, atualizado pelo feed, com o banco."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--wait', type=float, default=0,
+            help="Segundos entre a carga e a atualização incremental.",
+        )
+
+    def handle(self, *args, **options):
+        snapshot = InventorySnapshot()
+        snapshot.reload()
+        self.stdout.write(f"Snapshot carregado com {len(snapshot.columns())} veículos.")
+
+        if options['wait']:
+            time.sleep(options['wait'])
+        alterados = snapshot.refresh()
+        self.stdout.write(f"{alterados} veículos atualizados pelo feed de alterações.")
+
+        divergencias = check_consistency(snapshot)
+        for divergencia in divergencias:
+            self.stdout.write(self.style.ERROR(divergencia))
+        if divergencias:
+            raise CommandError("O snapshot diverge do banco.")
+        self.stdout.write(self.style.SUCCESS("Snapshot consistente com o banco."))
@@ -0,0 +1,40 @@
+"""
+Remove os perfis de requisições mais antigos que a retenção configurada.
+
+Deve ser agendado para rodar periodicamente (ex.: cron diário), junto com
+``rollup_api_logs``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import RequestProfile
+
+
+class Command(BaseCommand):
+    help = "Remove os perfis de requisições expirados."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=settings.PROFILER_RETENTION_DAYS,
+            help="Dias de retenção dos perfis.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.API_LOG_DELETE_BATCH_SIZE,
+            help="Quantidade de perfis removidos por transação.",
+        )
+
+    def handle(self, *args, **options):
+        corte = timezone.now() - timedelta(days=options['retention_days'])
+        expirados = RequestProfile.objects.filter(created__lt=corte)
+
+        total = 0
+        while True:
+            ids = list(expirados.order_by().values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            removidos, _ = RequestProfile.objects.filter(pk__in=ids).delete()
+            total += removidos
+        self.stdout.write(f"{total} perfis removidos.")
@@ -0,0 +1,120 @@
+"""
+Consolida e expira os registros de requisições do LoggingMixin.
+
+Os registros brutos de ``APIRequestLog`` são agregados por hora e endpoint em
+``APIRequestRollup`` e, depois de consolidados, removidos em lotes conforme a
+retenção configurada. Deve ser agendado para rodar periodicamente (ex.: cron
+a cada hora).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_tracking.models import APIRequestLog
+
+from core.models import APIRequestRollup
+
+ROLLUP_SQL = """
+INSERT INTO {rollup} (hora, view, view_method, method, total, erros,
+                      media_ms, p50_ms, p95_ms, p99_ms, max_ms)
+SELECT date_trunc('hour', requested_at),
+       COALESCE(view, ''),
+       COALESCE(view_method, ''),
+       method,
+       COUNT(*),
+       COUNT(*) FILTER (WHERE status_code >= 400),
+       AVG(response_ms),
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY response_ms),
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY response_ms),
+       percentile_cont(0.99) WITHIN GROUP (ORDER BY response_ms),
+       MAX(response_ms)
+FROM {log}
+WHERE requested_at >= %s AND requested_at < %s
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (hora, view, view_method, method) DO UPDATE SET
+    total = EXCLUDED.total,
+    erros = EXCLUDED.erros,
+    media_ms = EXCLUDED.media_ms,
+    p50_ms = EXCLUDED.p50_ms,
+    p95_ms = EXCLUDED.p95_ms,
+    p99_ms = EXCLUDED.p99_ms,
+    max_ms = EXCLUDED.max_ms
+"""
+
+
+class Command(BaseCommand):
+    help = "Agrega os logs de requisições por hora e remove os registros expirados."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=settings.API_LOG_RETENTION_DAYS,
+            help="Dias de retenção dos registros brutos.",
+        )
+        parser.add_argument(
+            '--rollup-retention-days', type=int, default=settings.API_LOG_ROLLUP_RETENTION_DAYS,
+            help="Dias de retenção dos agregados horários.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.API_LOG_DELETE_BATCH_SIZE,
+            help="Quantidade de registros removidos por transação.",
+        )
+
+    def handle(self, *args, **options):
+        agora = timezone.now()
+        limite = agora.replace(minute=0, second=0, microsecond=0)
+
+        horas = self.rollup(limite)
+        self.stdout.write(f"{horas} agregados horários atualizados.")
+
+        # Só remove registros que já foram consolidados.
+        corte = min(agora - timedelta(days=options['retention_days']), limite)
+        removidos = self.purge(
+            APIRequestLog.objects.filter(requested_at__lt=corte), options['batch_size']
+        )
+        self.stdout.write(f"{removidos} registros brutos removidos.")
+
+        corte = agora - timedelta(days=options['rollup_retention_days'])
+        removidos, _ = APIRequestRollup.objects.filter(hora__lt=corte).delete()
+        self.stdout.write(f"{removidos} agregados horários removidos.")
+
+    def rollup(self, limite):
+        """
+        Agrega as horas completas até ``limite``.
+
+        A última hora já consolidada é recalculada, pois pode ter recebido
+        registros de requisições que terminaram após a execução anterior.
+        """
+        ultima = APIRequestRollup.objects.order_by('-hora').values_list('hora', flat=True).first()
+        if ultima is None:
+            ultima = APIRequestLog.objects.order_by('requested_at').values_list(
+                'requested_at', flat=True
+            ).first()
+            if ultima is None:
+                return 0
+
+        sql = ROLLUP_SQL.format(
+            rollup=connection.ops.quote_name(APIRequestRollup._meta.db_table),
+            log=connection.ops.quote_name(APIRequestLog._meta.db_table),
+        )
+        inicio = ultima.replace(minute=0, second=0, microsecond=0)
+        horas = 0
+        # Processa um dia por vez para limitar o trabalho de cada transação.
+        while inicio < limite:
+            fim = min(inicio + timedelta(days=1), limite)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [inicio, fim])
+                horas += cursor.rowcount
+            inicio = fim
+        return horas
+
+    def purge(self, queryset, batch_size):
+        """Remove os registros do queryset em lotes de ``batch_size``."""
+        total = 0
+        while True:
+            ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return total
+            removidos, _ = queryset.model.objects.filter(pk__in=ids).delete()
+            total += removidos
@@ -0,0 +1,126 @@
+"""
+Worker da fila de tarefas em segundo plano (core.jobs).
+"""
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from core import jobs
+
+REQUEUE_INTERVAL = 60
+
+
+def worker_loop(stop, poll_interval, once=False):
+    """Consome a fila até ``stop`` ser sinalizado (ou a fila esvaziar, com ``once``)."""
+    ultima_verificacao = 0
+    while not stop.is_set():
+        job = jobs.claim()
+        if job is not None:
+            jobs.run(job)
+            continue
+
+        if once:
+            return
+
+        if time.monotonic() - ultima_verificacao > REQUEUE_INTERVAL:
+            jobs.requeue_stale()
+            ultima_verificacao = time.monotonic()
+        stop.wait(poll_interval)
+
+
+def thread_main(stop, poll_interval):
+    try:
+        worker_loop(stop, poll_interval)
+    finally:
+        connection.close()
+
+
+def process_main(poll_interval):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    thread_main(stop, poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Executa as tarefas em segundo plano da fila core.Job."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOBS_WORKERS,
+            help="Quantidade de workers concorrentes.",
+        )
+        parser.add_argument(
+            '--mode', choices=['thread', 'process'], default='thread',
+            help="Executa os workers em threads ou em processos separados.",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL,
+            help="Segundos de espera quando a fila está vazia.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Processa as tarefas pendentes e encerra.",
+        )
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"{requeued} tarefas interrompidas devolvidas à fila.")
+
+        if options['once']:
+            worker_loop(threading.Event(), options['poll_interval'], once=True)
+            return
+
+        self.stdout.write(
+            f"Iniciando {options['workers']} worker(s) em modo {options['mode']}."
+        )
+        if options['mode'] == 'process':
+            self.run_processes(options['workers'], options['poll_interval'])
+        else:
+            self.run_threads(options['workers'], options['poll_interval'])
+
+    def run_threads(self, workers, poll_interval):
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        threads = [
+            threading.Thread(target=thread_main, args=(stop, poll_interval), name=f'job-worker-{i}')
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def run_processes(self, workers, poll_interval):
+        # As conexões não podem ser compartilhadas com os processos filhos.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=process_main, args=(poll_interval,), name=f'job-worker-{i}')
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        signal.signal(signal.SIGTERM, lambda *args: [p.terminate() for p in processes])
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_marca_options_alter_veiculo_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['updated', 'id'], name='core_veicul_updated_id_idx'),
+        ),
+    ]
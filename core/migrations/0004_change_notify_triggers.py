@@ -0,0 +1,117 @@
+from django.db import migrations
+
+
+# Triggers por comando, com tabelas de transição: um UPDATE em massa gera uma
+# notificação por lote de linhas, e não uma por linha. O payload do NOTIFY é
+# limitado a 8000 bytes, daí o tamanho dos lotes. Acima de 1000 linhas o
+# comando é publicado apenas com a contagem, e os clientes ressincronizam
+# pelo feed de alterações.
+NOTIFY_SQL = """
+CREATE OR REPLACE FUNCTION core_veiculo_notify() RETURNS trigger AS $$
+DECLARE
+    total bigint;
+    lote record;
+BEGIN
+    SELECT count(*) INTO total FROM linhas;
+    IF total > 1000 THEN
+        PERFORM pg_notify('core_changes', json_build_object(
+            'model', 'veiculo', 'op', lower(TG_OP), 'count', total
+        )::text);
+        RETURN NULL;
+    END IF;
+    FOR lote IN
+        SELECT json_agg(json_build_object(
+            'id', id,
+            'marca', marca_id,
+            'vendido', vendido,
+            'excluido', excluido,
+            'updated', updated
+        ) ORDER BY id) AS rows
+        FROM (SELECT *, (row_number() OVER (ORDER BY id) - 1) / 50 AS grupo FROM linhas) numeradas
+        GROUP BY grupo
+        ORDER BY grupo
+    LOOP
+        PERFORM pg_notify('core_changes', json_build_object(
+            'model', 'veiculo', 'op', lower(TG_OP), 'rows', lote.rows
+        )::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_veiculo_notify_insert
+AFTER INSERT ON core_veiculo REFERENCING NEW TABLE AS linhas
+FOR EACH STATEMENT EXECUTE FUNCTION core_veiculo_notify();
+
+CREATE TRIGGER core_veiculo_notify_update
+AFTER UPDATE ON core_veiculo REFERENCING NEW TABLE AS linhas
+FOR EACH STATEMENT EXECUTE FUNCTION core_veiculo_notify();
+
+CREATE TRIGGER core_veiculo_notify_delete
+AFTER DELETE ON core_veiculo REFERENCING OLD TABLE AS linhas
+FOR EACH STATEMENT EXECUTE FUNCTION core_veiculo_notify();
+
+CREATE OR REPLACE FUNCTION core_marca_notify() RETURNS trigger AS $$
+DECLARE
+    total bigint;
+    lote record;
+BEGIN
+    SELECT count(*) INTO total FROM linhas;
+    IF total > 1000 THEN
+        PERFORM pg_notify('core_changes', json_build_object(
+            'model', 'marca', 'op', lower(TG_OP), 'count', total
+        )::text);
+        RETURN NULL;
+    END IF;
+    FOR lote IN
+        SELECT json_agg(json_build_object(
+            'id', id,
+            'nome', nome,
+            'ativo', ativo
+        ) ORDER BY id) AS rows
+        FROM (SELECT *, (row_number() OVER (ORDER BY id) - 1) / 25 AS grupo FROM linhas) numeradas
+        GROUP BY grupo
+        ORDER BY grupo
+    LOOP
+        PERFORM pg_notify('core_changes', json_build_object(
+            'model', 'marca', 'op', lower(TG_OP), 'rows', lote.rows
+        )::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_marca_notify_insert
+AFTER INSERT ON core_marca REFERENCING NEW TABLE AS linhas
+FOR EACH STATEMENT EXECUTE FUNCTION core_marca_notify();
+
+CREATE TRIGGER core_marca_notify_update
+AFTER UPDATE ON core_marca REFERENCING NEW TABLE AS linhas
+FOR EACH STATEMENT EXECUTE FUNCTION core_marca_notify();
+
+CREATE TRIGGER core_marca_notify_delete
+AFTER DELETE ON core_marca REFERENCING OLD TABLE AS linhas
+FOR EACH STATEMENT EXECUTE FUNCTION core_marca_notify();
+"""
+
+DROP_NOTIFY_SQL = """
+DROP TRIGGER IF EXISTS core_veiculo_notify_insert ON core_veiculo;
+DROP TRIGGER IF EXISTS core_veiculo_notify_update ON core_veiculo;
+DROP TRIGGER IF EXISTS core_veiculo_notify_delete ON core_veiculo;
+DROP FUNCTION IF EXISTS core_veiculo_notify();
+DROP TRIGGER IF EXISTS core_marca_notify_insert ON core_marca;
+DROP TRIGGER IF EXISTS core_marca_notify_update ON core_marca;
+DROP TRIGGER IF EXISTS core_marca_notify_delete ON core_marca;
+DROP FUNCTION IF EXISTS core_marca_notify();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_veiculo_updated_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(NOTIFY_SQL, DROP_NOTIFY_SQL),
+    ]
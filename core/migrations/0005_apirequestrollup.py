@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_change_notify_triggers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIRequestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField(verbose_name='Hora')),
+                ('view', models.CharField(max_length=200, verbose_name='View')),
+                ('view_method', models.CharField(max_length=200, verbose_name='Método da View')),
+                ('method', models.CharField(max_length=10, verbose_name='Método HTTP')),
+                ('total', models.PositiveIntegerField(verbose_name='Total de Requisições')),
+                ('erros', models.PositiveIntegerField(verbose_name='Requisições com Erro')),
+                ('media_ms', models.FloatField(verbose_name='Latência Média (ms)')),
+                ('p50_ms', models.FloatField(verbose_name='Latência p50 (ms)')),
+                ('p95_ms', models.FloatField(verbose_name='Latência p95 (ms)')),
+                ('p99_ms', models.FloatField(verbose_name='Latência p99 (ms)')),
+                ('max_ms', models.PositiveIntegerField(verbose_name='Latência Máxima (ms)')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='apirequestrollup',
+            constraint=models.UniqueConstraint(fields=('hora', 'view', 'view_method', 'method'), name='core_apirequestrollup_unico'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='veiculo',
+            name='marca_nome',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, verbose_name='Nome da Marca'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def preencher_marca_nome(apps, schema_editor):
+    """
+    Preenche em lotes o nome desnormalizado da marca nos veículos existentes.
+
+    Percorre faixas de pk em vez de buscar os veículos com ``marca_nome`` vazio,
+    de modo que o laço termina mesmo para marcas de nome vazio. Cada faixa é
+    uma transação e copia o nome atual da marca, então a migração pode ser
+    reexecutada se for interrompida.
+    """
+    Marca = apps.get_model('core', 'Marca')
+    Veiculo = apps.get_model('core', 'Veiculo')
+
+    nome = Subquery(Marca.objects.filter(pk=OuterRef('marca_id')).values('nome')[:1])
+    ultimo = Veiculo.objects.aggregate(ultimo=Max('pk'))['ultimo'] or 0
+    for inicio in range(0, ultimo + 1, BATCH_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Veiculo.objects.filter(
+                pk__gte=inicio, pk__lt=inicio + BATCH_SIZE
+            ).update(marca_nome=nome)
+
+
+class Migration(migrations.Migration):
+    # Cada lote é confirmado separadamente para não manter a tabela bloqueada.
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_veiculo_marca_nome'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_marca_nome, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0008_preencher_marca_nome'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=200, verbose_name='Caminho')),
+                ('method', models.CharField(max_length=10, verbose_name='Método HTTP')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Status')),
+                ('motivo', models.CharField(choices=[('limite', 'Acima do limite de latência'), ('token', 'Solicitado pelo cabeçalho')], max_length=10, verbose_name='Motivo')),
+                ('duracao_ms', models.FloatField(verbose_name='Duração (ms)')),
+                ('intervalo_ms', models.FloatField(verbose_name='Intervalo de Amostragem (ms)')),
+                ('amostras', models.PositiveIntegerField(verbose_name='Amostras')),
+                ('stacks', models.TextField(blank=True, verbose_name='Pilhas (collapsed)')),
+                ('total_queries', models.PositiveIntegerField(verbose_name='Consultas')),
+                ('tempo_queries_ms', models.FloatField(verbose_name='Tempo em Consultas (ms)')),
+                ('queries', models.JSONField(blank=True, default=list, verbose_name='Consultas Registradas')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:40
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('veiculo'), name='text_pattern_ops'), name='core_veiculo_nome_prefix_idx'),
+        ),
+    ]
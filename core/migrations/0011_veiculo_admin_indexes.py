@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_veiculo_nome_prefix_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['ano'], name='core_veiculo_ano_idx'),
+        ),
+    ]
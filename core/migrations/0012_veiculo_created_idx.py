@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_veiculo_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['created'], name='core_veiculo_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-19 05:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_veiculo_created_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='veiculo',
+            name='marca',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='veiculos', to='core.marca', verbose_name='Marca'),
+        ),
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['marca', 'ano'], name='core_veiculo_marca_ano_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_veiculo_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='reservado_ate',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reserva Válida Até'),
+        ),
+    ]
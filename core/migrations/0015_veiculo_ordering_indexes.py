@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_job_reservado_ate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['veiculo'], name='core_veiculo_nome_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_veiculo_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='requestprofile',
+            index=models.Index(fields=['created'], name='core_reqprofile_created_idx'),
+        ),
+    ]
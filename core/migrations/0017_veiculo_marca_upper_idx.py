@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 06:38
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_requestprofile_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(django.db.models.functions.text.Upper('marca_nome'), name='core_veiculo_marca_upper_idx'),
+        ),
+    ]
@@ -1,10 +1,85 @@
 """
 Modelos para o sistema de gestão de veículos.
 """
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.indexes import OpClass
+from django.db import models, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
 
 
-class Marca(models.Model):
+class DirtyFieldsMixin(models.Model):
+    """
+    Registra os valores lidos do banco para que save() grave apenas os campos alterados.
+
+    Um save() sem alterações não executa nenhum UPDATE. Os campos com
+    ``auto_now`` são incluídos sempre que houver algo a gravar.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._registrar_valores_salvos()
+        return instance
+
+    def _registrar_valores_salvos(self, fields=None):
+        valores = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and (fields is None or field.attname in fields)
+        }
+        if fields is None or not hasattr(self, '_valores_salvos'):
+            self._valores_salvos = valores
+        else:
+            self._valores_salvos.update(valores)
+
+    def get_dirty_fields(self):
+        """Retorna os nomes dos campos alterados desde a última leitura ou gravação."""
+        salvos = getattr(self, '_valores_salvos', None)
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if salvos is None or field.attname not in salvos \
+                    or salvos[field.attname] != self.__dict__[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is not None:
+            fields = {self._meta.get_field(name).attname for name in fields}
+        self._registrar_valores_salvos(fields)
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+            and not self._state.adding
+            and hasattr(self, '_valores_salvos')
+        ):
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                return
+            auto_now = [
+                field.name for field in self._meta.concrete_fields
+                if getattr(field, 'auto_now', False) and field.name not in dirty
+            ]
+            kwargs['update_fields'] = dirty + auto_now
+
+        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {self._meta.get_field(name).attname for name in update_fields}
+        self._registrar_valores_salvos(update_fields)
+
+
+class Marca(DirtyFieldsMixin):
     """
     Modelo para armazenar marcas de veículos com validação de consistência.
     """
@@ -13,8 +88,36 @@ class Marca(models.Model):
     created = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
     updated = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
 
+    def __str__(self):
+        return self.nome
+
+    def save(self, *args, **kwargs):
+        renomeada = not self._state.adding and 'nome' in self.get_dirty_fields()
+        # Se a propagação falhar, a marca também não é renomeada.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if renomeada:
+                self.propagar_nome()
+
+    def propagar_nome(self, batch_size=5000):
+        """
+        Atualiza em lotes o nome desnormalizado nos veículos da marca.
+
+        Chamado por ``save``, na mesma transação. Renomeações por ``Marca.objects.update(nome=...)``
+        não passam por aqui e deixam ``Veiculo.marca_nome`` desatualizado;
+        nesse caso chame ``propagar_nome`` em cada marca alterada.
+        """
+        veiculos = Veiculo.objects.filter(marca=self).exclude(marca_nome=self.nome)
+        while True:
+            ids = list(veiculos.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            Veiculo.objects.filter(pk__in=ids).update(
+                marca_nome=self.nome, updated=timezone.now()
+            )
+
 
-class Veiculo(models.Model):
+class Veiculo(DirtyFieldsMixin):
     """
     Modelo para armazenar informações dos veículos seguindo a estrutura especificada.
     """
@@ -22,9 +125,18 @@ class Veiculo(models.Model):
     marca = models.ForeignKey(
         Marca, 
         on_delete=models.PROTECT, 
+        # Atendido pelo índice (marca, ano).
+        db_index=False,
         verbose_name="Marca",
         related_name='veiculos'
     )
+    marca_nome = models.CharField(
+        max_length=100,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Nome da Marca"
+    )
     ano = models.IntegerField(verbose_name="Ano")
     cor = models.CharField(max_length=50, blank=True, verbose_name="Cor do Veículo")
     descricao = models.TextField(blank=True, verbose_name="Descrição")
@@ -33,7 +145,160 @@ class Veiculo(models.Model):
     created = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
     updated = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated', 'id'], name='core_veicul_updated_id_idx'),
+            # Busca por prefixo (autocompletar e admin): UPPER(veiculo) LIKE 'PREFIXO%'.
+            models.Index(
+                OpClass(Upper('veiculo'), name='text_pattern_ops'),
+                name='core_veiculo_nome_prefix_idx',
+            ),
+            # Filtro exato e ordenação por nome.
+            models.Index(fields=['veiculo'], name='core_veiculo_nome_idx'),
+            # Filtros por período e ordenação por data de criação. Um BRIN
+            # depende de created acompanhar a ordem física das linhas, que se
+            # perde quando atualizações fora do HOT movem as linhas.
+            models.Index(fields=['created'], name='core_veiculo_created_idx'),
+            models.Index(fields=['ano'], name='core_veiculo_ano_idx'),
+            models.Index(fields=['marca', 'ano'], name='core_veiculo_marca_ano_idx'),
+            # Filtro por nome da marca sem distinção de maiúsculas.
+            models.Index(Upper('marca_nome'), name='core_veiculo_marca_upper_idx'),
+            # cor e vendido não são indexados: cada valor cobre boa parte da
+            # tabela, e índices neles só encareceriam as gravações e
+            # impediriam atualizações HOT de vendido.
+        ]
+
+    def __str__(self):
+        return f'{self.veiculo} ({self.marca_nome}, {self.ano})'
+
+    def save(self, *args, **kwargs):
+        # Mantém o nome da marca desnormalizado para busca e ordenação sem join.
+        if self.marca_id is not None and (
+            'marca' in self.get_dirty_fields() or not self.marca_nome
+        ):
+            self.marca_nome = self.marca.nome
+        update_fields = kwargs.get('update_fields')
+        if (
+            update_fields is not None
+            and {'marca', 'marca_id'} & set(update_fields)
+            and 'marca_nome' not in update_fields
+        ):
+            kwargs['update_fields'] = [*update_fields, 'marca_nome']
+        super().save(*args, **kwargs)
+
     def delete(self):
         self.excluido = True
         self.save()
 
+
+class APIRequestRollup(models.Model):
+    """
+    Agregado horário, por endpoint, das requisições registradas pelo LoggingMixin.
+    """
+    hora = models.DateTimeField(verbose_name="Hora")
+    view = models.CharField(max_length=200, verbose_name="View")
+    view_method = models.CharField(max_length=200, verbose_name="Método da View")
+    method = models.CharField(max_length=10, verbose_name="Método HTTP")
+    total = models.PositiveIntegerField(verbose_name="Total de Requisições")
+    erros = models.PositiveIntegerField(verbose_name="Requisições com Erro")
+    media_ms = models.FloatField(verbose_name="Latência Média (ms)")
+    p50_ms = models.FloatField(verbose_name="Latência p50 (ms)")
+    p95_ms = models.FloatField(verbose_name="Latência p95 (ms)")
+    p99_ms = models.FloatField(verbose_name="Latência p99 (ms)")
+    max_ms = models.PositiveIntegerField(verbose_name="Latência Máxima (ms)")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hora', 'view', 'view_method', 'method'],
+                name='core_apirequestrollup_unico',
+            ),
+        ]
+
+
+class Job(models.Model):
+    """
+    Tarefa pesada executada fora do ciclo da requisição pelo comando run_jobs.
+    """
+    PENDENTE = 'pendente'
+    EXECUTANDO = 'executando'
+    CONCLUIDO = 'concluido'
+    FALHOU = 'falhou'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (EXECUTANDO, 'Executando'),
+        (CONCLUIDO, 'Concluído'),
+        (FALHOU, 'Falhou'),
+    ]
+
+    tipo = models.CharField(max_length=50, verbose_name="Tipo")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE, verbose_name="Status")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Parâmetros")
+    resultado = models.JSONField(null=True, blank=True, verbose_name="Resultado")
+    erro = models.TextField(blank=True, verbose_name="Erro")
+    tentativas = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        verbose_name="Usuário",
+        related_name='jobs'
+    )
+    executar_em = models.DateTimeField(default=timezone.now, verbose_name="Executar Em")
+    iniciado = models.DateTimeField(null=True, blank=True, verbose_name="Início da Execução")
+    reservado_ate = models.DateTimeField(null=True, blank=True, verbose_name="Reserva Válida Até")
+    finalizado = models.DateTimeField(null=True, blank=True, verbose_name="Fim da Execução")
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
+    updated = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['executar_em', 'id'],
+                name='core_job_pendente_idx',
+                condition=models.Q(status='pendente'),
+            ),
+        ]
+
+
+class RequestProfile(models.Model):
+    """
+    Perfil amostrado de uma requisição lenta ou marcada para profiling.
+
+    As pilhas são armazenadas no formato "collapsed" (uma pilha por linha,
+    seguida da quantidade de amostras), aceito por flamegraph.pl e speedscope.
+    """
+    LIMITE = 'limite'
+    TOKEN = 'token'
+    MOTIVO_CHOICES = [
+        (LIMITE, 'Acima do limite de latência'),
+        (TOKEN, 'Solicitado pelo cabeçalho'),
+    ]
+
+    path = models.CharField(max_length=200, verbose_name="Caminho")
+    method = models.CharField(max_length=10, verbose_name="Método HTTP")
+    status_code = models.PositiveSmallIntegerField(verbose_name="Status")
+    motivo = models.CharField(max_length=10, choices=MOTIVO_CHOICES, verbose_name="Motivo")
+    duracao_ms = models.FloatField(verbose_name="Duração (ms)")
+    intervalo_ms = models.FloatField(verbose_name="Intervalo de Amostragem (ms)")
+    amostras = models.PositiveIntegerField(verbose_name="Amostras")
+    stacks = models.TextField(blank=True, verbose_name="Pilhas (collapsed)")
+    total_queries = models.PositiveIntegerField(verbose_name="Consultas")
+    tempo_queries_ms = models.FloatField(verbose_name="Tempo em Consultas (ms)")
+    queries = models.JSONField(default=list, blank=True, verbose_name="Consultas Registradas")
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        verbose_name="Usuário",
+        related_name='request_profiles'
+    )
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
+
+    class Meta:
+        indexes = [
+            # Listagem por data e remoção dos perfis expirados.
+            models.Index(fields=['created'], name='core_reqprofile_created_idx'),
+        ]
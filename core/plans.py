@@ -0,0 +1,270 @@
+"""
+Snapshots dos planos de execução das consultas da API de veículos.
+
+Cada combinação suportada de filtro, busca e ordenação do ``VeiculoViewSet``
+é executada pela própria view; as consultas sobre ``core_veiculo`` são
+capturadas e passadas por ``EXPLAIN (FORMAT JSON)``. Os planos normalizados
+ficam em ``core/plan_snapshots/`` e os testes falham quando o plano atual de
+uma combinação difere do gravado, quando uma combinação fora de
+``SEQ_SCANS_PERMITIDOS`` faz um Seq Scan em ``core_veiculo`` ou quando
+qualquer combinação ordena mais de ``MAX_SORT_ROWS`` linhas estimadas.
+
+Para regenerar os snapshots após uma mudança intencional::
+
+    UPDATE_PLAN_SNAPSHOTS=1 python manage.py test core.tests.PlanRegressionTest
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .changes import encode_cursor
+from .models import Marca
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), 'plan_snapshots')
+
+# Quantidade de veículos gerados antes de capturar os planos e o período,
+# em dias, pelo qual as datas de criação são distribuídas.
+SEED_ROWS = 20000
+SEED_DAYS = 365
+# Ordenações com estimativa acima deste número de linhas são regressões.
+MAX_SORT_ROWS = 1000
+
+# Filtros cujas combinações podem fazer Seq Scan em core_veiculo, com a
+# justificativa; '' cobre as combinações sem filtro e 'search' as com busca.
+# Entradas que nenhuma combinação usa também falham o teste.
+SEQ_SCANS_PERMITIDOS = {
+    '': "A contagem sem filtro lê todos os veículos não excluídos; nenhum índice é mais barato.",
+    'search': "A busca usa icontains em seis colunas; nenhum índice B-tree a atende.",
+    'excluido': "excluido=false, já aplicado pela view, seleciona praticamente toda a tabela.",
+    'marca_ativa': "Quase todas as marcas são ativas; o filtro seleciona a maior parte da tabela.",
+    'vendido': "Cada valor cobre boa parte da tabela; um índice em vendido impediria atualizações HOT.",
+    'cor__in': "Cada cor cobre boa parte da tabela; um índice em cor só encareceria as gravações.",
+}
+
+
+def ultima_semana():
+    return (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+
+
+def primeira_semana():
+    return (datetime.now(timezone.utc) - timedelta(days=SEED_DAYS - 7)).isoformat()
+
+
+def duas_marcas():
+    return ','.join(str(pk) for pk in Marca.objects.order_by('id').values_list('id', flat=True)[:2])
+
+
+# Valores usados para cada filtro; filtros novos precisam de um exemplo aqui.
+# Funções são avaliadas ao executar e identificadas pelo nome no snapshot.
+VALORES_EXEMPLO = {
+    'veiculo': 'Sedan 1',
+    'vendido': 'true',
+    'excluido': 'false',
+    'search': 'ford',
+    'cursor': encode_cursor(datetime(2020, 1, 1, tzinfo=timezone.utc), 0),
+    'created__gte': ultima_semana,
+    'created__lt': primeira_semana,
+    'ano': '2015',
+    'ano__gte': '2020',
+    'ano__lte': '1965',
+    'decada': '2010',
+    'marca__in': duas_marcas,
+    'marca_nome__in': 'toyota,honda',
+    'cor__in': 'Preto,Prata',
+    'marca_ativa': 'true',
+}
+
+CAMPOS_NORMALIZADOS = (
+    'Node Type', 'Parent Relationship', 'Strategy', 'Join Type',
+    'Relation Name', 'Index Name', 'Scan Direction', 'Sort Key',
+)
+
+
+def query_shapes(view_class):
+    """
+    Enumera as combinações de parâmetros da listagem de ``view_class``.
+
+    Retorna tuplas ``(action, params)``: cada filtro isolado, combinado ou
+    não com a busca, e cada um deles com cada campo de ordenação.
+    """
+    view = view_class()
+    filterset_class = DjangoFilterBackend().get_filterset_class(view, view_class.queryset)
+    filtros = list(filterset_class.base_filters) if filterset_class else []
+
+    sem_exemplo = [nome for nome in filtros if nome not in VALORES_EXEMPLO]
+    if sem_exemplo:
+        raise ValueError(f"Filtros sem valor de exemplo: {', '.join(sem_exemplo)}")
+
+    aliases = getattr(view_class, 'ordering_aliases', {})
+    ordenacoes = [campo for campo in view_class.ordering_fields if campo not in aliases]
+    buscas = [None]
+    if SearchFilter in view_class.filter_backends:
+        buscas.append(api_settings.SEARCH_PARAM)
+
+    shapes = []
+    for filtro in [None] + filtros:
+        for busca in buscas:
+            for ordenacao in [None] + ordenacoes:
+                params = {}
+                if filtro:
+                    params[filtro] = VALORES_EXEMPLO[filtro]
+                if busca:
+                    params[busca] = VALORES_EXEMPLO['search']
+                if ordenacao:
+                    params[api_settings.ORDERING_PARAM] = ordenacao
+                shapes.append(('list', params))
+
+    if hasattr(view_class, 'changes'):
+        shapes.append(('changes', {}))
+        shapes.append(('changes', {'cursor': VALORES_EXEMPLO['cursor']}))
+    return shapes
+
+
+def shape_name(action, params):
+    query = urlencode(sorted(
+        (nome, valor.__name__ if callable(valor) else valor) for nome, valor in params.items()
+    ))
+    return f'{action}?{query}' if query else action
+
+
+def capture_plans(view_class, action, params, user, table='core_veiculo'):
+    """Executa a view e retorna o plano JSON de cada consulta sobre ``table``."""
+    valores = {nome: valor() if callable(valor) else valor for nome, valor in params.items()}
+    request = APIRequestFactory().get('/', valores)
+    force_authenticate(request, user=user)
+    view = view_class.as_view({'get': action}, throttle_classes=[])
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = view(request)
+    if response.status_code != 200:
+        raise AssertionError(f"{shape_name(action, params)} retornou {response.status_code}")
+
+    planos = []
+    with connection.cursor() as cursor:
+        # Planos paralelos dependem da máquina; desativá-los deixa o snapshot estável.
+        cursor.execute("SET max_parallel_workers_per_gather = 0")
+        try:
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or f'"{table}"' not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plano = cursor.fetchone()[0]
+                if isinstance(plano, str):
+                    plano = json.loads(plano)
+                planos.append(plano[0]['Plan'])
+        finally:
+            cursor.execute("RESET max_parallel_workers_per_gather")
+    return planos
+
+
+def normalize(node):
+    """Mantém apenas a estrutura do plano, sem custos nem estimativas."""
+    normalizado = {campo: node[campo] for campo in CAMPOS_NORMALIZADOS if campo in node}
+    if node['Node Type'] in ('Sort', 'Incremental Sort') and node['Plan Rows'] > MAX_SORT_ROWS:
+        normalizado['Large Sort'] = True
+    if node.get('Plans'):
+        normalizado['Plans'] = [normalize(filho) for filho in node['Plans']]
+    return normalizado
+
+
+def describe_difference(gravado, atual, caminho=''):
+    """
+    Descreve a primeira diferença entre dois planos normalizados, ou retorna
+    ``None`` quando são iguais.
+    """
+    if isinstance(gravado, dict) and isinstance(atual, dict):
+        for campo in sorted(set(gravado) | set(atual)):
+            diferenca = describe_difference(
+                gravado.get(campo), atual.get(campo), f'{caminho}.{campo}' if caminho else campo
+            )
+            if diferenca:
+                return diferenca
+        return None
+    if isinstance(gravado, list) and isinstance(atual, list) and len(gravado) == len(atual):
+        for posicao, (antes, depois) in enumerate(zip(gravado, atual)):
+            diferenca = describe_difference(antes, depois, f'{caminho}[{posicao}]')
+            if diferenca:
+                return diferenca
+        return None
+    if gravado != atual:
+        return f"{caminho or 'plano'}: {gravado!r} -> {atual!r}"
+    return None
+
+
+def seq_scan_key(params):
+    """Retorna a chave de ``SEQ_SCANS_PERMITIDOS`` correspondente aos parâmetros."""
+    if api_settings.SEARCH_PARAM in params:
+        return 'search'
+    filtros = [nome for nome in params if nome != api_settings.ORDERING_PARAM]
+    return filtros[0] if filtros else ''
+
+
+def _nodes(plano, pai=None):
+    yield plano, pai
+    for filho in plano.get('Plans', []):
+        yield from _nodes(filho, plano)
+
+
+def _problemas(planos, table):
+    seq_scans = large_sorts = 0
+    for plano in planos:
+        for node, pai in _nodes(plano):
+            # Logo abaixo de um Limit, sem ordenação, a leitura para ao
+            # completar a página.
+            if (
+                node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == table
+                and (pai is None or pai['Node Type'] != 'Limit')
+            ):
+                seq_scans += 1
+            if node.get('Large Sort'):
+                large_sorts += 1
+    return seq_scans, large_sorts
+
+
+def find_regressions(planos, seq_scan_permitido=False, table='core_veiculo'):
+    """
+    Descreve as regressões dos planos normalizados de uma combinação.
+
+    Um Seq Scan em ``table`` só é aceito com ``seq_scan_permitido``; uma
+    ordenação acima de ``MAX_SORT_ROWS`` linhas nunca é.
+    """
+    seq_scans, large_sorts = _problemas(planos, table)
+
+    regressoes = []
+    if seq_scans and not seq_scan_permitido:
+        regressoes.append(f"Seq Scan em {table} fora de SEQ_SCANS_PERMITIDOS")
+    if large_sorts:
+        regressoes.append(f"ordenação acima de {MAX_SORT_ROWS} linhas")
+    return regressoes
+
+
+def has_seq_scan(planos, table='core_veiculo'):
+    return _problemas(planos, table)[0] > 0
+
+
+def snapshot_path(view_class):
+    return os.path.join(SNAPSHOT_DIR, f'{view_class.__name__}.json')
+
+
+def load_snapshot(view_class):
+    try:
+        with open(snapshot_path(view_class)) as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return {}
+
+
+def save_snapshot(view_class, planos):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(snapshot_path(view_class), 'w') as arquivo:
+        json.dump(planos, arquivo, indent=2, sort_keys=True, ensure_ascii=False)
+        arquivo.write('\n')
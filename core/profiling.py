@@ -0,0 +1,224 @@
+"""
+Profiling amostral das requisições da API.
+
+Uma única thread por processo amostra, a cada ``PROFILER_INTERVAL_MS``, a
+pilha das threads que estão atendendo requisições monitoradas, sem
+instrumentar as chamadas de função. O ``ProfilingMiddleware`` registra
+também as consultas SQL da requisição e grava um ``RequestProfile`` quando
+ela passa de ``PROFILER_THRESHOLD_MS`` ou traz o cabeçalho
+``X-Profile-Token`` com o valor de ``PROFILER_TOKEN``, até
+``PROFILER_MAX_PER_MINUTE`` perfis por minuto em cada processo. Pelo limite
+de latência, apenas a fração ``PROFILER_SAMPLE_RATE`` das requisições é
+amostrada; as demais não pagam o custo do amostrador. Os perfis antigos são
+removidos pelo comando ``prune_request_profiles``.
+"""
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_PREFIXOS = sorted({os.path.join(p, '') for p in sys.path if p}, key=len, reverse=True)
+
+
+def _rotulo(code):
+    filename = code.co_filename
+    for prefixo in _PREFIXOS:
+        if filename.startswith(prefixo):
+            filename = filename[len(prefixo):]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+class Sampler:
+    """
+    Amostrador de pilhas das threads registradas.
+
+    A thread de amostragem é criada no primeiro registro e fica parada
+    enquanto nenhuma requisição está sendo perfilada.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._rotulos = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._sessions[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='core-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, thread_id):
+        """Encerra a amostragem da thread e retorna as pilhas coletadas."""
+        with self._lock:
+            return self._sessions.pop(thread_id, Counter())
+
+    def collapse(self, frame):
+        rotulos = []
+        while frame is not None:
+            code = frame.f_code
+            rotulo = self._rotulos.get(code)
+            if rotulo is None:
+                rotulo = self._rotulos[code] = _rotulo(code)
+            rotulos.append(rotulo)
+            frame = frame.f_back
+        return ';'.join(reversed(rotulos))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._wake.clear()
+            self._wake.wait()
+            time.sleep(settings.PROFILER_INTERVAL_MS / 1000)
+
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._sessions.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self.collapse(frame)] += 1
+            del frames
+
+
+sampler = Sampler()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` que mede o tempo de cada consulta da requisição."""
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.total = 0
+        self.tempo_ms = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = (time.perf_counter() - inicio) * 1000
+            self.total += 1
+            self.tempo_ms += duracao
+            if len(self.queries) < self.limite:
+                self.queries.append({'sql': sql, 'ms': round(duracao, 3)})
+
+
+class SaveQuota:
+    """
+    Limita a quantidade de perfis gravados por minuto no processo.
+
+    Evita que uma degradação geral, em que todas as requisições passam do
+    limite de latência, transforme cada requisição em uma escrita a mais.
+    """
+
+    def __init__(self):
+        self._minuto = None
+        self._gravados = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limite, agora):
+        """Retorna ``True`` se ainda há cota para gravar um perfil neste minuto."""
+        minuto = int(agora // 60)
+        with self._lock:
+            if minuto != self._minuto:
+                self._minuto = minuto
+                self._gravados = 0
+            self._gravados += 1
+            if self._gravados == limite + 1:
+                logger.warning("Limite de %s perfis por minuto atingido; descartando os demais", limite)
+            return self._gravados <= limite
+
+    def clear(self):
+        with self._lock:
+            self._minuto = None
+            self._gravados = 0
+
+
+quota = SaveQuota()
+
+
+def format_stacks(stacks):
+    """Converte as pilhas no formato collapsed, da mais amostrada para a menos."""
+    return '\n'.join(f'{pilha} {quantidade}' for pilha, quantidade in stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """
+    Perfila as requisições em ``PROFILER_PATHS`` acima do limite de latência
+    ou marcadas com o cabeçalho ``X-Profile-Token``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def solicitado(self, request):
+        token = request.headers.get('X-Profile-Token')
+        return bool(
+            token and settings.PROFILER_TOKEN
+            and hmac.compare_digest(token, settings.PROFILER_TOKEN)
+        )
+
+    def __call__(self, request):
+        solicitado = self.solicitado(request)
+        monitorado = (
+            settings.PROFILER_THRESHOLD_MS > 0
+            and request.path.startswith(tuple(settings.PROFILER_PATHS))
+            and random.random() < settings.PROFILER_SAMPLE_RATE
+        )
+        if not solicitado and not monitorado:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        queries = QueryRecorder(settings.PROFILER_MAX_QUERIES)
+        sampler.start(thread_id)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            stacks = sampler.stop(thread_id)
+        duracao = (time.perf_counter() - inicio) * 1000
+
+        if (
+            (solicitado or duracao >= settings.PROFILER_THRESHOLD_MS)
+            and quota.acquire(settings.PROFILER_MAX_PER_MINUTE, time.monotonic())
+        ):
+            try:
+                self.salvar(request, response, duracao, stacks, queries, solicitado)
+            except Exception:
+                logger.exception("Falha ao gravar o perfil de %s", request.path)
+        return response
+
+    def salvar(self, request, response, duracao, stacks, queries, solicitado):
+        from .models import RequestProfile
+
+        user = getattr(request, 'user', None)
+        RequestProfile.objects.create(
+            path=request.path[:200],
+            method=request.method,
+            status_code=response.status_code,
+            motivo=RequestProfile.TOKEN if solicitado else RequestProfile.LIMITE,
+            duracao_ms=round(duracao, 3),
+            intervalo_ms=settings.PROFILER_INTERVAL_MS,
+            amostras=sum(stacks.values()),
+            stacks=format_stacks(stacks),
+            total_queries=queries.total,
+            tempo_queries_ms=round(queries.tempo_ms, 3),
+            queries=queries.queries,
+            usuario=user if user is not None and user.is_authenticated else None,
+        )
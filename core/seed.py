@@ -0,0 +1,66 @@
+"""
+Geração de dados sintéticos de veículos para benchmarks e testes de carga.
+"""
+import random
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Marca, Veiculo
+from .serializers import MarcaSerializer
+
+CORES = ['Preto', 'Branco', 'Prata', 'Cinza', 'Vermelho', 'Azul', 'Verde', 'Amarelo']
+MODELOS = ['Sedan', 'Hatch', 'SUV', 'Picape', 'Coupé', 'Minivan', 'Perua', 'Conversível']
+
+
+def seed_veiculos(quantidade, seed=0, batch_size=5000, descricao_tamanho=0, dias=0):
+    """
+    Cria ``quantidade`` veículos aleatórios, distribuídos entre as marcas válidas.
+
+    As marcas que ainda não existem são criadas. ``descricao_tamanho`` define o
+    tamanho, em caracteres, da descrição de cada veículo. Com ``dias``, as
+    datas de criação são distribuídas pelos últimos ``dias`` dias, em ordem
+    crescente de id, como em uma tabela alimentada ao longo do tempo.
+    Retorna a lista de marcas usadas.
+    """
+    rng = random.Random(seed)
+    existentes = {marca.nome: marca for marca in Marca.objects.all()}
+    novas = [
+        Marca(nome=nome) for nome in MarcaSerializer.MARCAS_VALIDAS if nome not in existentes
+    ]
+    Marca.objects.bulk_create(novas)
+    marcas = list(Marca.objects.filter(nome__in=MarcaSerializer.MARCAS_VALIDAS))
+
+    descricao = 'x' * descricao_tamanho
+    agora = timezone.now()
+    passo = timedelta(days=dias) / quantidade if dias and quantidade else None
+    campo_created = Veiculo._meta.get_field('created')
+    # auto_now_add ignora o valor informado no bulk_create. Desligado durante a
+    # carga, created é gravado já na inserção; um UPDATE posterior deixaria
+    # uma versão morta de cada linha, que a transação da carga não limpa.
+    campo_created.auto_now_add = passo is None
+    try:
+        lote = []
+        for i in range(quantidade):
+            marca = rng.choice(marcas)
+            veiculo = Veiculo(
+                veiculo=f'{rng.choice(MODELOS)} {i}',
+                marca=marca,
+                # bulk_create não chama save(), que preenche o nome desnormalizado.
+                marca_nome=marca.nome,
+                ano=rng.randint(1960, 2024),
+                cor=rng.choice(CORES),
+                descricao=descricao,
+                vendido=rng.random() < 0.3,
+            )
+            if passo is not None:
+                veiculo.created = agora - (quantidade - 1 - i) * passo
+                veiculo.updated = veiculo.created
+            lote.append(veiculo)
+            if len(lote) >= batch_size:
+                Veiculo.objects.bulk_create(lote)
+                lote = []
+        Veiculo.objects.bulk_create(lote)
+    finally:
+        campo_created.auto_now_add = True
+    return marcas
@@ -2,12 +2,27 @@
 Serializers para a API de veículos.
 """
 from datetime import datetime
+from django.conf import settings
 from rest_framework import serializers
-from .models import Veiculo, Marca
+from .jobs import HANDLERS
+from .models import Job, RequestProfile, Veiculo, Marca
 from datetime import datetime
 
 
-class MarcaSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Permite restringir os campos do serializer pelo argumento ``fields``.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for nome in set(self.fields) - set(fields):
+                self.fields.pop(nome)
+
+
+class MarcaSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer para o modelo Marca."""
     
     MARCAS_VALIDAS = [
@@ -104,17 +119,15 @@ class MarcaSerializer(serializers.ModelSerializer):
         return matches / len(str2)
 
 
-class VeiculoSerializer(serializers.ModelSerializer):
+class VeiculoSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Veiculo focado em validação de dados.
     """
     
-    marca_nome = serializers.CharField(source='marca.nome', read_only=True)
-    
     class Meta:
         model = Veiculo
         fields = "__all__"
-        read_only_fields = ['id', 'created', 'updated']
+        read_only_fields = ['id', 'marca_nome', 'created', 'updated']
         
 
     def to_representation(self, instance):
@@ -128,3 +141,77 @@ class VeiculoSerializer(serializers.ModelSerializer):
             representation['updated'] = instance.updated.strftime('%Y-%m-%d %H:%M:%S')
         
         return representation
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer para submissão e acompanhamento de tarefas em segundo plano."""
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'tipo', 'status', 'payload', 'erro', 'tentativas',
+            'executar_em', 'iniciado', 'finalizado', 'created',
+        ]
+        read_only_fields = [
+            'id', 'status', 'erro', 'tentativas',
+            'executar_em', 'iniciado', 'finalizado', 'created',
+        ]
+
+    def validate_tipo(self, value):
+        """Valida se o tipo existe e se o usuário pode submetê-lo."""
+        if value not in HANDLERS:
+            raise serializers.ValidationError(
+                f"'{value}' não é um tipo de tarefa válido. "
+                f"Tipos disponíveis: {', '.join(sorted(HANDLERS))}"
+            )
+
+        permissao = HANDLERS[value].permissao
+        user = self.context['request'].user
+        if permissao and not user.has_perm(permissao):
+            raise serializers.ValidationError(
+                f"Você não tem permissão para executar '{value}'."
+            )
+
+        return value
+
+
+class BatchItemSerializer(serializers.Serializer):
+    """Uma sub-requisição do lote."""
+    method = serializers.ChoiceField(
+        choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET'
+    )
+    url = serializers.CharField()
+    body = serializers.JSONField(required=False, allow_null=True)
+
+    def validate_url(self, value):
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError("A URL deve começar com /api/.")
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Lista de sub-requisições executadas por /api/batch/."""
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f"Um lote pode ter no máximo {settings.BATCH_MAX_REQUESTS} requisições."
+            )
+        return value
+
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    """Serializer resumido para a listagem de perfis de requisições."""
+    usuario = serializers.StringRelatedField()
+
+    class Meta:
+        model = RequestProfile
+        exclude = ['stacks', 'queries']
+
+
+class RequestProfileDetailSerializer(RequestProfileSerializer):
+    """Inclui as consultas registradas; as pilhas são obtidas pelo download."""
+
+    class Meta(RequestProfileSerializer.Meta):
+        exclude = ['stacks']
@@ -0,0 +1,588 @@
+"""
+Snapshot colunar em memória do inventário ativo de veículos.
+
+Os veículos com ``excluido=False`` ficam em arrays NumPy ordenados por id,
+com marca e cor codificadas por dicionário. Os filtros por marca, ano,
+década, vendido e cor, a contagem e as facetas da listagem são respondidos
+com máscaras vetorizadas; apenas a página de resultados é lida do banco,
+com os mesmos filtros, e os veículos são listados em ordem de id (a
+listagem SQL sem ``?ordering=`` não define ordem; com ``?ordering=`` ela
+não passa pelo snapshot).
+
+Cada processo mantém o seu snapshot. Colunas e dicionários formam um
+``InventoryState`` imutável, substituído por inteiro a cada alteração. A
+cada ``INVENTORY_SNAPSHOT_REFRESH_SECONDS`` as alterações são aplicadas a
+partir do feed de ``changes_since``, relendo uma janela de
+``INVENTORY_SNAPSHOT_OVERLAP_SECONDS`` para cobrir transações confirmadas
+fora de ordem. Exclusões físicas não aparecem no feed: são aplicadas no
+próprio processo pelo sinal ``post_delete`` e, nos demais, quando uma página
+aponta veículos que não existem mais ou na recarga completa a cada
+``INVENTORY_SNAPSHOT_RELOAD_SECONDS``. A carga completa roda em segundo
+plano; até ela terminar, o estado anterior continua sendo usado e, na
+primeira carga, a listagem é respondida pelo SQL.
+"""
+import functools
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .changes import changes_since, encode_cursor
+from .facets import sort_facets
+from .filters import VeiculoFilter
+from .models import Veiculo
+
+logger = logging.getLogger(__name__)
+
+LOTE = 10000
+# Tamanho dos blocos da máscara percorridos para montar uma página.
+BLOCO = 65536
+
+# Filtros da listagem respondidos pelo snapshot. Qualquer outro parâmetro,
+# exceto os de PARAMETROS_LIVRES, faz a listagem ser respondida pelo SQL.
+FILTROS = {
+    'ano', 'ano__gte', 'ano__lte', 'decada', 'marca__in', 'marca_nome__in',
+    'cor__in', 'vendido', 'excluido',
+}
+PARAMETROS_LIVRES = {'page', 'page_size', 'fields', 'exclude', 'facets', 'format'}
+
+TIPOS = {
+    'ids': np.int64,
+    'marca': np.int16,
+    'ano': np.int32,
+    'cor': np.int32,
+    'vendido': np.bool_,
+    # Falso para veículos removidos desde a última recarga.
+    'ativo': np.bool_,
+}
+
+
+class ValueDictionary:
+    """Codifica valores em inteiros; os códigos nunca mudam nem são removidos."""
+
+    def __init__(self):
+        self.valores = []
+        self.codigos = {}
+
+    def __len__(self):
+        return len(self.valores)
+
+    def codigo(self, valor):
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = self.codigos[valor] = len(self.valores)
+            self.valores.append(valor)
+        return codigo
+
+    def copy(self):
+        copia = ValueDictionary()
+        copia.valores = list(self.valores)
+        copia.codigos = dict(self.codigos)
+        return copia
+
+    def mascara(self, coluna, valores):
+        """Retorna a máscara das posições de ``coluna`` com um dos ``valores``."""
+        codigos = {self.codigos[valor] for valor in valores if valor in self.codigos}
+        if len(codigos) <= 4:
+            # Poucas comparações custam menos que indexar uma tabela por código.
+            mascara = np.zeros(len(coluna), dtype=np.bool_)
+            for codigo in codigos:
+                mascara |= coluna == codigo
+            return mascara
+        tabela = np.zeros(len(self.valores), dtype=np.bool_)
+        tabela[list(codigos)] = True
+        return tabela[coluna]
+
+
+class InventoryColumns:
+    """Colunas do snapshot; nunca são alteradas depois de publicadas."""
+
+    def __init__(self, **colunas):
+        for nome in TIPOS:
+            setattr(self, nome, colunas[nome])
+
+    @classmethod
+    def from_lists(cls, **listas):
+        return cls(**{nome: np.array(listas[nome], dtype=tipo) for nome, tipo in TIPOS.items()})
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, nome).nbytes for nome in TIPOS)
+
+    def copy(self):
+        return InventoryColumns(**{nome: getattr(self, nome).copy() for nome in TIPOS})
+
+    def insert(self, posicoes, valores):
+        return InventoryColumns(**{
+            nome: np.insert(getattr(self, nome), posicoes, valores[nome]) for nome in TIPOS
+        })
+
+
+class InventoryQuery:
+    """Resultado de uma filtragem: o total, as páginas de ids e as facetas."""
+
+    def __init__(self, estado, mascara):
+        self.estado = estado
+        self.colunas = estado.colunas
+        self.mascara = mascara
+
+    @cached_property
+    def total(self):
+        return int(np.count_nonzero(self.mascara))
+
+    def slice(self, inicio, fim):
+        """Ids das posições ``[inicio, fim)`` do resultado, sem montar os demais."""
+        ids = []
+        vistos = 0
+        for bloco in range(0, len(self.mascara), BLOCO):
+            parte = self.mascara[bloco:bloco + BLOCO]
+            quantidade = int(np.count_nonzero(parte))
+            if vistos + quantidade > inicio:
+                posicoes = np.flatnonzero(parte)[max(inicio - vistos, 0):fim - vistos]
+                ids.extend(self.colunas.ids[posicoes + bloco].tolist())
+            vistos += quantidade
+            if vistos >= fim:
+                break
+        return ids
+
+    def facetas(self, nomes):
+        """Contagens no mesmo formato de ``compute_facets``."""
+        colunas, mascara = self.colunas, self.mascara
+        estado = self.estado
+        facets = {}
+        for nome in nomes:
+            if nome == 'marca':
+                contagens = np.bincount(colunas.marca[mascara], minlength=len(estado.marcas))
+                itens = []
+                for codigo in np.flatnonzero(contagens):
+                    marca = estado.marcas.valores[codigo]
+                    itens.append({
+                        'value': marca,
+                        'nome': estado.nomes_marca[marca],
+                        'count': int(contagens[codigo]),
+                    })
+            elif nome == 'decada':
+                decadas = colunas.ano[mascara] // 10
+                primeira = int(decadas.min()) if len(decadas) else 0
+                contagens = np.bincount(decadas - primeira)
+                itens = [
+                    {'value': (primeira + int(posicao)) * 10, 'count': int(contagens[posicao])}
+                    for posicao in np.flatnonzero(contagens)
+                ]
+            elif nome == 'vendido':
+                vendidos = int(np.count_nonzero(colunas.vendido & mascara))
+                itens = [
+                    {'value': valor, 'count': total}
+                    for valor, total in [(True, vendidos), (False, self.total - vendidos)] if total
+                ]
+            elif nome == 'cor':
+                contagens = np.bincount(colunas.cor[mascara], minlength=len(estado.cores))
+                itens = [
+                    {'value': estado.cores.valores[codigo], 'count': int(contagens[codigo])}
+                    for codigo in np.flatnonzero(contagens)
+                ]
+            facets[nome] = itens
+        return sort_facets(facets)
+
+
+class LazyResults:
+    """
+    Sequência dos veículos de uma consulta para o paginador.
+
+    Apenas a fatia solicitada é lida do banco, pelos ids, com o ``queryset``
+    filtrado da view. ``faltando`` lista os ids que não foram encontrados ou
+    não atendem mais aos filtros, ou seja, em que o snapshot está
+    desatualizado.
+    """
+
+    def __init__(self, consulta, queryset):
+        self.consulta = consulta
+        self.queryset = queryset
+        self.faltando = []
+
+    def __len__(self):
+        return self.consulta.total
+
+    def __getitem__(self, item):
+        inicio, fim, _ = item.indices(self.consulta.total)
+        ids = self.consulta.slice(inicio, fim)
+        por_id = self.queryset.in_bulk(ids)
+        self.faltando.extend(pk for pk in ids if pk not in por_id)
+        return [por_id[pk] for pk in ids if pk in por_id]
+
+
+class InventoryState:
+    """
+    Colunas e dicionários de uma versão do snapshot.
+
+    Nunca é alterado depois de publicado: as atualizações criam um novo
+    estado, de modo que uma consulta sempre vê colunas e dicionários
+    coerentes entre si.
+    """
+
+    def __init__(self, colunas, marcas, nomes_marca, cores):
+        self.colunas = colunas
+        self.marcas = marcas
+        self.nomes_marca = nomes_marca
+        self.cores = cores
+
+    @classmethod
+    def load(cls):
+        """Lê todos os veículos ativos do banco."""
+        marcas, nomes_marca, cores = ValueDictionary(), {}, ValueDictionary()
+        listas = {nome: [] for nome in TIPOS}
+        linhas = (
+            Veiculo.objects.filter(excluido=False).order_by('id')
+            .values_list('id', 'marca_id', 'marca_nome', 'ano', 'cor', 'vendido')
+        )
+        for pk, marca, marca_nome, ano, cor, vendido in linhas.iterator(chunk_size=LOTE):
+            nomes_marca[marca] = marca_nome
+            listas['ids'].append(pk)
+            listas['marca'].append(marcas.codigo(marca))
+            listas['ano'].append(ano)
+            listas['cor'].append(cores.codigo(cor))
+            listas['vendido'].append(vendido)
+        listas['ativo'] = [True] * len(listas['ids'])
+        return cls(InventoryColumns.from_lists(**listas), marcas, nomes_marca, cores)
+
+    def apply(self, veiculos):
+        """Retorna um novo estado com os ``veiculos``, ordenados por id, aplicados."""
+        marcas, nomes_marca, cores = self.marcas.copy(), dict(self.nomes_marca), self.cores.copy()
+        colunas = self.colunas
+        ids = np.array([veiculo.id for veiculo in veiculos], dtype=np.int64)
+        listas = {nome: [] for nome in TIPOS}
+        for veiculo in veiculos:
+            nomes_marca[veiculo.marca_id] = veiculo.marca_nome
+            listas['marca'].append(marcas.codigo(veiculo.marca_id))
+            listas['ano'].append(veiculo.ano)
+            listas['cor'].append(cores.codigo(veiculo.cor))
+            listas['vendido'].append(veiculo.vendido)
+            listas['ativo'].append(not veiculo.excluido)
+        listas['ids'] = ids
+        valores = {nome: np.array(lista, dtype=TIPOS[nome]) for nome, lista in listas.items()}
+
+        posicoes = np.searchsorted(colunas.ids, ids)
+        existentes = posicoes < len(colunas)
+        existentes[existentes] = colunas.ids[posicoes[existentes]] == ids[existentes]
+
+        # Cópia: as consultas em andamento continuam com o estado anterior.
+        novas = colunas.copy()
+        for nome in TIPOS:
+            getattr(novas, nome)[posicoes[existentes]] = valores[nome][existentes]
+
+        inseridos = ~existentes & valores['ativo']
+        if inseridos.any():
+            novas = novas.insert(
+                posicoes[inseridos], {nome: valores[nome][inseridos] for nome in TIPOS}
+            )
+        return InventoryState(novas, marcas, nomes_marca, cores)
+
+    def discard(self, ids):
+        """Retorna um novo estado sem os veículos ``ids``."""
+        colunas = self.colunas
+        ids = np.array(sorted(ids), dtype=np.int64)
+        posicoes = np.searchsorted(colunas.ids, ids)
+        existentes = posicoes < len(colunas)
+        existentes[existentes] = colunas.ids[posicoes[existentes]] == ids[existentes]
+        if not existentes.any():
+            return self
+        novas = colunas.copy()
+        novas.ativo[posicoes[existentes]] = False
+        return InventoryState(novas, self.marcas, self.nomes_marca, self.cores)
+
+
+class InventorySnapshot:
+    """Snapshot colunar dos veículos ativos, mantido por processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._geracao = 0
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._estado = None
+            # Recargas iniciadas antes de clear() são descartadas.
+            self._geracao += 1
+            self._recarga = None
+            self._removidos = set()
+            self._proxima_atualizacao = 0
+            self._proxima_recarga = 0
+            # Momento da última alteração aplicada e as alterações já vistas
+            # dentro da janela relida a cada atualização.
+            self._desde = None
+            self._vistos = {}
+
+    def schedule_refresh(self):
+        """Faz a próxima leitura aplicar as alterações pendentes."""
+        self._proxima_atualizacao = 0
+
+    def state(self):
+        """
+        Retorna o estado atual, aplicando as alterações pendentes quando
+        necessário, ou ``None`` enquanto a primeira carga não termina.
+        """
+        if time.monotonic() < self._proxima_atualizacao:
+            return self._estado
+
+        # Enquanto outra thread atualiza, as demais usam o estado atual.
+        if not self._lock.acquire(blocking=False):
+            return self._estado
+        try:
+            agora = time.monotonic()
+            if self._estado is None or agora >= self._proxima_recarga:
+                self._iniciar_recarga()
+            if self._estado is not None and agora >= self._proxima_atualizacao:
+                self._atualizar()
+                self._proxima_atualizacao = (
+                    time.monotonic() + settings.INVENTORY_SNAPSHOT_REFRESH_SECONDS
+                )
+            return self._estado
+        finally:
+            self._lock.release()
+
+    def columns(self):
+        estado = self.state()
+        return estado.colunas if estado is not None else None
+
+    def reload(self):
+        """Recarrega o snapshot por completo na thread atual."""
+        inicio = timezone.now()
+        estado = InventoryState.load()
+        with self._lock:
+            self._publicar(estado, inicio)
+            self._proxima_atualizacao = time.monotonic() + settings.INVENTORY_SNAPSHOT_REFRESH_SECONDS
+
+    def refresh(self):
+        """Aplica as alterações pendentes; retorna quantos veículos mudaram."""
+        with self._lock:
+            if self._estado is not None:
+                alterados = self._atualizar()
+                self._proxima_atualizacao = (
+                    time.monotonic() + settings.INVENTORY_SNAPSHOT_REFRESH_SECONDS
+                )
+                return alterados
+        self.reload()
+        return len(self._estado.colunas)
+
+    def _iniciar_recarga(self):
+        if self._recarga is not None:
+            return
+        self._proxima_recarga = time.monotonic() + settings.INVENTORY_SNAPSHOT_RELOAD_SECONDS
+        self._recarga = threading.Thread(
+            target=self._recarregar, args=(self._geracao,),
+            name='inventory-reload', daemon=True,
+        )
+        self._recarga.start()
+
+    def _recarregar(self, geracao):
+        estado = None
+        try:
+            inicio = timezone.now()
+            estado = InventoryState.load()
+        except Exception:
+            logger.exception("Falha ao recarregar o snapshot do inventário")
+        finally:
+            connection.close()
+
+        with self._lock:
+            if geracao != self._geracao:
+                return
+            self._recarga = None
+            if estado is not None:
+                self._publicar(estado, inicio)
+
+    def _publicar(self, estado, inicio):
+        # Exclusões físicas vistas durante a carga podem não estar nela.
+        if self._removidos:
+            estado = estado.discard(self._removidos)
+            self._removidos = set()
+        self._estado = estado
+        # A próxima leitura aplica as alterações feitas durante a carga.
+        self._desde = inicio
+        self._vistos = {}
+        self._proxima_atualizacao = 0
+        self._proxima_recarga = time.monotonic() + settings.INVENTORY_SNAPSHOT_RELOAD_SECONDS
+
+    def _atualizar(self):
+        janela = timedelta(seconds=settings.INVENTORY_SNAPSHOT_OVERLAP_SECONDS)
+        # Com id 0, o cursor inclui todas as alterações a partir do instante.
+        cursor = encode_cursor(self._desde - janela, 0)
+        queryset = Veiculo.objects.only('marca', 'marca_nome', 'ano', 'cor', 'vendido', 'excluido', 'updated')
+
+        alterados = {}
+        while True:
+            # A janela relida substitui a margem de segurança do feed.
+            veiculos, cursor, has_more = changes_since(cursor, LOTE, queryset, lag=0)
+            for veiculo in veiculos:
+                if self._vistos.get(veiculo.id) != veiculo.updated:
+                    alterados[veiculo.id] = veiculo
+                self._vistos[veiculo.id] = veiculo.updated
+                self._desde = max(self._desde, veiculo.updated)
+            if not has_more:
+                break
+
+        limite = self._desde - janela
+        self._vistos = {pk: updated for pk, updated in self._vistos.items() if updated >= limite}
+        if alterados:
+            self._estado = self._estado.apply(sorted(alterados.values(), key=lambda veiculo: veiculo.id))
+        return len(alterados)
+
+    def discard(self, ids):
+        """Remove do snapshot veículos excluídos fisicamente."""
+        if not ids:
+            return
+        with self._lock:
+            if self._recarga is not None:
+                self._removidos.update(ids)
+            if self._estado is not None:
+                self._estado = self._estado.discard(ids)
+
+    def remove(self, pk):
+        self.discard([pk])
+
+    def reconcile(self, ids, queryset):
+        """
+        Trata os ``ids`` que uma página não encontrou no ``queryset`` filtrado.
+
+        Os que não existem mais entre os veículos ativos são removidos; os
+        demais foram alterados e serão corrigidos pela próxima atualização
+        incremental.
+        """
+        existentes = set(queryset.filter(pk__in=ids).values_list('pk', flat=True))
+        self.discard([pk for pk in ids if pk not in existentes])
+        self.schedule_refresh()
+
+    def filter(self, filtros):
+        """
+        Aplica os filtros de ``parse_filters`` e retorna a consulta, ou
+        ``None`` se o snapshot ainda não foi carregado.
+        """
+        estado = self.state()
+        if estado is None:
+            return None
+        colunas = estado.colunas
+        mascara = colunas.ativo.copy()
+        for nome, valor in filtros.items():
+            if nome == 'excluido':
+                # A listagem já exclui os veículos com excluido=True.
+                if valor:
+                    mascara[:] = False
+            elif nome == 'vendido':
+                mascara &= colunas.vendido == valor
+            elif nome == 'ano':
+                mascara &= colunas.ano == int(valor)
+            elif nome == 'ano__gte':
+                mascara &= colunas.ano >= int(valor)
+            elif nome == 'ano__lte':
+                mascara &= colunas.ano <= int(valor)
+            elif nome == 'decada':
+                decada = int(valor) // 10 * 10
+                mascara &= (colunas.ano >= decada) & (colunas.ano < decada + 10)
+            elif nome == 'marca__in':
+                mascara &= estado.marcas.mascara(colunas.marca, [int(marca) for marca in valor])
+            elif nome == 'marca_nome__in':
+                nomes = {nome_marca.strip().upper() for nome_marca in valor}
+                marcas = [marca for marca, nome_marca in estado.nomes_marca.items() if nome_marca.upper() in nomes]
+                mascara &= estado.marcas.mascara(colunas.marca, marcas)
+            elif nome == 'cor__in':
+                mascara &= estado.cores.mascara(colunas.cor, valor)
+            else:
+                raise ValueError(f"Filtro não suportado pelo snapshot: {nome}")
+        return InventoryQuery(estado, mascara)
+
+    def decode(self):
+        """Retorna as colunas dos veículos ativos com os valores decodificados."""
+        estado = self.state()
+        colunas = estado.colunas
+        ativos = colunas.ativo
+        marcas = np.array(estado.marcas.valores, dtype=np.int64)
+        nomes = np.array([estado.nomes_marca[marca] for marca in estado.marcas.valores], dtype=object)
+        cores = np.array(estado.cores.valores, dtype=object)
+        codigos_marca = colunas.marca[ativos]
+        return {
+            'id': colunas.ids[ativos],
+            'marca': marcas[codigos_marca],
+            'marca_nome': nomes[codigos_marca],
+            'ano': colunas.ano[ativos],
+            'cor': cores[colunas.cor[ativos]],
+            'vendido': colunas.vendido[ativos],
+        }
+
+
+@functools.cache
+def _filter_form():
+    # Montar o FilterSet a cada requisição custa mais que a própria consulta.
+    return VeiculoFilter(queryset=Veiculo.objects.none()).form.__class__
+
+
+def parse_filters(params):
+    """
+    Converte os parâmetros da listagem nos filtros do snapshot.
+
+    Retorna ``None`` quando algum parâmetro não é suportado ou é inválido;
+    nesses casos a listagem é respondida pelo SQL, que também gera os erros.
+    """
+    if set(params) - FILTROS - PARAMETROS_LIVRES:
+        return None
+
+    form = _filter_form()(params)
+    if not form.is_valid():
+        return None
+    return {
+        nome: valor for nome, valor in form.cleaned_data.items()
+        if nome in FILTROS and valor not in (None, '', [])
+    }
+
+
+def check_consistency(snapshot, limite=10):
+    """
+    Compara o snapshot com uma leitura completa do banco.
+
+    Retorna a descrição de cada divergência, com até ``limite`` ids.
+    """
+    atual = snapshot.decode()
+    referencia = InventorySnapshot()
+    referencia.reload()
+    esperado = referencia.decode()
+
+    def descrever(mensagem, ids):
+        exemplos = ', '.join(str(pk) for pk in ids[:limite].tolist())
+        return f"{mensagem}: {len(ids)} veículos (ids {exemplos})"
+
+    divergencias = []
+    faltando = np.setdiff1d(esperado['id'], atual['id'])
+    if len(faltando):
+        divergencias.append(descrever("ausentes no snapshot", faltando))
+    sobrando = np.setdiff1d(atual['id'], esperado['id'])
+    if len(sobrando):
+        divergencias.append(descrever("inexistentes no banco", sobrando))
+
+    ids, posicoes_atual, posicoes_esperado = np.intersect1d(
+        atual['id'], esperado['id'], assume_unique=True, return_indices=True
+    )
+    for campo in ('marca', 'marca_nome', 'ano', 'cor', 'vendido'):
+        diferentes = atual[campo][posicoes_atual] != esperado[campo][posicoes_esperado]
+        if diferentes.any():
+            divergencias.append(descrever(f"{campo} diferente", ids[diferentes]))
+    return divergencias
+
+
+inventario = InventorySnapshot()
+
+
+@receiver(post_delete, sender=Veiculo)
+def remover_do_inventario(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: inventario.remove(pk))
@@ -1,19 +1,52 @@
 """
 Testes unitários para o app core.
 """
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_tracking.models import APIRequestLog
 from decimal import Decimal
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db.models import Count, Q, F
+from django.db.models.functions import Upper
 
 from .serializers import VeiculoSerializer, MarcaSerializer
-from .models import Veiculo, Marca
+from .models import APIRequestRollup, Job, RequestProfile, Veiculo, Marca
+from core import jobs, plans
+from core.profiling import quota as profiling_quota, sampler
+from core.seed import seed_veiculos
+from core.autocomplete import indice as autocomplete_index
+from core.changes import changes_since
+from core.filters import VeiculoFilter
+from core.snapshot import InventoryState, check_consistency, inventario
+from core.events import ChangeBroadcaster, events_app, broadcaster, format_event
+from core.log_filters import RedactQueryTokenFilter
+from core.throttling import CacheBucketSync, LocalBucketStore, TokenBucketThrottle
 from core.views import MarcaViewSet, VeiculoViewSet
 
 
@@ -372,3 +405,1853 @@ class IntegracaoTest(TestBase):
 
         toyota = next(f for f in fabricantes if f['marca__nome'] == 'TOYOTA')
         self.assertEqual(toyota['quantidade'], 1)
+
+
+@override_settings(CHANGES_SAFETY_LAG_SECONDS=0)
+class VeiculoChangeFeedTest(APITestCase):
+    """Testes para o feed incremental de alterações de veículos."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        VeiculoViewSet.permission_classes = [AllowAny]
+
+        self.marca = Marca.objects.create(nome="FORD")
+        self.focus = Veiculo.objects.create(marca=self.marca, veiculo="Focus", ano=2020)
+        self.fiesta = Veiculo.objects.create(marca=self.marca, veiculo="Fiesta", ano=2019)
+        self.url = reverse('veiculo-changes')
+
+    def test_feed_pagina_por_cursor(self):
+        """Testa que o cursor retoma a leitura de onde parou."""
+        response = self.client.get(self.url, {'limit': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([v['id'] for v in response.data['results']], [self.focus.id])
+        self.assertTrue(response.data['has_more'])
+
+        response = self.client.get(self.url, {'cursor': response.data['next_cursor']})
+        self.assertEqual([v['id'] for v in response.data['results']], [self.fiesta.id])
+        self.assertFalse(response.data['has_more'])
+
+    def test_feed_inclui_alterados_e_excluidos(self):
+        """Testa que alterações e exclusões lógicas aparecem após o cursor."""
+        cursor = self.client.get(self.url).data['next_cursor']
+
+        self.focus.delete()
+        response = self.client.get(self.url, {'cursor': cursor})
+
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], self.focus.id)
+        self.assertTrue(response.data['results'][0]['excluido'])
+
+    def test_feed_sem_juncao_com_marca(self):
+        """Testa que o feed usa o nome desnormalizado, sem ler core_marca."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['marca_nome'], 'FORD')
+        self.assertFalse(any('"core_marca"' in q['sql'] for q in ctx.captured_queries))
+
+    def test_feed_sem_alteracoes_mantem_cursor(self):
+        """Testa que o cursor é mantido quando não há novas alterações."""
+        cursor = self.client.get(self.url).data['next_cursor']
+        response = self.client.get(self.url, {'cursor': cursor})
+
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['next_cursor'], cursor)
+
+    def test_feed_cursor_invalido(self):
+        """Testa que um cursor malformado é rejeitado."""
+        response = self.client.get(self.url, {'cursor': 'invalido'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', response.data)
+
+
+class ChangeFeedTransactionsTest(TransactionTestCase):
+    """Testes do feed de alterações com transações concorrentes."""
+
+    def test_transacao_confirmada_depois_nao_e_pulada(self):
+        """Testa que uma alteração confirmada após outra mais recente não é perdida."""
+        marca = Marca.objects.create(nome="FORD")
+        agora = timezone.now()
+        gravado, confirmar = threading.Event(), threading.Event()
+        ids = {}
+
+        def transacao_lenta():
+            try:
+                with transaction.atomic():
+                    veiculo = Veiculo.objects.create(marca=marca, veiculo="Lento", ano=2020)
+                    Veiculo.objects.filter(pk=veiculo.pk).update(updated=agora - timedelta(seconds=30))
+                    ids['lento'] = veiculo.pk
+                    gravado.set()
+                    confirmar.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=transacao_lenta)
+        thread.start()
+        gravado.wait(10)
+
+        # Alteração mais recente, confirmada antes da transação lenta.
+        rapido = Veiculo.objects.create(marca=marca, veiculo="Rápido", ano=2021)
+        Veiculo.objects.filter(pk=rapido.pk).update(updated=agora - timedelta(seconds=20))
+
+        # Sem margem o cursor avançaria além da transação ainda aberta.
+        veiculos, cursor_sem_margem, _ = changes_since(lag=0)
+        self.assertEqual([v.id for v in veiculos], [rapido.id])
+
+        veiculos, cursor, _ = changes_since(lag=60)
+        self.assertEqual(veiculos, [])
+
+        confirmar.set()
+        thread.join()
+
+        veiculos, _, _ = changes_since(cursor_sem_margem, lag=0)
+        self.assertEqual(veiculos, [])
+        veiculos, _, _ = changes_since(cursor, lag=0)
+        self.assertEqual([v.id for v in veiculos], [ids['lento'], rapido.id])
+
+
+class ChangeEventsTest(TransactionTestCase):
+    """Testes para o canal de eventos via LISTEN/NOTIFY."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.marca = Marca.objects.create(nome="FORD")
+        self.outra_marca = Marca.objects.create(nome="TOYOTA")
+        self.broadcaster = ChangeBroadcaster()
+
+    def tearDown(self):
+        self.broadcaster.stop()
+        broadcaster.stop()
+
+    def test_eventos_respeitam_filtros(self):
+        """Testa que cada assinatura recebe apenas os eventos filtrados."""
+        async def cenario():
+            ford = self.broadcaster.subscribe(marcas={self.marca.id})
+            vendidos = self.broadcaster.subscribe(vendido=True)
+            self.broadcaster.wait_listening(5)
+
+            veiculo = await sync_to_async(Veiculo.objects.create)(
+                marca=self.marca, veiculo="Focus", ano=2020
+            )
+            await sync_to_async(Veiculo.objects.create)(
+                marca=self.outra_marca, veiculo="Corolla", ano=2021, vendido=True
+            )
+
+            evento_ford = await asyncio.wait_for(ford.queue.get(), 5)
+            evento_vendido = await asyncio.wait_for(vendidos.queue.get(), 5)
+            await sync_to_async(connections.close_all)()
+            return veiculo, evento_ford, evento_vendido, ford.queue.qsize()
+
+        veiculo, evento_ford, evento_vendido, pendentes = asyncio.run(cenario())
+
+        self.assertEqual(evento_ford['model'], 'veiculo')
+        self.assertEqual(evento_ford['op'], 'insert')
+        self.assertEqual(evento_ford['id'], veiculo.id)
+        self.assertEqual(evento_vendido['marca'], self.outra_marca.id)
+        self.assertEqual(pendentes, 0)
+
+    def test_notificacao_por_comando(self):
+        """Testa que um UPDATE em massa gera uma notificação por lote de linhas."""
+        Veiculo.objects.bulk_create(
+            Veiculo(marca=self.marca, marca_nome='FORD', veiculo=f'Ka {i}', ano=2010) for i in range(60)
+        )
+        conn = self.broadcaster._connect()
+        self.addCleanup(conn.close)
+
+        Veiculo.objects.update(vendido=True)
+        Veiculo.objects.bulk_create(
+            Veiculo(marca=self.marca, marca_nome='FORD', veiculo=f'Fiesta {i}', ano=2012) for i in range(1001)
+        )
+        for _ in range(50):
+            conn.poll()
+            if len(conn.notifies) >= 3:
+                break
+            time.sleep(0.1)
+        notificacoes = [json.loads(notify.payload) for notify in conn.notifies]
+
+        self.assertEqual([len(n['rows']) for n in notificacoes[:2]], [50, 10])
+        self.assertTrue(all(linha['vendido'] for n in notificacoes[:2] for linha in n['rows']))
+        self.assertEqual(notificacoes[2:], [{'model': 'veiculo', 'op': 'insert', 'count': 1001}])
+
+    def test_comando_grande_reinicia_assinaturas_do_modelo(self):
+        """Testa que uma notificação sem linhas leva apenas os clientes do modelo a ressincronizar."""
+        async def cenario():
+            veiculos = self.broadcaster.subscribe(model='veiculo')
+            marcas = self.broadcaster.subscribe(model='marca')
+            self.broadcaster.publish({'model': 'veiculo', 'op': 'update', 'count': 5000})
+            self.broadcaster.publish({'model': 'marca', 'op': 'update', 'rows': [
+                {'id': 1, 'nome': 'FORD', 'ativo': False},
+                {'id': 2, 'nome': 'TOYOTA', 'ativo': False},
+            ]})
+            await asyncio.sleep(0)
+            return veiculos.queue.get_nowait(), marcas.queue.qsize(), veiculos.queue.qsize()
+
+        reset, eventos_marca, pendentes = asyncio.run(cenario())
+        self.assertEqual(format_event(reset), b'event: reset\ndata: {}\n\n')
+        self.assertEqual(eventos_marca, 2)
+        self.assertEqual(pendentes, 0)
+
+    def test_fila_cheia_marca_assinatura(self):
+        """Testa que um cliente lento é marcado para ressincronizar."""
+        async def cenario():
+            assinatura = self.broadcaster.subscribe(model='marca', maxsize=1)
+            self.broadcaster.dispatch({'model': 'marca', 'id': 1, 'nome': 'FORD', 'ativo': True})
+            self.broadcaster.dispatch({'model': 'marca', 'id': 1, 'nome': 'FORD', 'ativo': False})
+            await asyncio.sleep(0)
+            return assinatura.overflowed
+
+        self.assertTrue(asyncio.run(cenario()))
+
+    def test_stream_sse_autenticado(self):
+        """Testa o endpoint ASGI de ponta a ponta."""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        user.user_permissions.add(Permission.objects.get(codename='view_marca'))
+        token = str(AccessToken.for_user(user))
+
+        async def cenario():
+            enviados = []
+            desconectar = asyncio.Event()
+
+            async def receive():
+                await desconectar.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                enviados.append(message)
+                if b'event: marca' in message.get('body', b''):
+                    desconectar.set()
+
+            scope = {
+                'type': 'http',
+                'method': 'GET',
+                'path': '/api/events/',
+                'query_string': f'token={token}&model=marca'.encode(),
+                'headers': [],
+            }
+            app = asyncio.ensure_future(events_app(scope, receive, send))
+            for _ in range(100):
+                if broadcaster.wait_listening(0):
+                    break
+                await asyncio.sleep(0.05)
+            await sync_to_async(Marca.objects.create)(nome="HONDA")
+            await asyncio.wait_for(app, 5)
+            await sync_to_async(connections.close_all)()
+            return enviados
+
+        enviados = asyncio.run(cenario())
+
+        self.assertEqual(enviados[0]['status'], 200)
+        corpo = b''.join(m.get('body', b'') for m in enviados[1:])
+        self.assertIn(b'"nome": "HONDA"', corpo)
+
+    def test_stream_sem_token(self):
+        """Testa que o endpoint exige autenticação."""
+        async def cenario():
+            enviados = []
+
+            async def send(message):
+                enviados.append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/api/events/',
+                     'query_string': b'', 'headers': []}
+            await events_app(scope, None, send)
+            return enviados
+
+        enviados = asyncio.run(cenario())
+        self.assertEqual(enviados[0]['status'], 401)
+
+    def _responder(self, query_string=b'', method='GET', headers=()):
+        async def cenario():
+            enviados = []
+
+            async def send(message):
+                enviados.append(message)
+
+            scope = {'type': 'http', 'method': method, 'path': '/api/events/',
+                     'query_string': query_string, 'headers': list(headers)}
+            await events_app(scope, None, send)
+            await sync_to_async(connections.close_all)()
+            return enviados[0]
+
+        return asyncio.run(cenario())
+
+    def test_stream_exige_permissao_de_leitura(self):
+        """Testa que cada modelo exige a permissão de leitura correspondente."""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        token = str(AccessToken.for_user(user))
+
+        self.assertEqual(self._responder(f'token={token}'.encode())['status'], 403)
+
+        user.user_permissions.add(Permission.objects.get(codename='view_marca'))
+        self.assertEqual(self._responder(f'token={token}&model=veiculo'.encode())['status'], 403)
+
+    @override_settings(CORS_ALLOW_ALL_ORIGINS=False, CORS_ALLOWED_ORIGINS=['http://localhost:8080'])
+    def test_cabecalhos_cors(self):
+        """Testa os cabeçalhos CORS, que o middleware do Django não aplica a este endpoint."""
+        inicio = self._responder(headers=[(b'origin', b'http://localhost:8080')])
+        self.assertEqual(inicio['status'], 401)
+        self.assertIn((b'access-control-allow-origin', b'http://localhost:8080'), inicio['headers'])
+
+        inicio = self._responder(headers=[(b'origin', b'http://outro.example')])
+        self.assertNotIn(b'access-control-allow-origin', dict(inicio['headers']))
+
+        inicio = self._responder(method='OPTIONS', headers=[(b'origin', b'http://localhost:8080')])
+        self.assertEqual(inicio['status'], 200)
+        self.assertIn(b'access-control-allow-headers', dict(inicio['headers']))
+
+    def test_token_mascarado_nos_logs(self):
+        """Testa que o token da URL não aparece nos logs de acesso."""
+        record = logging.LogRecord(
+            'uvicorn.access', logging.INFO, __file__, 0, '%s - "%s %s HTTP/%s" %d',
+            ('127.0.0.1:5000', 'GET', '/api/events/?model=marca&token=abc.def.ghi', '1.1', 200), None,
+        )
+        RedactQueryTokenFilter().filter(record)
+        self.assertEqual(
+            record.getMessage(), '127.0.0.1:5000 - "GET /api/events/?model=marca&token=*** HTTP/1.1" 200'
+        )
+
+
+class SparseFieldsetTest(APITestCase):
+    """Testes para a seleção de campos com ?fields= e ?exclude=."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        MarcaViewSet.permission_classes = [AllowAny]
+        VeiculoViewSet.permission_classes = [AllowAny]
+
+        self.marca = Marca.objects.create(nome="FORD")
+        self.veiculo = Veiculo.objects.create(
+            marca=self.marca,
+            veiculo="Focus",
+            ano=2020,
+            descricao="Carro seminovo"
+        )
+
+    def _select_veiculo(self, queries):
+        return next(
+            q['sql'] for q in queries
+            if q['sql'].startswith('SELECT') and 'FROM "core_veiculo"' in q['sql']
+            and 'COUNT(' not in q['sql']
+        )
+
+    def test_fields_restringe_payload_e_select(self):
+        """Testa que ?fields= reduz a resposta e as colunas consultadas."""
+        url = reverse('veiculo-list')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'fields': 'id,veiculo,marca_nome,ano'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'veiculo', 'marca_nome', 'ano'}
+        )
+        self.assertEqual(response.data['results'][0]['marca_nome'], 'FORD')
+
+        sql = self._select_veiculo(ctx.captured_queries)
+        self.assertNotIn('"descricao"', sql)
+        self.assertNotIn('"cor"', sql)
+
+    def test_exclude_remove_campos(self):
+        """Testa que ?exclude= remove campos e adia as colunas."""
+        url = reverse('veiculo-detail', args=[self.veiculo.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'exclude': 'descricao'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('descricao', response.data)
+        self.assertIn('veiculo', response.data)
+        self.assertNotIn('"descricao"', self._select_veiculo(ctx.captured_queries))
+
+    def test_campo_invalido(self):
+        """Testa que campos desconhecidos são rejeitados."""
+        url = reverse('marca-list')
+        response = self.client.get(url, {'fields': 'nome,inexistente'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+    def test_escrita_ignora_fields(self):
+        """Testa que operações de escrita retornam todos os campos."""
+        url = reverse('marca-list') + '?fields=id'
+        response = self.client.post(url, {'nome': 'TOYOTA'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('nome', response.data)
+
+
+class VeiculoFacetsTest(APITestCase):
+    """Testes para as contagens por faceta na listagem de veículos."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        VeiculoViewSet.permission_classes = [AllowAny]
+
+        self.ford = Marca.objects.create(nome="FORD")
+        self.toyota = Marca.objects.create(nome="TOYOTA")
+        Veiculo.objects.create(marca=self.ford, veiculo="Focus", ano=1995)
+        Veiculo.objects.create(marca=self.ford, veiculo="Fiesta", ano=2005, vendido=True)
+        Veiculo.objects.create(marca=self.toyota, veiculo="Corolla", ano=2008)
+        self.url = reverse('veiculo-list')
+
+    def test_facetas_em_uma_consulta(self):
+        """Testa que as facetas são calculadas em uma única consulta agrupada."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'facets': 'marca,decada,vendido'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        facets = response.data['facets']
+        self.assertEqual(facets['marca'], [
+            {'value': self.ford.id, 'nome': 'FORD', 'count': 2},
+            {'value': self.toyota.id, 'nome': 'TOYOTA', 'count': 1},
+        ])
+        self.assertEqual(facets['decada'], [
+            {'value': 1990, 'count': 1},
+            {'value': 2000, 'count': 2},
+        ])
+        self.assertEqual(facets['vendido'], [
+            {'value': False, 'count': 2},
+            {'value': True, 'count': 1},
+        ])
+
+        agrupadas = [q for q in ctx.captured_queries if 'GROUPING SETS' in q['sql']]
+        self.assertEqual(len(agrupadas), 1)
+
+    def test_facetas_respeitam_filtros_e_busca(self):
+        """Testa que as facetas usam os mesmos filtros da listagem."""
+        response = self.client.get(self.url, {
+            'facets': 'marca', 'vendido': 'false', 'search': 'o',
+        })
+
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [(f['nome'], f['count']) for f in response.data['facets']['marca']],
+            [('FORD', 1), ('TOYOTA', 1)]
+        )
+
+    def test_faceta_invalida(self):
+        """Testa que facetas desconhecidas são rejeitadas."""
+        response = self.client.get(self.url, {'facets': 'marca,inexistente'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('facets', response.data)
+
+
+class RollupAPILogsTest(TestCase):
+    """Testes para a consolidação e retenção dos logs de requisições."""
+
+    def _log(self, requested_at, response_ms, status_code=200):
+        return APIRequestLog.objects.create(
+            requested_at=requested_at,
+            response_ms=response_ms,
+            path='/api/veiculo/',
+            view='core.views.VeiculoViewSet',
+            view_method='list',
+            remote_addr='127.0.0.1',
+            host='localhost',
+            method='GET',
+            status_code=status_code,
+        )
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        hora = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.antiga = hora - timedelta(days=10)
+        self.recente = hora - timedelta(hours=1)
+
+        for ms in (10, 20, 30, 40):
+            self._log(self.antiga + timedelta(minutes=ms), ms)
+        self._log(self.recente + timedelta(minutes=5), 100, status_code=500)
+        self._log(self.recente + timedelta(minutes=6), 300)
+        self.atual = self._log(timezone.now(), 50)
+
+    def test_agrega_por_hora_e_endpoint(self):
+        """Testa a agregação horária com contagens e percentis."""
+        call_command('rollup_api_logs', stdout=StringIO())
+
+        antiga = APIRequestRollup.objects.get(hora=self.antiga)
+        self.assertEqual(antiga.total, 4)
+        self.assertEqual(antiga.erros, 0)
+        self.assertEqual(antiga.media_ms, 25)
+        self.assertEqual(antiga.p50_ms, 25)
+        self.assertEqual(antiga.max_ms, 40)
+
+        recente = APIRequestRollup.objects.get(hora=self.recente)
+        self.assertEqual(recente.total, 2)
+        self.assertEqual(recente.erros, 1)
+        self.assertEqual(recente.view, 'core.views.VeiculoViewSet')
+
+        # A hora corrente ainda não está completa.
+        self.assertEqual(APIRequestRollup.objects.count(), 2)
+
+    def test_remove_apenas_registros_expirados(self):
+        """Testa que apenas os registros além da retenção são removidos."""
+        call_command('rollup_api_logs', '--batch-size', '3', stdout=StringIO())
+
+        self.assertFalse(APIRequestLog.objects.filter(requested_at__lt=self.recente).exists())
+        self.assertEqual(APIRequestLog.objects.count(), 3)
+
+    def test_execucao_idempotente(self):
+        """Testa que rodar novamente não duplica os agregados."""
+        call_command('rollup_api_logs', '--retention-days', '30', stdout=StringIO())
+        self._log(self.recente + timedelta(minutes=30), 200)
+        call_command('rollup_api_logs', '--retention-days', '30', stdout=StringIO())
+
+        self.assertEqual(APIRequestRollup.objects.count(), 2)
+        self.assertEqual(APIRequestRollup.objects.get(hora=self.recente).total, 3)
+
+
+class JobAPITest(APITestCase):
+    """Testes para a fila de tarefas em segundo plano."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.user.user_permissions.add(
+            Permission.objects.get(codename='view_veiculo'),
+            Permission.objects.get(codename='add_veiculo'),
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.marca = Marca.objects.create(nome="FORD")
+        Veiculo.objects.create(marca=self.marca, veiculo="Focus", ano=1995)
+        Veiculo.objects.create(marca=self.marca, veiculo="Fiesta", ano=2005, vendido=True)
+
+        self.export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.export_dir.cleanup)
+
+    def _submeter(self, tipo, payload=None):
+        response = self.client.post(
+            reverse('job-list'), {'tipo': tipo, 'payload': payload or {}}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_estatisticas_em_segundo_plano(self):
+        """Testa a submissão, execução e consulta do resultado."""
+        job_id = self._submeter('estatisticas')
+
+        response = self.client.get(reverse('job-resultado', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        call_command('run_jobs', '--once', stdout=StringIO())
+
+        response = self.client.get(reverse('job-detail', args=[job_id]))
+        self.assertEqual(response.data['status'], Job.CONCLUIDO)
+
+        response = self.client.get(reverse('job-resultado', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['nao_vendidos'], 1)
+        self.assertEqual(response.data['ultima_semana'], 2)
+
+    def test_exportacao_gera_arquivo(self):
+        """Testa que a exportação gera um CSV disponível para download."""
+        with override_settings(JOBS_EXPORT_DIR=self.export_dir.name):
+            job_id = self._submeter('exportar_veiculos')
+            call_command('run_jobs', '--once', stdout=StringIO())
+            response = self.client.get(reverse('job-resultado', args=[job_id]))
+
+            conteudo = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        linhas = conteudo.strip().splitlines()
+        self.assertEqual(len(linhas), 3)
+        self.assertIn('Focus', conteudo)
+
+    def test_exportacao_sem_arquivo(self):
+        """Testa que o download de uma exportação removida retorna 410."""
+        with override_settings(JOBS_EXPORT_DIR=self.export_dir.name):
+            job_id = self._submeter('exportar_veiculos')
+            call_command('run_jobs', '--once', stdout=StringIO())
+            os.remove(jobs.export_path(Job.objects.get(pk=job_id)))
+            response = self.client.get(reverse('job-resultado', args=[job_id]))
+
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_importacao_reporta_erros(self):
+        """Testa a importação com itens válidos e inválidos."""
+        job_id = self._submeter('importar_veiculos', {'veiculos': [
+            {'marca': self.marca.id, 'veiculo': 'Ka', 'ano': 2010},
+            {'marca': 999, 'veiculo': 'Inválido', 'ano': 2010},
+        ]})
+        call_command('run_jobs', '--once', stdout=StringIO())
+
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual(job.resultado['importados'], 1)
+        self.assertIn('1', job.resultado['erros'])
+        self.assertTrue(Veiculo.objects.filter(veiculo='Ka').exists())
+
+    def test_tipo_invalido_ou_sem_permissao(self):
+        """Testa a validação do tipo e da permissão do usuário."""
+        response = self.client.post(reverse('job-list'), {'tipo': 'inexistente'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.user.user_permissions.clear()
+        self.user = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('job-list'), {'tipo': 'importar_veiculos'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_usuario_ve_apenas_suas_tarefas(self):
+        """Testa que a listagem retorna apenas as tarefas do usuário."""
+        outro = User.objects.create_user(username='outro', password='testpass123')
+        Job.objects.create(tipo='estatisticas', usuario=outro)
+        self._submeter('estatisticas')
+
+        response = self.client.get(reverse('job-list'))
+        self.assertEqual(response.data['count'], 1)
+
+    def test_falha_reagenda_ate_limite(self):
+        """Testa que tarefas com erro são reagendadas e depois marcadas como falhas."""
+        @jobs.register('falha')
+        def falha(job):
+            raise RuntimeError("erro")
+        self.addCleanup(jobs.HANDLERS.pop, 'falha')
+
+        job = Job.objects.create(tipo='falha')
+        for _ in range(3):
+            jobs.run(jobs.claim())
+            Job.objects.filter(pk=job.pk).update(executar_em=timezone.now())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FALHOU)
+        self.assertEqual(job.tentativas, 3)
+        self.assertIn('RuntimeError', job.erro)
+
+    def test_resultado_descartado_sem_reserva(self):
+        """Testa que um worker cuja reserva expirou não sobrescreve a nova execução."""
+        @jobs.register('interrompida')
+        def interrompida(job):
+            Job.objects.filter(pk=job.pk).update(reservado_ate=timezone.now() - timedelta(seconds=1))
+            jobs.requeue_stale()
+            self.assertEqual(jobs.claim().pk, job.pk)
+            return {'worker': 'antigo'}
+        self.addCleanup(jobs.HANDLERS.pop, 'interrompida')
+
+        job = Job.objects.create(tipo='interrompida')
+        jobs.run(jobs.claim())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.EXECUTANDO)
+        self.assertEqual(job.tentativas, 2)
+        self.assertIsNone(job.resultado)
+
+    def test_requeue_apenas_com_reserva_expirada(self):
+        """Testa que só voltam à fila tarefas com reserva expirada, dentro do limite."""
+        agora = timezone.now()
+        ativa = Job.objects.create(
+            tipo='estatisticas', status=Job.EXECUTANDO, tentativas=1,
+            iniciado=agora - timedelta(hours=2), reservado_ate=agora + timedelta(seconds=30),
+        )
+        expirada = Job.objects.create(
+            tipo='estatisticas', status=Job.EXECUTANDO, tentativas=1,
+            iniciado=agora - timedelta(minutes=2), reservado_ate=agora - timedelta(seconds=1),
+        )
+        esgotada = Job.objects.create(
+            tipo='estatisticas', status=Job.EXECUTANDO, tentativas=settings.JOBS_MAX_ATTEMPTS,
+            iniciado=agora - timedelta(minutes=2), reservado_ate=agora - timedelta(seconds=1),
+        )
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+
+        for job in (ativa, expirada, esgotada):
+            job.refresh_from_db()
+        self.assertEqual(ativa.status, Job.EXECUTANDO)
+        self.assertEqual(expirada.status, Job.PENDENTE)
+        self.assertEqual(esgotada.status, Job.FALHOU)
+        self.assertIsNotNone(esgotada.finalizado)
+
+
+@override_settings(JOBS_LEASE_SECONDS=0.3)
+class JobHeartbeatTest(TransactionTestCase):
+    """Testes para a renovação da reserva durante a execução."""
+
+    def test_reserva_renovada_durante_execucao(self):
+        """Testa que a reserva é estendida enquanto a tarefa executa."""
+        reservas = []
+
+        @jobs.register('lenta')
+        def lenta(job):
+            reservas.append(Job.objects.get(pk=job.pk).reservado_ate)
+            time.sleep(0.5)
+            reservas.append(Job.objects.get(pk=job.pk).reservado_ate)
+            self.assertEqual(jobs.requeue_stale(), 0)
+            return {}
+        self.addCleanup(jobs.HANDLERS.pop, 'lenta')
+
+        Job.objects.create(tipo='lenta')
+        job = jobs.claim()
+        jobs.run(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.CONCLUIDO)
+        self.assertGreater(reservas[1], reservas[0])
+
+
+class MarcaNomeDesnormalizadoTest(APITestCase):
+    """Testes para o nome da marca desnormalizado em Veiculo."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        VeiculoViewSet.permission_classes = [AllowAny]
+
+        self.ford = Marca.objects.create(nome="FORD")
+        self.toyota = Marca.objects.create(nome="TOYOTA")
+        self.focus = Veiculo.objects.create(marca=self.ford, veiculo="Focus", ano=2020)
+        self.corolla = Veiculo.objects.create(marca=self.toyota, veiculo="Corolla", ano=2021)
+
+    def test_nome_preenchido_ao_salvar(self):
+        """Testa que o nome é preenchido na criação e na troca de marca."""
+        self.assertEqual(self.focus.marca_nome, 'FORD')
+
+        focus = Veiculo.objects.get(pk=self.focus.pk)
+        focus.marca = self.toyota
+        focus.save()
+        focus.refresh_from_db()
+        self.assertEqual(focus.marca_nome, 'TOYOTA')
+
+    def test_nome_gravado_com_update_fields(self):
+        """Testa que a troca de marca com update_fields também grava o nome."""
+        focus = Veiculo.objects.get(pk=self.focus.pk)
+        focus.marca = self.toyota
+        focus.save(update_fields=['marca'])
+        self.assertEqual(Veiculo.objects.get(pk=self.focus.pk).marca_nome, 'TOYOTA')
+
+    def test_renomear_marca_propaga_nome(self):
+        """Testa que renomear a marca atualiza os veículos em lotes."""
+        Veiculo.objects.create(marca=self.ford, veiculo="Fiesta", ano=2019)
+        marca = Marca.objects.get(pk=self.ford.pk)
+        marca.nome = 'FORD MOTOR'
+        marca.save()
+
+        self.assertEqual(
+            Veiculo.objects.filter(marca=self.ford, marca_nome='FORD MOTOR').count(), 2
+        )
+        self.assertEqual(Veiculo.objects.get(pk=self.corolla.pk).marca_nome, 'TOYOTA')
+
+    def test_falha_na_propagacao_desfaz_renomeacao(self):
+        """Testa que a marca não é renomeada quando a propagação falha."""
+        marca = Marca.objects.get(pk=self.ford.pk)
+        marca.nome = 'FORD MOTOR'
+        with mock.patch.object(Marca, 'propagar_nome', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                marca.save()
+
+        self.assertEqual(Marca.objects.get(pk=self.ford.pk).nome, 'FORD')
+        self.assertEqual(Veiculo.objects.get(pk=self.focus.pk).marca_nome, 'FORD')
+
+    def test_backfill_termina_com_marca_sem_nome(self):
+        """Testa que o preenchimento da migração termina e é idempotente."""
+        migracao = importlib.import_module('core.migrations.0008_preencher_marca_nome')
+        sem_nome = Marca.objects.create(nome='')
+        Veiculo.objects.create(marca=sem_nome, veiculo="Genérico", ano=2000)
+        Veiculo.objects.update(marca_nome='')
+
+        with connection.schema_editor() as editor:
+            for _ in range(2):
+                migracao.preencher_marca_nome(django_apps, editor)
+
+        self.assertEqual(Veiculo.objects.get(pk=self.focus.pk).marca_nome, 'FORD')
+        self.assertEqual(Veiculo.objects.get(pk=self.corolla.pk).marca_nome, 'TOYOTA')
+        self.assertEqual(Veiculo.objects.filter(marca=sem_nome, marca_nome='').count(), 1)
+
+    def test_busca_e_ordenacao_sem_join(self):
+        """Testa que busca e ordenação por marca consultam apenas core_veiculo."""
+        url = reverse('veiculo-list')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'search': 'toyota', 'ordering': '-marca__nome'})
+
+        self.assertEqual([v['id'] for v in response.data['results']], [self.corolla.id])
+        self.assertEqual(response.data['results'][0]['marca_nome'], 'TOYOTA')
+        for query in ctx.captured_queries:
+            if 'FROM "core_veiculo"' in query['sql']:
+                self.assertNotIn('JOIN', query['sql'])
+
+        response = self.client.get(url, {'ordering': '-marca__nome'})
+        self.assertEqual(
+            [v['marca_nome'] for v in response.data['results']], ['TOYOTA', 'FORD']
+        )
+
+
+class DirtyFieldsTest(APITestCase):
+    """Testes para a gravação apenas dos campos alterados."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        VeiculoViewSet.permission_classes = [AllowAny]
+
+        self.marca = Marca.objects.create(nome="FORD")
+        self.veiculo = Veiculo.objects.create(
+            marca=self.marca, veiculo="Focus", ano=2020, descricao="x" * 1000
+        )
+
+    def updates(self, ctx):
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_save_sem_alteracao_nao_grava(self):
+        """Testa que save() sem alterações não executa UPDATE."""
+        veiculo = Veiculo.objects.get(pk=self.veiculo.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            veiculo.save()
+        self.assertEqual(self.updates(ctx), [])
+
+    def test_save_grava_apenas_campos_alterados(self):
+        """Testa que o UPDATE contém apenas o campo alterado e a data de atualização."""
+        veiculo = Veiculo.objects.get(pk=self.veiculo.pk)
+        veiculo.vendido = True
+        with CaptureQueriesContext(connection) as ctx:
+            veiculo.save()
+
+        sql, = self.updates(ctx)
+        self.assertIn('"vendido"', sql)
+        self.assertIn('"updated"', sql)
+        self.assertNotIn('"descricao"', sql)
+        self.assertNotIn('"veiculo" =', sql)
+        self.assertTrue(Veiculo.objects.get(pk=self.veiculo.pk).vendido)
+
+        with CaptureQueriesContext(connection) as ctx:
+            veiculo.save()
+        self.assertEqual(self.updates(ctx), [])
+
+    def test_update_fields_explicito_mantem_demais_alteracoes(self):
+        """Testa que campos fora de update_fields continuam pendentes."""
+        veiculo = Veiculo.objects.get(pk=self.veiculo.pk)
+        veiculo.vendido = True
+        veiculo.cor = 'Azul'
+        veiculo.save(update_fields=['vendido'])
+        self.assertEqual(veiculo.get_dirty_fields(), ['cor'])
+
+        veiculo.save()
+        self.assertEqual(Veiculo.objects.get(pk=self.veiculo.pk).cor, 'Azul')
+
+    def test_patch_sem_alteracao_nao_grava(self):
+        """Testa que um PATCH com os mesmos valores não altera a linha."""
+        url = reverse('veiculo-detail', kwargs={'pk': self.veiculo.pk})
+        updated = Veiculo.objects.get(pk=self.veiculo.pk).updated
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(url, {'ano': 2020}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(
+            'UPDATE "core_veiculo"' in q['sql'] for q in ctx.captured_queries
+        ))
+        self.assertEqual(Veiculo.objects.get(pk=self.veiculo.pk).updated, updated)
+
+    def test_exclusao_grava_apenas_flag(self):
+        """Testa que a exclusão lógica grava apenas excluido e updated."""
+        url = reverse('veiculo-detail', kwargs={'pk': self.veiculo.pk})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.delete(url)
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        sql, = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_veiculo"')]
+        self.assertIn('"excluido"', sql)
+        self.assertNotIn('"descricao"', sql)
+        self.assertTrue(Veiculo.objects.get(pk=self.veiculo.pk).excluido)
+
+
+@override_settings(BATCH_MAX_WORKERS=1)
+class BatchRequestTest(APITestCase):
+    """Testes para o endpoint de requisições em lote."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('batch')
+
+        self.marca = Marca.objects.create(nome="FORD")
+        self.veiculo = Veiculo.objects.create(marca=self.marca, veiculo="Focus", ano=2020)
+
+    def test_lote_retorna_respostas_em_ordem(self):
+        """Testa que cada sub-requisição é executada e respondida na ordem enviada."""
+        response = self.client.post(self.url, {'requests': [
+            {'url': '/api/user-info/'},
+            {'url': f'/api/veiculo/{self.veiculo.id}/?fields=id,veiculo'},
+            {'method': 'POST', 'url': '/api/veiculo/',
+             'body': {'veiculo': 'Fiesta', 'marca': self.marca.id, 'ano': 2019}},
+            {'url': '/api/veiculo/?ordering=ano'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        usuario, detalhe, criado, lista = response.data['responses']
+        self.assertEqual(usuario['body']['username'], 'testuser')
+        self.assertEqual(detalhe['body'], {'id': self.veiculo.id, 'veiculo': 'Focus'})
+        self.assertEqual(criado['status'], status.HTTP_201_CREATED)
+        # A escrita é concluída antes das leituras seguintes.
+        self.assertEqual(
+            [v['veiculo'] for v in lista['body']['results']], ['Fiesta', 'Focus']
+        )
+
+    def test_erros_sao_retornados_por_item(self):
+        """Testa que falhas de uma sub-requisição não afetam as demais."""
+        response = self.client.post(self.url, {'requests': [
+            {'url': '/api/inexistente/'},
+            {'method': 'POST', 'url': '/api/veiculo/', 'body': {'veiculo': 'Sem marca'}},
+            {'url': '/api/batch/'},
+            {'url': '/api/marca/'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = [item['status'] for item in response.data['responses']]
+        self.assertEqual(statuses, [404, 400, 400, 200])
+        self.assertIn('marca', response.data['responses'][1]['body'])
+
+    def test_logs_gravados_de_uma_vez(self):
+        """Testa que os logs das sub-requisições são inseridos em uma única consulta."""
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(self.url, {'requests': [
+                {'url': '/api/veiculo/'},
+                {'url': '/api/marca/'},
+                {'url': f'/api/veiculo/{self.veiculo.id}/'},
+            ]}, format='json')
+
+        inserts = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith(f'INSERT INTO "{APIRequestLog._meta.db_table}"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(APIRequestLog.objects.count(), 3)
+        self.assertEqual(
+            set(APIRequestLog.objects.values_list('path', flat=True)),
+            {'/api/veiculo/', '/api/marca/', f'/api/veiculo/{self.veiculo.id}/'},
+        )
+
+    async def test_lote_sob_asgi_preserva_esquema(self):
+        """Testa que, sob ASGI, as sub-requisições geram links com o esquema original."""
+        await sync_to_async(Veiculo.objects.bulk_create)([
+            Veiculo(marca=self.marca, marca_nome=self.marca.nome, veiculo=f"Modelo {i}", ano=2000)
+            for i in range(settings.REST_FRAMEWORK['PAGE_SIZE'])
+        ])
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+
+        response = await self.async_client.post(
+            self.url, {'requests': [{'url': '/api/veiculo/'}, {'url': '/api/user-info/'}]},
+            content_type='application/json', secure=True,
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lista, usuario = response.json()['responses']
+        self.assertEqual(lista['status'], status.HTTP_200_OK)
+        self.assertTrue(lista['body']['next'].startswith('https://testserver/api/veiculo/'))
+        self.assertEqual(usuario['body']['username'], 'testuser')
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_validacao_do_lote(self):
+        """Testa os limites e a autenticação do lote."""
+        response = self.client.post(self.url, {'requests': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            self.url, {'requests': [{'url': '/api/marca/'}] * 3}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            self.url, {'requests': [{'url': 'https://exemplo.com/'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=None)
+        response = self.client.post(self.url, {'requests': [{'url': '/api/marca/'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(BATCH_MAX_WORKERS=4)
+class BatchParallelTest(TransactionTestCase):
+    """Testes para a execução paralela das leituras do lote."""
+
+    def test_leituras_em_paralelo(self):
+        """Testa que leituras consecutivas rodam em threads com suas próprias conexões."""
+        user = User.objects.create_superuser(username='testuser', password='testpass123')
+        marca = Marca.objects.create(nome="FORD")
+        veiculos = [
+            Veiculo.objects.create(marca=marca, veiculo=f"Modelo {i}", ano=2000 + i)
+            for i in range(4)
+        ]
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        response = client.post(reverse('batch'), {'requests': [
+            {'url': f'/api/veiculo/{veiculo.id}/'} for veiculo in veiculos
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['body']['veiculo'] for item in response.data['responses']],
+            [veiculo.veiculo for veiculo in veiculos],
+        )
+        self.assertEqual(APIRequestLog.objects.count(), 4)
+
+
+class VeiculoAutocompleteTest(APITestCase):
+    """Testes para o autocompletar de nomes de veículos."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        autocomplete_index.clear()
+        self.url = reverse('veiculo-autocomplete')
+
+        self.ford = Marca.objects.create(nome="FORD")
+        self.fiat = Marca.objects.create(nome="FIAT")
+        for nome, marca in [
+            ("Focus", self.ford), ("Focus", self.ford), ("Fiesta", self.ford),
+            ("Fiorino", self.fiat), ("Fiorino", self.fiat), ("Fiorino", self.fiat),
+            ("Ka", self.ford), ("FIESTA", self.fiat),
+        ]:
+            Veiculo.objects.create(marca=marca, veiculo=nome, ano=2020)
+        Veiculo.objects.create(marca=self.ford, veiculo="Fusion", ano=2015, excluido=True)
+
+    def test_sugestoes_com_contagens(self):
+        """Testa os nomes distintos, ordenados pela quantidade de veículos."""
+        response = self.client.get(self.url, {'q': 'f'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'veiculo': 'Fiorino', 'count': 3},
+            {'veiculo': 'Focus', 'count': 2},
+            {'veiculo': 'FIESTA', 'count': 1},
+            {'veiculo': 'Fiesta', 'count': 1},
+        ])
+
+        response = self.client.get(self.url, {'q': 'fi', 'marca': self.ford.id, 'limit': 5})
+        self.assertEqual(response.data['results'], [{'veiculo': 'Fiesta', 'count': 1}])
+
+        response = self.client.get(self.url, {'q': 'F', 'limit': 1})
+        self.assertEqual(response.data['results'], [{'veiculo': 'Fiorino', 'count': 3}])
+
+    def test_cache_evita_consultas(self):
+        """Testa que, com o cache carregado, a sugestão não consulta o banco."""
+        self.client.get(self.url, {'q': 'fo'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'q': 'fi'})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertFalse(any('core_veiculo' in q['sql'] for q in ctx.captured_queries))
+        self.assertFalse(APIRequestLog.objects.filter(path=self.url).exists())
+
+    def test_cache_vencido_servido_durante_recarga(self):
+        """Testa que, enquanto outra thread recarrega, o cache vencido é usado."""
+        self.client.get(self.url, {'q': 'fi'})
+        Veiculo.objects.create(marca=self.fiat, veiculo="Fiat 147", ano=1980)
+        autocomplete_index._expira = time.monotonic() - 1
+
+        with autocomplete_index._lock, CaptureQueriesContext(connection) as ctx:
+            antigas = autocomplete_index.complete('fiat')
+        self.assertEqual(antigas, [])
+        self.assertFalse(any('core_veiculo' in q['sql'] for q in ctx.captured_queries))
+
+        self.assertEqual(autocomplete_index.complete('fiat'), [{'veiculo': 'Fiat 147', 'count': 1}])
+
+    @override_settings(AUTOCOMPLETE_CACHE_MAX_NAMES=2)
+    def test_consulta_ao_banco_usa_indice(self):
+        """Testa o resultado e o índice de prefixo quando os nomes não cabem no cache."""
+        response = self.client.get(self.url, {'q': 'fi', 'marca': self.fiat.id})
+        self.assertEqual(response.data['results'], [
+            {'veiculo': 'Fiorino', 'count': 3},
+            {'veiculo': 'FIESTA', 'count': 1},
+        ])
+
+        queryset = Veiculo.objects.filter(excluido=False).annotate(
+            nome_upper=Upper('veiculo')
+        ).filter(nome_upper__startswith='FI')
+        sql, params = queryset.query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plano = '\n'.join(linha[0] for linha in cursor.fetchall())
+        self.assertIn('core_veiculo_nome_prefix_idx', plano)
+
+    def test_parametros_invalidos(self):
+        """Testa a validação dos parâmetros."""
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'q': 'f', 'marca': 'ford'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class VeiculoRegistrosTest(APITestCase):
+    """Testes para os filtros por período e as contagens por dia ou semana."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        marca = Marca.objects.create(nome="FORD")
+        tz = timezone.get_current_timezone()
+        self.datas = [
+            datetime(2024, 3, 4, 10, tzinfo=tz),   # segunda-feira
+            datetime(2024, 3, 4, 23, tzinfo=tz),
+            datetime(2024, 3, 6, 8, tzinfo=tz),
+            datetime(2024, 3, 12, 9, tzinfo=tz),
+        ]
+        self.veiculos = []
+        for i, created in enumerate(self.datas):
+            veiculo = Veiculo.objects.create(marca=marca, veiculo=f"Modelo {i}", ano=2020, vendido=i == 0)
+            Veiculo.objects.filter(pk=veiculo.pk).update(created=created)
+            self.veiculos.append(veiculo)
+        self.url = reverse('veiculo-registros')
+
+    def test_filtros_por_periodo(self):
+        """Testa created__gte e created__lt na listagem."""
+        response = self.client.get(reverse('veiculo-list'), {
+            'created__gte': '2024-03-04T12:00:00-03:00',
+            'created__lt': '2024-03-12T00:00:00-03:00',
+        })
+        self.assertEqual(
+            {v['id'] for v in response.data['results']},
+            {self.veiculos[1].id, self.veiculos[2].id},
+        )
+
+    def test_contagem_por_dia(self):
+        """Testa os totais diários, com zero nos dias sem cadastros."""
+        response = self.client.get(self.url, {'inicio': '2024-03-03', 'fim': '2024-03-06'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(str(r['periodo']), r['total']) for r in response.data['results']],
+            [('2024-03-03', 0), ('2024-03-04', 2), ('2024-03-05', 0), ('2024-03-06', 1)],
+        )
+
+        response = self.client.get(self.url, {'inicio': '2024-03-04', 'fim': '2024-03-04', 'vendido': 'true'})
+        self.assertEqual(response.data['results'][0]['total'], 1)
+
+    def test_contagem_por_semana(self):
+        """Testa os totais semanais, começando na segunda-feira."""
+        response = self.client.get(self.url, {
+            'inicio': '2024-03-06', 'fim': '2024-03-18', 'intervalo': 'semana',
+        })
+        self.assertEqual(str(response.data['inicio']), '2024-03-04')
+        self.assertEqual(
+            [(str(r['periodo']), r['total']) for r in response.data['results']],
+            [('2024-03-04', 3), ('2024-03-11', 1), ('2024-03-18', 0)],
+        )
+
+    def test_parametros_invalidos(self):
+        """Testa a validação do intervalo e do período."""
+        for params in [
+            {'intervalo': 'mes'},
+            {'inicio': '04/03/2024'},
+            {'inicio': '2024-03-10', 'fim': '2024-03-01'},
+            {'inicio': '2020-01-01', 'fim': '2024-01-01'},
+        ]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+class VeiculoFilterTest(APITestCase):
+    """Testes para os filtros por ano, década, marca e cor da listagem."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('veiculo-list')
+
+        self.toyota = Marca.objects.create(nome="TOYOTA")
+        self.honda = Marca.objects.create(nome="HONDA")
+        self.ford = Marca.objects.create(nome="FORD", ativo=False)
+        self.corolla = Veiculo.objects.create(marca=self.toyota, veiculo="Corolla", ano=2015, cor="Prata")
+        self.civic = Veiculo.objects.create(marca=self.honda, veiculo="Civic", ano=2020, cor="Preto")
+        self.fit = Veiculo.objects.create(marca=self.honda, veiculo="Fit", ano=2009, cor="Branco")
+        self.ka = Veiculo.objects.create(marca=self.ford, veiculo="Ka", ano=2018, cor="Preto")
+
+    def ids(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {v['id'] for v in response.data['results']}
+
+    def test_ano_e_decada(self):
+        """Testa o intervalo de anos e o filtro por década."""
+        self.assertEqual(
+            self.ids({'ano__gte': 2015, 'ano__lte': 2018}),
+            {self.corolla.id, self.ka.id},
+        )
+        self.assertEqual(self.ids({'decada': 2000}), {self.fit.id})
+        self.assertEqual(self.ids({'decada': 2015}), {self.corolla.id, self.ka.id})
+
+    def test_marcas_e_cores(self):
+        """Testa os filtros de múltiplos valores combinados."""
+        self.assertEqual(
+            self.ids({'marca__in': f'{self.toyota.id},{self.honda.id}', 'ano__gte': 2015, 'ano__lte': 2020}),
+            {self.corolla.id, self.civic.id},
+        )
+        self.assertEqual(self.ids({'marca_nome__in': 'toyota, Ford'}), {self.corolla.id, self.ka.id})
+        self.assertEqual(self.ids({'cor__in': 'Preto,Prata'}), {self.corolla.id, self.civic.id, self.ka.id})
+
+        response = self.client.get(self.url, {'marca__in': 'toyota'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_apenas_marcas_ativas(self):
+        """Testa o filtro de marcas ativas."""
+        self.assertEqual(
+            self.ids({'marca_ativa': 'true'}),
+            {self.corolla.id, self.civic.id, self.fit.id},
+        )
+        self.assertEqual(self.ids({'marca_ativa': 'false'}), {self.ka.id})
+
+    def test_nome_da_marca_sem_distincao_de_maiusculas(self):
+        """Testa que o filtro por nome não depende da caixa do nome gravado."""
+        Veiculo.objects.filter(pk=self.fit.pk).update(marca_nome='Honda')
+        self.assertEqual(self.ids({'marca_nome__in': 'HONDA'}), {self.civic.id, self.fit.id})
+
+
+class VeiculoAdminTest(TestCase):
+    """Testes para a administração de veículos em tabelas grandes."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:core_veiculo_changelist')
+
+        self.ford = Marca.objects.create(nome="FORD")
+        self.focus = Veiculo.objects.create(marca=self.ford, veiculo="Focus", ano=2015)
+        self.fiesta = Veiculo.objects.create(marca=self.ford, veiculo="Fiesta", ano=2008)
+        self.ka = Veiculo.objects.create(marca=self.ford, veiculo="Ka", ano=2019)
+
+    def test_listagem_sem_contagem_exata(self):
+        """Testa que, acima do limite, a listagem usa a estimativa e não COUNT(*)."""
+        with override_settings(ADMIN_EXACT_COUNT_LIMIT=0), \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Focus')
+        veiculo_queries = [q['sql'] for q in ctx.captured_queries if '"core_veiculo"' in q['sql']]
+        self.assertFalse(any('COUNT(' in sql for sql in veiculo_queries))
+        self.assertFalse(any('JOIN' in sql for sql in veiculo_queries))
+
+    def test_filtro_por_decada_e_busca(self):
+        """Testa o filtro de década e a busca por prefixo."""
+        response = self.client.get(self.url, {'decada': '2010'})
+        self.assertEqual(
+            {v.pk for v in response.context['cl'].result_list}, {self.focus.pk, self.ka.pk}
+        )
+
+        response = self.client.get(self.url, {'q': 'fi'})
+        self.assertEqual([v.pk for v in response.context['cl'].result_list], [self.fiesta.pk])
+
+    def test_acoes_em_lote(self):
+        """Testa as ações em lote com um único UPDATE e sem a exclusão padrão."""
+        response = self.client.get(self.url)
+        acoes = [nome for nome, _ in response.context['action_form'].fields['action'].choices]
+        self.assertNotIn('delete_selected', acoes)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(self.url, {
+                'action': 'excluir_selecionados',
+                '_selected_action': [self.focus.pk, self.ka.pk],
+            })
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_veiculo"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            set(Veiculo.objects.filter(excluido=True).values_list('pk', flat=True)),
+            {self.focus.pk, self.ka.pk},
+        )
+        self.assertGreater(Veiculo.objects.get(pk=self.ka.pk).updated, self.ka.updated)
+
+        self.client.post(self.url, {'action': 'marcar_vendidos', '_selected_action': [self.fiesta.pk]})
+        self.assertTrue(Veiculo.objects.get(pk=self.fiesta.pk).vendido)
+
+    def test_busca_usa_indice_de_prefixo(self):
+        """Testa que a busca do admin por prefixo pode usar o índice funcional."""
+        queryset = Veiculo.objects.filter(veiculo__istartswith='fi')
+        sql, params = queryset.query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plano = '\n'.join(linha[0] for linha in cursor.fetchall())
+        self.assertIn('core_veiculo_nome_prefix_idx', plano)
+
+
+@override_settings(INVENTORY_SNAPSHOT_ENABLED=True, INVENTORY_SNAPSHOT_REFRESH_SECONDS=0)
+class InventorySnapshotTest(APITestCase):
+    """Testes para a listagem respondida pelo snapshot colunar do inventário."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('veiculo-list')
+
+        VeiculoViewSet.permission_classes = [AllowAny]
+        inventario.clear()
+
+        self.marcas = seed_veiculos(300, seed=7)
+        self.excluido = Veiculo.objects.order_by('id').first()
+        self.excluido.excluido = True
+        self.excluido.save()
+        # A carga em segundo plano não enxerga a transação do teste.
+        inventario.reload()
+
+    def tearDown(self):
+        inventario.clear()
+
+    def listar(self, params, snapshot=True):
+        with self.settings(INVENTORY_SNAPSHOT_ENABLED=snapshot):
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_mesmo_resultado_do_sql(self):
+        """Testa que total, veículos e facetas coincidem com a consulta SQL."""
+        marcas = f'{self.marcas[0].id},{self.marcas[1].id}'
+        for params in [
+            {},
+            {'marca__in': marcas, 'ano__gte': 1990, 'ano__lte': 2010},
+            {'marca_nome__in': self.marcas[2].nome.lower(), 'vendido': 'true'},
+            {'cor__in': 'Preto,Prata', 'decada': 1980},
+            {'ano': 2000},
+            {'excluido': 'true'},
+        ]:
+            filtro = VeiculoFilter(params, queryset=Veiculo.objects.filter(excluido=False))
+            ids = list(filtro.qs.order_by('id').values_list('id', flat=True))
+            params['facets'] = 'marca,decada,vendido,cor'
+            esperado = self.listar(params, snapshot=False)
+            atual = self.listar({**params, 'page': 2} if len(ids) > 20 else params)
+
+            self.assertEqual(atual['count'], len(ids), params)
+            # O snapshot lista em ordem de id.
+            pagina = ids[20:40] if len(ids) > 20 else ids
+            self.assertEqual([v['id'] for v in atual['results']], pagina, params)
+            self.assertEqual(atual['facets'], esperado['facets'], params)
+
+    def test_contagem_e_facetas_sem_sql(self):
+        """Testa que apenas a página de veículos é lida do banco."""
+        self.listar({})
+        with self.settings(INVENTORY_SNAPSHOT_REFRESH_SECONDS=60):
+            inventario.refresh()
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.listar({'ano__gte': 2000, 'facets': 'marca,cor', 'fields': 'id,ano'})
+
+        self.assertTrue(all(v['ano'] >= 2000 for v in data['results']))
+        consultas = [q['sql'] for q in ctx.captured_queries if '"core_veiculo"' in q['sql']]
+        self.assertEqual(len(consultas), 1)
+        self.assertNotIn('COUNT(', consultas[0])
+
+    def test_atualizacao_incremental(self):
+        """Testa que inclusões, alterações e exclusões lógicas chegam ao snapshot."""
+        self.listar({})
+        marca = self.marcas[0]
+        novo = Veiculo.objects.create(marca=marca, veiculo="Novo", ano=1950, cor="Rosa")
+        alterado = Veiculo.objects.filter(excluido=False).order_by('id')[5]
+        alterado.ano = 1950
+        alterado.save()
+        self.excluido.excluido = False
+        self.excluido.save()
+        removido = Veiculo.objects.filter(excluido=False).order_by('-id')[1]
+        removido.excluido = True
+        removido.save()
+
+        data = self.listar({'ano': 1950})
+        self.assertEqual({v['id'] for v in data['results']}, {novo.id, alterado.id})
+        self.assertEqual(self.listar({'cor__in': 'Rosa'})['count'], 1)
+        self.assertEqual(check_consistency(inventario), [])
+
+    def test_exclusao_fisica(self):
+        """Testa as exclusões no próprio processo e as feitas por outro processo."""
+        total = self.listar({})['count']
+        veiculo = Veiculo.objects.filter(excluido=False).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            veiculo.delete()
+        self.assertEqual(self.listar({})['count'], total - 1)
+
+        # Exclusão que o snapshot não vê: a página volta ao SQL e o veículo sai do snapshot.
+        primeiro = Veiculo.objects.filter(excluido=False).order_by('id').first()
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_veiculo WHERE id = %s', [primeiro.id])
+        self.assertEqual(check_consistency(inventario), [
+            f"inexistentes no banco: 1 veículos (ids {primeiro.id})",
+        ])
+        self.assertEqual(self.listar({})['count'], total - 2)
+        self.assertEqual(check_consistency(inventario), [])
+
+    def test_pagina_desatualizada_usa_sql(self):
+        """Testa que um veículo alterado fora do snapshot não é listado com filtros que não atende mais."""
+        with self.settings(INVENTORY_SNAPSHOT_REFRESH_SECONDS=60):
+            inventario.refresh()
+            params = {'ano__gte': 2000}
+            alterado = Veiculo.objects.get(pk=self.listar(params)['results'][0]['id'])
+            alterado.ano = 1950
+            alterado.save()
+
+            esperado = self.listar(params, snapshot=False)
+            data = self.listar(params)
+            self.assertEqual(data['count'], esperado['count'])
+            self.assertNotIn(alterado.id, [v['id'] for v in data['results']])
+
+            # A próxima leitura aplica a alteração e volta ao snapshot.
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.listar(params)
+            self.assertEqual(data['count'], esperado['count'])
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+
+    def test_parametros_nao_suportados(self):
+        """Testa que busca, ordenação e filtros inválidos usam o SQL."""
+        self.listar({})
+        with CaptureQueriesContext(connection) as ctx:
+            self.listar({'search': 'Sedan'})
+            self.listar({'ordering': 'ano'})
+        self.assertEqual(sum('COUNT(' in q['sql'] for q in ctx.captured_queries), 2)
+
+        response = self.client.get(self.url, {'marca__in': 'ford'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_api_sem_numpy(self):
+        """Testa que a API é importada sem o NumPy enquanto o snapshot está desativado."""
+        codigo = (
+            "import sys; sys.modules['numpy'] = None\n"
+            "import django; django.setup()\n"
+            "from django.urls import resolve; resolve('/api/veiculo/')\n"
+            "assert 'core.snapshot' not in sys.modules\n"
+        )
+        resultado = subprocess.run(
+            [sys.executable, '-c', codigo], capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'},
+        )
+        self.assertEqual(resultado.returncode, 0, resultado.stderr)
+
+    def test_comando_de_verificacao(self):
+        """Testa a verificação de consistência pelo comando."""
+        out = StringIO()
+        call_command('check_inventory_snapshot', stdout=out)
+        self.assertIn('consistente', out.getvalue())
+
+
+@override_settings(INVENTORY_SNAPSHOT_ENABLED=True, INVENTORY_SNAPSHOT_REFRESH_SECONDS=0)
+class InventorySnapshotReloadTest(TransactionTestCase):
+    """Testes para a recarga completa do snapshot em segundo plano."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='testuser', password='testpass123'))
+        self.url = reverse('veiculo-list')
+        VeiculoViewSet.permission_classes = [AllowAny]
+        inventario.clear()
+        self.addCleanup(inventario.clear)
+        seed_veiculos(50, seed=7)
+
+    def test_recarga_nao_bloqueia_a_listagem(self):
+        """Testa que o estado anterior é servido até a recarga terminar."""
+        with self.settings(INVENTORY_SNAPSHOT_RELOAD_SECONDS=0):
+            inventario.reload()
+        ultimo = Veiculo.objects.order_by('id').last()
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_veiculo WHERE id = %s', [ultimo.id])
+
+        liberar = threading.Event()
+        carregar = InventoryState.load
+
+        def carga_lenta():
+            liberar.wait(5)
+            return carregar()
+
+        with mock.patch.object(InventoryState, 'load', side_effect=carga_lenta):
+            response = self.client.get(self.url)
+            recarga = inventario._recarga
+            self.assertEqual(response.data['count'], 50)
+            self.assertIsNotNone(recarga)
+            liberar.set()
+            recarga.join(5)
+
+        self.assertEqual(self.client.get(self.url).data['count'], 49)
+
+
+class PlanRegressionTest(TestCase):
+    """Testes de regressão dos planos de execução das listagens de veículos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='testuser', password='testpass123')
+        with connection.cursor() as cursor:
+            # Linhas mortas deixadas pelos testes anteriores mudam os custos
+            # estimados; com a tabela recriada, os planos não dependem da
+            # ordem de execução. O TRUNCATE é desfeito ao fim da classe.
+            cursor.execute('TRUNCATE core_veiculo, core_marca RESTART IDENTITY CASCADE')
+        seed_veiculos(plans.SEED_ROWS, dias=plans.SEED_DAYS)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_marca')
+            cursor.execute('ANALYZE core_veiculo')
+
+    def test_planos_sem_regressao(self):
+        """Testa cada combinação de filtro, busca e ordenação contra o snapshot e a lista de permitidos."""
+        snapshot = plans.load_snapshot(VeiculoViewSet)
+        atualizar = os.environ.get('UPDATE_PLAN_SNAPSHOTS') == '1'
+
+        atuais, falhas, usadas = {}, [], set()
+        for action, params in plans.query_shapes(VeiculoViewSet):
+            nome = plans.shape_name(action, params)
+            atuais[nome] = [
+                plans.normalize(plano)
+                for plano in plans.capture_plans(VeiculoViewSet, action, params, self.user)
+            ]
+            chave = plans.seq_scan_key(params)
+            if plans.has_seq_scan(atuais[nome]):
+                usadas.add(chave)
+            if not atualizar:
+                if nome not in snapshot:
+                    falhas.append(f"{nome}: sem snapshot")
+                else:
+                    diferenca = plans.describe_difference(snapshot[nome], atuais[nome])
+                    if diferenca:
+                        falhas.append(f"{nome}: plano mudou em {diferenca}")
+            for regressao in plans.find_regressions(
+                atuais[nome], chave in plans.SEQ_SCANS_PERMITIDOS
+            ):
+                falhas.append(f"{nome}: {regressao}")
+
+        for chave in set(plans.SEQ_SCANS_PERMITIDOS) - usadas:
+            falhas.append(f"SEQ_SCANS_PERMITIDOS[{chave!r}]: nenhuma combinação faz Seq Scan")
+
+        if atualizar:
+            plans.save_snapshot(VeiculoViewSet, atuais)
+        self.assertFalse(
+            falhas,
+            "Regressões de plano (corrija a consulta, justifique em SEQ_SCANS_PERMITIDOS "
+            "ou regenere o snapshot com UPDATE_PLAN_SNAPSHOTS=1):\n"
+            + "\n".join(falhas),
+        )
+
+    def test_periodo_usa_indice_de_created_apos_atualizacoes(self):
+        """Testa que o período usa o índice de created mesmo após atualizações fora do HOT."""
+        queryset = Veiculo.objects.filter(
+            excluido=False, created__gte=timezone.now() - timedelta(days=7)
+        )
+        sql, params = queryset.query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            # ano é indexado: as novas versões das linhas vão para o fim da tabela.
+            cursor.execute('UPDATE core_veiculo SET ano = ano + 1 WHERE id % 5 = 0')
+            cursor.execute('ANALYZE core_veiculo')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plano = '\n'.join(linha[0] for linha in cursor.fetchall())
+            transaction.set_rollback(True)
+        self.assertIn('core_veiculo_created_idx', plano)
+
+    def test_filtros_usam_indices(self):
+        """Testa, nos dados de exemplo e sem desligar o Seq Scan, o índice de cada filtro."""
+        marcas = plans.duas_marcas()
+        Marca.objects.filter(pk=marcas.split(',')[0]).update(ativo=False)
+        for params, indice in [
+            ({'ano__gte': 2015, 'ano__lte': 2020}, 'core_veiculo_ano_idx'),
+            ({'decada': 2010}, 'core_veiculo_ano_idx'),
+            ({'marca__in': marcas}, 'core_veiculo_marca_ano_idx'),
+            ({'marca__in': marcas, 'ano__gte': 2015}, 'core_veiculo_marca_ano_idx'),
+            ({'marca_nome__in': 'toyota,honda'}, 'core_veiculo_marca_upper_idx'),
+            ({'marca_ativa': 'false'}, 'core_veiculo_marca_ano_idx'),
+        ]:
+            filterset = VeiculoFilter(params, queryset=Veiculo.objects.filter(excluido=False))
+            self.assertTrue(filterset.is_valid(), filterset.errors)
+            sql, sql_params = filterset.qs.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN {sql}', sql_params)
+                plano = '\n'.join(linha[0] for linha in cursor.fetchall())
+            self.assertIn(indice, plano, params)
+
+    def test_detecta_regressoes(self):
+        """Testa que Seq Scans não permitidos e ordenações grandes são apontados."""
+        indice = {'Node Type': 'Index Scan', 'Relation Name': 'core_veiculo'}
+        seq_scan = {'Node Type': 'Seq Scan', 'Relation Name': 'core_veiculo'}
+        pagina = {'Node Type': 'Limit', 'Plans': [seq_scan]}
+        sort = {'Node Type': 'Sort', 'Plan Rows': plans.MAX_SORT_ROWS + 1, 'Plans': [indice]}
+
+        self.assertEqual(plans.find_regressions([indice]), [])
+        self.assertEqual(plans.find_regressions([pagina]), [])
+        self.assertEqual(
+            plans.find_regressions([seq_scan]),
+            ['Seq Scan em core_veiculo fora de SEQ_SCANS_PERMITIDOS'],
+        )
+        self.assertEqual(plans.find_regressions([seq_scan], seq_scan_permitido=True), [])
+        self.assertEqual(
+            plans.find_regressions([plans.normalize(sort)], seq_scan_permitido=True),
+            [f'ordenação acima de {plans.MAX_SORT_ROWS} linhas'],
+        )
+        self.assertIsNone(plans.describe_difference([pagina], [pagina]))
+        self.assertEqual(
+            plans.describe_difference([pagina], [{'Node Type': 'Limit', 'Plans': [indice]}]),
+            "[0].Plans[0].Node Type: 'Seq Scan' -> 'Index Scan'",
+        )
+        self.assertEqual(plans.seq_scan_key({'ano': '2015', 'ordering': 'ano'}), 'ano')
+        self.assertEqual(plans.seq_scan_key({'ano': '2015', 'search': 'ford'}), 'search')
+        self.assertEqual(plans.seq_scan_key({'ordering': 'ano'}), '')
+
+    def test_filtros_sem_exemplo_sao_rejeitados(self):
+        """Testa que um filtro novo exige um valor de exemplo para o snapshot."""
+        class ViewComFiltroNovo(VeiculoViewSet):
+            filterset_class = None
+            filterset_fields = ['veiculo', 'cor']
+
+        with self.assertRaisesMessage(ValueError, 'cor'):
+            plans.query_shapes(ViewComFiltroNovo)
+
+
+@override_settings(PROFILER_TOKEN='token-de-profiling', PROFILER_INTERVAL_MS=1, PROFILER_SAMPLE_RATE=1.0)
+class RequestProfileTest(APITestCase):
+    """Testes para o profiling amostral de requisições."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+        marca = Marca.objects.create(nome="FORD")
+        Veiculo.objects.create(marca=marca, veiculo="Focus", ano=2020)
+        self.url = reverse('veiculo-list')
+        profiling_quota.clear()
+
+    def test_cabecalho_solicita_profiling(self):
+        """Testa que o cabeçalho com o token grava o perfil com as consultas."""
+        response = self.client.get(self.url, HTTP_X_PROFILE_TOKEN='token-de-profiling')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.path, self.url)
+        self.assertEqual(profile.motivo, RequestProfile.TOKEN)
+        self.assertEqual(profile.usuario, self.user)
+        self.assertGreater(profile.total_queries, 0)
+        self.assertTrue(any('core_veiculo' in q['sql'] for q in profile.queries))
+
+        self.client.get(self.url, HTTP_X_PROFILE_TOKEN='outro-token')
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_limite_de_latencia(self):
+        """Testa que apenas requisições acima do limite são gravadas."""
+        with override_settings(PROFILER_THRESHOLD_MS=60000):
+            self.client.get(self.url)
+        self.assertFalse(RequestProfile.objects.exists())
+
+        with override_settings(PROFILER_THRESHOLD_MS=1, PROFILER_PATHS=['/api/veiculo/']):
+            self.client.get(self.url)
+            self.client.get(reverse('marca-list'))
+        self.assertEqual(
+            list(RequestProfile.objects.values_list('path', 'motivo')),
+            [(self.url, RequestProfile.LIMITE)],
+        )
+
+    @override_settings(PROFILER_THRESHOLD_MS=1, PROFILER_SAMPLE_RATE=0.0)
+    def test_requisicoes_fora_da_amostra_nao_sao_perfiladas(self):
+        """Testa que o amostrador só é iniciado para a fração amostrada das requisições."""
+        with mock.patch.object(sampler, 'start') as start:
+            self.client.get(self.url)
+            self.assertFalse(start.called)
+            self.client.get(self.url, HTTP_X_PROFILE_TOKEN='token-de-profiling')
+            self.assertTrue(start.called)
+        self.assertEqual(RequestProfile.objects.get().motivo, RequestProfile.TOKEN)
+
+    def test_sampler_coleta_pilhas(self):
+        """Testa que o amostrador registra a pilha da thread perfilada."""
+        def ocupado():
+            fim = time.monotonic() + 0.05
+            while time.monotonic() < fim:
+                pass
+
+        thread_id = threading.get_ident()
+        sampler.start(thread_id)
+        try:
+            ocupado()
+        finally:
+            stacks = sampler.stop(thread_id)
+
+        self.assertTrue(stacks)
+        pilha, _ = stacks.most_common(1)[0]
+        self.assertTrue(pilha.split(';')[-1].startswith('ocupado ('))
+        self.assertIn('test_sampler_coleta_pilhas (', pilha)
+
+    def test_endpoint_apenas_para_administradores(self):
+        """Testa a listagem e o download dos perfis."""
+        self.client.get(self.url, HTTP_X_PROFILE_TOKEN='token-de-profiling')
+        profile = RequestProfile.objects.get()
+        profile.stacks = 'main (app.py:1);listar (views.py:10) 3'
+        profile.save()
+
+        response = self.client.get(reverse('profile-list'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('profile-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], profile.id)
+        self.assertNotIn('stacks', response.data['results'][0])
+
+        response = self.client.get(reverse('profile-detail', kwargs={'pk': profile.id}))
+        self.assertEqual(response.data['total_queries'], len(response.data['queries']))
+
+        response = self.client.get(reverse('profile-download', kwargs={'pk': profile.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'main (app.py:1);listar (views.py:10) 3')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    @override_settings(PROFILER_MAX_PER_MINUTE=2)
+    def test_cota_de_perfis_por_minuto(self):
+        """Testa que os perfis acima da cota do minuto são descartados."""
+        for _ in range(4):
+            response = self.client.get(self.url, HTTP_X_PROFILE_TOKEN='token-de-profiling')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_remocao_dos_perfis_expirados(self):
+        """Testa que o comando remove em lotes apenas os perfis expirados."""
+        for _ in range(3):
+            self.client.get(self.url, HTTP_X_PROFILE_TOKEN='token-de-profiling')
+        recente = RequestProfile.objects.latest('id')
+        RequestProfile.objects.exclude(pk=recente.pk).update(
+            created=timezone.now() - timedelta(days=settings.PROFILER_RETENTION_DAYS + 1)
+        )
+
+        out = StringIO()
+        call_command('prune_request_profiles', '--batch-size', '1', stdout=out)
+
+        self.assertIn('2 perfis removidos', out.getvalue())
+        self.assertEqual(list(RequestProfile.objects.values_list('pk', flat=True)), [recente.pk])
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'read': '2/min', 'write': '2/min', 'search': '1/min', 'export': '1/hour'},
+})
+class TokenBucketThrottleTest(APITestCase):
+    """Testes para a limitação de taxa por token bucket."""
+
+    def setUp(self):
+        """Configuração inicial para os testes."""
+        TokenBucketThrottle.store.clear()
+        self.addCleanup(TokenBucketThrottle.store.clear)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        VeiculoViewSet.permission_classes = [AllowAny]
+        self.url = reverse('veiculo-list')
+
+    def test_excede_limite_com_retry_after(self):
+        """Testa que o limite retorna 429 com o cabeçalho Retry-After."""
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_buckets_por_escopo_endpoint_e_usuario(self):
+        """Testa que busca, outros endpoints e outros usuários têm buckets próprios."""
+        for _ in range(2):
+            self.client.get(self.url)
+
+        self.assertEqual(self.client.get(self.url, {'search': 'ford'}).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.client.get(self.url, {'search': 'ford'}).status_code,
+            status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(self.client.get(reverse('veiculo-changes')).status_code, status.HTTP_200_OK)
+
+        outro = User.objects.create_user(username='outro', password='testpass123')
+        self.client.force_authenticate(user=outro)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_bucket_reabastece_com_o_tempo(self):
+        """Testa o reabastecimento proporcional ao tempo decorrido."""
+        store = LocalBucketStore()
+        self.assertEqual(store.consume('k', 2, 1.0, 0), 0)
+        self.assertEqual(store.consume('k', 2, 1.0, 0), 0)
+        self.assertEqual(store.consume('k', 2, 1.0, 0), 1.0)
+        self.assertEqual(store.consume('k', 2, 1.0, 0.5), 0.5)
+        self.assertEqual(store.consume('k', 2, 1.0, 1.0), 0)
+
+    def test_agregacao_entre_workers_via_cache(self):
+        """Testa que o consumo somado dos workers é comparado ao limite."""
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        }):
+            worker_a = CacheBucketSync('default', interval=0)
+            worker_b = CacheBucketSync('default', interval=0)
+
+            self.assertFalse(worker_a.record('k', 2, 60, 1.0))
+            self.assertFalse(worker_b.record('k', 2, 60, 1.0))
+            self.assertTrue(worker_a.record('k', 2, 60, 1.0))
+
+    def test_acumulador_descarta_chaves_enviadas_e_ociosas(self):
+        """Testa que o acumulador não cresce e envia o consumo de chaves ociosas."""
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        }):
+            sync = CacheBucketSync('default', interval=1.0)
+            for i in range(100):
+                sync.record(f'k{i}', 10, 60, 1.0)
+            self.assertEqual(len(sync._pending), 100)
+
+            sync.record('outra', 10, 60, 2.5)
+            self.assertEqual(list(sync._pending), ['outra'])
+            window = int(time.time() // 60)
+            self.assertEqual(sync.cache.get(f'throttle:k0:{window}'), 1)
+
+            sync.record('outra', 10, 60, 3.6)
+            self.assertEqual(sync._pending, {})
+            self.assertEqual(sync.cache.get(f'throttle:outra:{window}'), 2)
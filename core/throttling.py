@@ -0,0 +1,206 @@
+"""
+Limitação de taxa por token bucket para a API.
+
+Cada combinação de usuário, escopo (read, write, search, export) e endpoint
+tem seu próprio bucket, mantido em memória no processo. Opcionalmente, o
+consumo é agregado entre workers por meio do cache configurado em
+``THROTTLE_CACHE_ALIAS``, sincronizado em intervalos para não pagar uma ida
+ao cache por requisição.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Converte ``'60/min'`` em ``(60, 60)`` (requisições, segundos)."""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class LocalBucketStore:
+    """
+    Buckets mantidos em memória, protegidos por um único lock.
+
+    Cada bucket é a tupla ``(tokens, atualizado_em)``. Buckets que já
+    voltaram a ficar cheios são descartados quando o dicionário cresce além
+    de ``max_keys``.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now):
+        """
+        Consome um token do bucket.
+
+        Retorna ``0`` se a requisição foi permitida ou os segundos até haver
+        um token disponível.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+            else:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def drain(self, key, now):
+        """Esvazia o bucket, bloqueando a chave até ele voltar a encher."""
+        with self._lock:
+            self._buckets[key] = (0, now)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def _prune(self, now):
+        # Um bucket parado há mais de 1 hora certamente está cheio para as
+        # taxas usuais; descartá-lo equivale a recriá-lo cheio.
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < 3600
+        }
+
+
+class CacheBucketSync:
+    """
+    Agrega o consumo dos workers em janelas fixas no cache compartilhado.
+
+    Cada worker acumula localmente as requisições permitidas e as envia ao
+    cache a cada ``interval`` segundos. Se o total da janela exceder o limite,
+    o bucket local é esvaziado. Chaves enviadas ou sem requisições há mais de
+    um intervalo deixam o acumulador, que guarda apenas as chaves ativas.
+    """
+
+    def __init__(self, alias, interval=1.0):
+        self.cache = caches[alias]
+        self.interval = interval
+        self._pending = {}
+        self._last_sweep = 0
+        self._lock = threading.Lock()
+
+    def record(self, key, num_requests, duration, now):
+        """Registra uma requisição; retorna ``True`` se o limite global foi excedido."""
+        with self._lock:
+            count, last_sync, _ = self._pending.pop(key, (0, now, duration))
+            count += 1
+            if now - last_sync < self.interval:
+                self._pending[key] = (count, last_sync, duration)
+                count = 0
+            idle = self._pop_idle(now)
+
+        for idle_key, (idle_count, _, idle_duration) in idle.items():
+            self._push(idle_key, idle_count, idle_duration)
+        if not count:
+            return False
+        return self._push(key, count, duration) > num_requests
+
+    def _pop_idle(self, now):
+        # Retira as chaves paradas há mais de um intervalo; o consumo ainda
+        # pendente delas é enviado pelo chamador, fora do lock.
+        if now - self._last_sweep < self.interval:
+            return {}
+        self._last_sweep = now
+        idle = {
+            key: entry for key, entry in self._pending.items()
+            if now - entry[1] >= self.interval
+        }
+        for key in idle:
+            del self._pending[key]
+        return idle
+
+    def _push(self, key, count, duration):
+        """Soma ``count`` à janela atual da chave no cache e retorna o total."""
+        window = int(time.time() // duration)
+        cache_key = f'throttle:{key}:{window}'
+        self.cache.add(cache_key, 0, timeout=int(duration) * 2)
+        try:
+            return self.cache.incr(cache_key, count)
+        except ValueError:
+            # A chave expirou entre o add() e o incr().
+            self.cache.add(cache_key, count, timeout=int(duration) * 2)
+            return count
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle por token bucket com escopos e limites por endpoint.
+
+    O escopo é definido, em ordem, por ``throttle_scopes[action]`` ou
+    ``throttle_scope`` da view, pelo método (``write`` para escrita) ou pela
+    presença do parâmetro de busca (``search``); caso contrário é ``read``.
+    As taxas vêm de ``DEFAULT_THROTTLE_RATES`` no formato do DRF
+    (ex.: ``'60/min'``), usado também como capacidade de rajada.
+    """
+
+    store = LocalBucketStore()
+    sync = None
+
+    def __init__(self):
+        self._wait = 0
+        if TokenBucketThrottle.sync is None and settings.THROTTLE_CACHE_ALIAS:
+            TokenBucketThrottle.sync = CacheBucketSync(
+                settings.THROTTLE_CACHE_ALIAS, settings.THROTTLE_CACHE_SYNC_INTERVAL
+            )
+
+    def get_scope(self, request, view):
+        action = getattr(view, 'action', None)
+        scope = getattr(view, 'throttle_scopes', {}).get(action)
+        if scope is None:
+            scope = getattr(view, 'throttle_scope', None)
+        if scope is not None:
+            return scope
+
+        if request.method not in SAFE_METHODS:
+            return 'write'
+        if request.query_params.get(api_settings.SEARCH_PARAM):
+            return 'search'
+        return 'read'
+
+    def get_endpoint(self, request, view):
+        action = getattr(view, 'action', None) or request.method.lower()
+        return f'{view.__class__.__name__}.{action}'
+
+    def get_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'anon:{super().get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        num_requests, duration = parse_rate(rate)
+        key = f'{scope}:{self.get_endpoint(request, view)}:{self.get_ident(request)}'
+        now = time.monotonic()
+
+        self._wait = self.store.consume(key, num_requests, num_requests / duration, now)
+        if self._wait:
+            return False
+
+        if self.sync is not None and self.sync.record(key, num_requests, duration, now):
+            self.store.drain(key, now)
+        return True
+
+    def wait(self):
+        return self._wait
@@ -1,18 +1,121 @@
 import logging
+from datetime import datetime, time, timedelta
 
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, DateField
+from django.db.models.functions import Trunc
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.permissions import DjangoModelPermissions
-from rest_framework import viewsets, filters
-from rest_framework_tracking.mixins import LoggingMixin
+from rest_framework.permissions import SAFE_METHODS, DjangoModelPermissions, IsAdminUser, IsAuthenticated
+from rest_framework import mixins, status, viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .models import Veiculo, Marca
-from .serializers import VeiculoSerializer, MarcaSerializer
+from .autocomplete import indice as autocomplete_index
+from .batch import BatchLoggingMixin, run_batch
+from .changes import changes_since
+from .facets import compute_facets, parse_facets
+from .filters import AliasOrderingFilter, VeiculoFilter
+from .jobs import export_path
+from .models import Job, RequestProfile, Veiculo, Marca
+from .serializers import (
+    BatchSerializer, JobSerializer, MarcaSerializer, RequestProfileDetailSerializer,
+    RequestProfileSerializer, VeiculoSerializer,
+)
 
 logger = logging.getLogger(__name__)
 
 
-class MarcaViewSet(LoggingMixin, viewsets.ModelViewSet):
+class SparseQuerysetMixin:
+    """
+    Restringe os campos das respostas de leitura com ``?fields=`` e ``?exclude=``.
+
+    Além de reduzir o payload, a seleção é aplicada ao queryset com
+    ``only()``, de modo que o SELECT busca apenas as colunas necessárias.
+    """
+
+    def get_sparse_fields(self):
+        """Retorna os campos solicitados ou ``None`` se não houver restrição."""
+        if hasattr(self, '_sparse_fields'):
+            return self._sparse_fields
+
+        self._sparse_fields = None
+        if getattr(self, 'swagger_fake_view', False) or self.request.method not in SAFE_METHODS:
+            return None
+
+        fields = self.request.query_params.get('fields')
+        exclude = self.request.query_params.get('exclude')
+        if not fields and not exclude:
+            return None
+
+        disponiveis = list(self.get_serializer_class()().fields)
+        solicitados = [f.strip() for f in fields.split(',') if f.strip()] if fields else disponiveis
+        excluidos = [f.strip() for f in exclude.split(',') if f.strip()] if exclude else []
+
+        invalidos = sorted((set(solicitados) | set(excluidos)) - set(disponiveis))
+        if invalidos:
+            raise ValidationError({
+                'fields': f"Campos inválidos: {', '.join(invalidos)}. "
+                          f"Disponíveis: {', '.join(disponiveis)}"
+            })
+
+        self._sparse_fields = [
+            f for f in disponiveis if f in solicitados and f not in excluidos
+        ]
+        return self._sparse_fields
+
+    def get_sparse_columns(self, fields):
+        """
+        Converte os campos do serializer nos caminhos do ORM para ``only()``.
+
+        Retorna ``None`` quando algum campo não corresponde a uma coluna, caso
+        em que o queryset não pode ser restringido com segurança.
+        """
+        model = self.get_serializer_class().Meta.model
+        serializer_fields = self.get_serializer_class()().fields
+        colunas = {model._meta.pk.name}
+
+        for nome in fields:
+            source_attrs = serializer_fields[nome].source.split('.')
+            if source_attrs == ['*']:
+                return None
+            try:
+                model._meta.get_field(source_attrs[0])
+            except FieldDoesNotExist:
+                return None
+            colunas.add('__'.join(source_attrs))
+
+        return colunas
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+
+        colunas = self.get_sparse_columns(fields)
+        if colunas is None:
+            return queryset
+
+        relacionados = {c.split('__')[0] for c in colunas if '__' in c}
+        if relacionados:
+            queryset = queryset.select_related(*relacionados)
+        return queryset.only(*colunas)
+
+
+class MarcaViewSet(BatchLoggingMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciar marcas de veículos.
     
@@ -21,6 +124,7 @@ class MarcaViewSet(LoggingMixin, viewsets.ModelViewSet):
     - Criação de novas marcas
     - Atualização de marcas existentes
     - Exclusão lógica (desativação)
+    - Seleção de campos com ?fields= e ?exclude=
     """
     queryset = Marca.objects.all()
     serializer_class = MarcaSerializer
@@ -31,7 +135,7 @@ class MarcaViewSet(LoggingMixin, viewsets.ModelViewSet):
     ordering_fields = ['nome', 'created_at']
     
 
-class VeiculoViewSet(LoggingMixin, viewsets.ModelViewSet):
+class VeiculoViewSet(BatchLoggingMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciar veículos.
     
@@ -41,12 +145,316 @@ class VeiculoViewSet(LoggingMixin, viewsets.ModelViewSet):
     - Atualização completa e parcial
     - Exclusão com validação de negócio
     - Estatísticas e relatórios
+    - Seleção de campos com ?fields= e ?exclude=
+    - Contagens por faceta com ?facets=
+    - Feed incremental de alterações para sincronização
+    - Autocompletar nomes de veículos por prefixo
+    - Filtros por período de cadastro e contagens por dia ou semana
+    - Listagem pelo snapshot em memória do inventário (INVENTORY_SNAPSHOT_ENABLED)
     """
     queryset = Veiculo.objects.filter(excluido=False)
     serializer_class = VeiculoSerializer
     permission_classes = [DjangoModelPermissions]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['veiculo', 'vendido', 'excluido']
-    search_fields = ['veiculo', 'marca__nome', 'cor', 'descricao', 'ano', 'vendido']
-    ordering_fields = ['ano', 'created', 'marca__nome', 'veiculo']
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, AliasOrderingFilter]
+    filterset_class = VeiculoFilter
+    search_fields = ['veiculo', 'marca_nome', 'cor', 'descricao', 'ano', 'vendido']
+    ordering_fields = ['ano', 'created', 'marca_nome', 'marca__nome', 'veiculo']
+    ordering_aliases = {'marca__nome': 'marca_nome'}
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lista veículos; com ``?facets=marca,decada,vendido,cor`` inclui as
+        contagens de cada faceta para os mesmos filtros e busca.
+        """
+        facets = request.query_params.get('facets')
+        if facets:
+            try:
+                facets = parse_facets(facets)
+            except ValueError as exc:
+                raise ValidationError({'facets': str(exc)})
+
+        if settings.INVENTORY_SNAPSHOT_ENABLED:
+            response = self.list_from_snapshot(request, facets)
+            if response is not None:
+                return response
+
+        response = super().list(request, *args, **kwargs)
+
+        if facets:
+            response.data['facets'] = compute_facets(
+                self.filter_queryset(self.get_queryset()), facets
+            )
+        return response
+
+    def list_from_snapshot(self, request, facets):
+        """
+        Responde a listagem pelo snapshot em memória do inventário.
+
+        Retorna ``None`` quando os parâmetros não são suportados, quando o
+        snapshot ainda não foi carregado ou quando a página aponta veículos
+        que não existem mais ou não atendem mais aos filtros.
+        """
+        # Importado apenas com o snapshot ativo: o módulo depende do NumPy.
+        from .snapshot import LazyResults, inventario, parse_filters
+
+        filtros = parse_filters(request.query_params)
+        if filtros is None:
+            return None
+
+        consulta = inventario.filter(filtros)
+        if consulta is None:
+            return None
+        # A página é lida com os filtros aplicados: veículos alterados desde a
+        # última atualização do snapshot não entram nela.
+        resultados = LazyResults(consulta, self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(resultados)
+        if resultados.faltando:
+            inventario.reconcile(resultados.faltando, self.get_queryset())
+            return None
+
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        if facets:
+            response.data['facets'] = consulta.facetas(facets)
+        return response
+
+    AUTOCOMPLETE_DEFAULT_LIMIT = 10
+    AUTOCOMPLETE_MAX_LIMIT = 50
+
+    def should_log(self, request, response):
+        # O autocompletar é chamado a cada tecla; não grava no log.
+        return self.action != 'autocomplete' and super().should_log(request, response)
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Sugere nomes de veículos que começam com ``?q=``.
+
+        Retorna até ``?limit=`` nomes distintos com a quantidade de veículos
+        de cada um, opcionalmente restritos à marca ``?marca=<id>``.
+        """
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            raise ValidationError({'q': 'Informe o prefixo a completar.'})
+
+        try:
+            limit = int(request.query_params.get('limit', self.AUTOCOMPLETE_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Informe um número inteiro.'})
+        limit = max(1, min(limit, self.AUTOCOMPLETE_MAX_LIMIT))
+
+        marca = request.query_params.get('marca')
+        if marca is not None:
+            try:
+                marca = int(marca)
+            except ValueError:
+                raise ValidationError({'marca': 'Informe o id da marca.'})
+
+        return Response({'results': autocomplete_index.complete(q, marca, limit)})
+
+    REGISTROS_INTERVALOS = {'dia': ('day', timedelta(days=1)), 'semana': ('week', timedelta(weeks=1))}
+    REGISTROS_MAX_BUCKETS = 400
+
+    @action(detail=False, methods=['get'])
+    def registros(self, request):
+        """
+        Conta os veículos cadastrados por dia ou semana entre ``?inicio=`` e ``?fim=``.
+
+        As datas são inclusivas (``AAAA-MM-DD``, padrão: últimos 30 dias) e
+        ``?intervalo=dia|semana`` define o agrupamento; semanas começam na
+        segunda-feira. Períodos sem cadastros aparecem com total zero e os
+        demais filtros da listagem são respeitados.
+        """
+        intervalo = request.query_params.get('intervalo', 'dia')
+        if intervalo not in self.REGISTROS_INTERVALOS:
+            raise ValidationError({'intervalo': 'Use dia ou semana.'})
+        kind, passo = self.REGISTROS_INTERVALOS[intervalo]
+
+        hoje = timezone.localdate()
+        datas = {}
+        for nome, padrao in [('inicio', hoje - timedelta(days=29)), ('fim', hoje)]:
+            valor = request.query_params.get(nome)
+            datas[nome] = parse_date(valor) if valor else padrao
+            if datas[nome] is None:
+                raise ValidationError({nome: 'Informe a data no formato AAAA-MM-DD.'})
+
+        inicio, fim = datas['inicio'], datas['fim']
+        if intervalo == 'semana':
+            inicio -= timedelta(days=inicio.weekday())
+        if fim < inicio:
+            raise ValidationError({'fim': 'A data final deve ser posterior à inicial.'})
+        if (fim - inicio) // passo + 1 > self.REGISTROS_MAX_BUCKETS:
+            raise ValidationError({'fim': f'O período pode ter no máximo {self.REGISTROS_MAX_BUCKETS} intervalos.'})
+
+        tz = timezone.get_current_timezone()
+        limite_inicio = datetime.combine(inicio, time.min, tzinfo=tz)
+        limite_fim = datetime.combine(fim + timedelta(days=1), time.min, tzinfo=tz)
+        totais = dict(
+            self.filter_queryset(self.get_queryset())
+            .filter(created__gte=limite_inicio, created__lt=limite_fim)
+            .annotate(periodo=Trunc('created', kind, output_field=DateField()))
+            .values('periodo')
+            .annotate(total=Count('id'))
+            .order_by()
+            .values_list('periodo', 'total')
+        )
+
+        results = []
+        periodo = inicio
+        while periodo <= fim:
+            results.append({'periodo': periodo, 'total': totais.get(periodo, 0)})
+            periodo += passo
+
+        return Response({'intervalo': intervalo, 'inicio': inicio, 'fim': fim, 'results': results})
+
+    CHANGES_DEFAULT_LIMIT = 100
+    CHANGES_MAX_LIMIT = 1000
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Lista veículos criados, alterados ou excluídos após ``?cursor=``.
+
+        Os resultados seguem a ordem ``(updated, id)`` e incluem os veículos
+        com ``excluido=True``. O ``next_cursor`` devolvido deve ser enviado na
+        próxima chamada para retomar a sincronização. Alterações dos últimos
+        ``CHANGES_SAFETY_LAG_SECONDS`` segundos aparecem na chamada seguinte.
+        """
+        try:
+            limit = int(request.query_params.get('limit', self.CHANGES_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Informe um número inteiro.'})
+        limit = max(1, min(limit, self.CHANGES_MAX_LIMIT))
+
+        # O serializer lê o nome desnormalizado; não há junção com a marca.
+        queryset = Veiculo.objects.all()
+        try:
+            veiculos, next_cursor, has_more = changes_since(
+                request.query_params.get('cursor'), limit, queryset
+            )
+        except ValueError as exc:
+            raise ValidationError({'cursor': str(exc)})
+
+        serializer = self.get_serializer(veiculos, many=True)
+        return Response({
+            'results': serializer.data,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        })
+
+
+class JobViewSet(BatchLoggingMixin,
+                 mixins.CreateModelMixin,
+                 mixins.RetrieveModelMixin,
+                 mixins.ListModelMixin,
+                 viewsets.GenericViewSet):
+    """
+    ViewSet para tarefas pesadas executadas em segundo plano.
+
+    Permite:
+    - Submeter tarefas (exportação, estatísticas, importação)
+    - Acompanhar o status das tarefas do usuário
+    - Obter o resultado de tarefas concluídas
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['tipo', 'status']
+    ordering_fields = ['created']
+    ordering = ['-created']
+    # Importações podem ter payloads grandes; não são gravados no log.
+    sensitive_fields = {'payload'}
+    throttle_scopes = {'create': 'export'}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_superuser:
+            return queryset
+        return queryset.filter(usuario=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(usuario=self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def resultado(self, request, pk=None):
+        """Retorna o resultado da tarefa ou o arquivo gerado por ela."""
+        job = self.get_object()
+        if job.status != Job.CONCLUIDO:
+            return Response(
+                {'detail': f"A tarefa está com status '{job.status}'.", 'status': job.status},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if job.resultado and 'arquivo' in job.resultado:
+            try:
+                arquivo = open(export_path(job), 'rb')
+            except FileNotFoundError:
+                return Response(
+                    {'detail': "O arquivo gerado pela tarefa não está mais disponível."},
+                    status=status.HTTP_410_GONE,
+                )
+            return FileResponse(arquivo, as_attachment=True, filename=job.resultado['arquivo'])
+
+        return Response(job.resultado)
+
+
+class RequestProfileViewSet(mixins.ListModelMixin,
+                            mixins.RetrieveModelMixin,
+                            mixins.DestroyModelMixin,
+                            viewsets.GenericViewSet):
+    """
+    ViewSet para os perfis gravados pelo ProfilingMiddleware (apenas administradores).
+
+    Permite:
+    - Listar os perfis com duração, consultas e motivo
+    - Consultar as consultas SQL registradas de um perfil
+    - Baixar as pilhas no formato collapsed para gerar o flamegraph
+    """
+    queryset = RequestProfile.objects.select_related('usuario')
+    serializer_class = RequestProfileSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['path', 'method', 'motivo', 'status_code']
+    ordering_fields = ['created', 'duracao_ms', 'tempo_queries_ms']
+    ordering = ['-created']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Evita carregar as pilhas e consultas de todos os perfis.
+            return queryset.defer('stacks', 'queries')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return RequestProfileDetailSerializer
+        return super().get_serializer_class()
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Baixa as pilhas amostradas (flamegraph.pl, speedscope)."""
+        profile = self.get_object()
+        response = HttpResponse(profile.stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.id}.folded"'
+        return response
+
+
+class BatchView(APIView):
+    """
+    Executa várias requisições da API em uma única chamada.
+
+    Recebe ``{"requests": [{"method": "GET", "url": "/api/veiculo/1/"}, ...]}``
+    e retorna ``{"responses": [{"status": 200, "headers": {...}, "body": ...}]}``
+    na mesma ordem. A autenticação é feita uma única vez; permissões e
+    limites de taxa continuam sendo aplicados por sub-requisição. As escritas
+    não são atômicas entre si: cada uma é confirmada ao terminar.
+    """
+    permission_classes = [IsAuthenticated]
+    # Cada sub-requisição consome seu próprio limite de taxa.
+    throttle_scope = 'read'
 
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'responses': run_batch(request, serializer.validated_data['requests'])})